@@ -1,7 +1,7 @@
 # app.py
 import os
 from flask import Flask
-from database import init_db
+from database import init_db, init_db_pool
  
 # 引用原本的路由
 from routes import menu_bp, kitchen_bp, admin_bp, delivery_bp
@@ -23,10 +23,16 @@ def create_app():
     # 在正式上線環境 (Render) 建議在環境變數設定 SECRET_KEY
     app.secret_key = os.environ.get("SECRET_KEY", "dev_secret_key_change_this_123")
 
+    # JSON 回應直接輸出 UTF-8 中文 (每字 3 bytes)，不轉成 6 bytes 的 \uXXXX，縮小看板輪詢等 API 的傳輸量
+    app.json.ensure_ascii = False
+
     # 1. 初始化資料庫 (確保啟動時資料表都已建立)
     with app.app_context():
         init_db()
 
+    # 註冊連線池：每個請求結束時自動歸還未關閉的資料庫連線
+    init_db_pool(app)
+
     # 2. 註冊路由藍圖 (Blueprints)
     
     # 前台點餐 (根目錄 /)
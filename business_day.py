@@ -0,0 +1,88 @@
+"""
+台灣營業日 (UTC+8) 的時間範圍
+
+orders.created_at 存的是 UTC 時間 (不含時區)，所有依日期篩選訂單的查詢都要經過這裡換算，
+並一律使用半開區間：
+
+    created_at >= start AND created_at < end
+
+這種寫法可以直接使用 created_at 上的索引；
+請不要再用 DATE(created_at)、created_at + interval 或 23:59:59.999999 這類寫法。
+"""
+from datetime import datetime, date, timedelta
+
+TW_OFFSET = timedelta(hours=8)
+ONE_DAY = timedelta(days=1)
+ONE_MINUTE = timedelta(minutes=1)
+
+
+def range_sql(column='created_at'):
+    """半開區間的 SQL 條件 (參數依序為 start, end)；有表別名時傳入例如 'o.created_at'"""
+    return f"{column} >= %s AND {column} < %s"
+
+
+def tw_now():
+    """目前的台灣時間 (不含時區)"""
+    return datetime.utcnow() + TW_OFFSET
+
+
+def tw_today():
+    """目前的台灣營業日"""
+    return tw_now().date()
+
+
+def to_tw(utc_dt):
+    """資料庫的 UTC 時間 -> 台灣時間"""
+    return utc_dt + TW_OFFSET
+
+
+def _to_date(day):
+    if isinstance(day, datetime):
+        return day.date()
+    if isinstance(day, date):
+        return day
+    return datetime.strptime(str(day).strip(), '%Y-%m-%d').date()
+
+
+def day_range(day=None):
+    """某一個營業日 (date 或 'YYYY-MM-DD'，預設今天) -> UTC 半開區間 (start, end)"""
+    d = _to_date(day) if day else tw_today()
+    utc_start = datetime.combine(d, datetime.min.time()) - TW_OFFSET
+    return utc_start, utc_start + ONE_DAY
+
+
+def days_range(start_day, end_day):
+    """start_day ~ end_day (兩端都包含的營業日) -> UTC 半開區間"""
+    utc_start, _ = day_range(start_day)
+    _, utc_end = day_range(end_day)
+    return utc_start, utc_end
+
+
+def parse_range(start_str=None, end_str=None):
+    """
+    解析前端傳來的起訖時間 (台灣時間) -> UTC 半開區間
+        'YYYY-MM-DD'        當天 00:00 起 / 當天整天為止
+        'YYYY-MM-DDTHH:MM'  指定到分鐘；結束時間包含該分鐘整分鐘
+        未指定結束時間       與開始時間同一天的整天
+    格式錯誤時回傳今天整天。
+    """
+    try:
+        if start_str and 'T' in start_str:
+            tw_start = datetime.strptime(start_str, '%Y-%m-%dT%H:%M')
+        elif start_str:
+            tw_start = datetime.strptime(start_str, '%Y-%m-%d')
+        else:
+            tw_start = datetime.combine(tw_today(), datetime.min.time())
+
+        if end_str and 'T' in end_str:
+            tw_end = datetime.strptime(end_str, '%Y-%m-%dT%H:%M') + ONE_MINUTE
+        elif end_str:
+            tw_end = datetime.strptime(end_str, '%Y-%m-%d') + ONE_DAY
+        else:
+            tw_end = datetime.combine(tw_start.date(), datetime.min.time()) + ONE_DAY
+
+        return tw_start - TW_OFFSET, tw_end - TW_OFFSET
+
+    except Exception as e:
+        print(f"Time Range Error: {e}")
+        return day_range()
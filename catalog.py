@@ -0,0 +1,156 @@
+"""
+商品目錄 (products 表) 的記憶體快照
+
+菜單頁、下單成功頁、出單都從這裡讀商品資料，每個 worker 只在第一次使用或
+後台修改商品後才查一次資料庫。快照建立後不會再被修改 (請勿改動取得的 list / dict)，
+version 是商品資料的內容雜湊：內容有變就不同 (各 worker 算出的值一致，TTL 重新載入但內容沒變時不變)，
+可用來當作衍生快取的 key。
+
+後台修改商品時，在同一個交易內呼叫 notify_catalog_changed(cur)，commit 後再呼叫 invalidate()。
+"""
+import os
+import time
+import hashlib
+
+import db_events
+from database import db_connection
+
+CHANNEL = 'catalog_changed'
+CATALOG_CACHE_TTL = float(os.environ.get("CATALOG_CACHE_TTL", "300"))                 # LISTEN 正常時的保險過期秒數
+CATALOG_CACHE_FALLBACK_TTL = float(os.environ.get("CATALOG_CACHE_FALLBACK_TTL", "5"))  # 收不到通知時的過期秒數
+
+LANGS = ('zh', 'en', 'jp', 'kr')
+
+
+def _split_menu_opts(opt_str, fallback_str=None):
+    """菜單用：與前端原本的解析方式一致 (不去空白)"""
+    if opt_str: return opt_str.split(',')
+    if fallback_str: return fallback_str.split(',')
+    return []
+
+
+def _split_opts(opt_str):
+    """翻譯用：去空白並移除空項目"""
+    if not opt_str: return []
+    return [o.strip() for o in opt_str.split(',') if o.strip()]
+
+
+class CatalogSnapshot:
+    """某一版本的商品目錄 (唯讀)"""
+
+    def __init__(self, rows, version=None):
+        self.version = version if version is not None else content_version(rows)
+        self.loaded_at = time.time()
+
+        menu_items = []
+        option_lists = {}
+        print_categories = {}
+        prices = {}
+        for p in rows:
+            menu_items.append({
+                'id': p[0],
+                'name_zh': p[1],
+                'name_en': p[8] or p[1],
+                'name_jp': p[9] or p[1],
+                'name_kr': p[10] or p[1],
+                'price': p[2],
+                'category_zh': p[3],
+                'category_en': p[15] or p[3],
+                'category_jp': p[16] or p[3],
+                'category_kr': p[17] or p[3],
+                'image_url': p[4] or '',
+                'is_available': p[5],
+                'custom_options_zh': _split_menu_opts(p[6]),
+                'custom_options_en': _split_menu_opts(p[11], p[6]),
+                'custom_options_jp': _split_menu_opts(p[12], p[6]),
+                'custom_options_kr': _split_menu_opts(p[13], p[6]),
+                'print_category': p[14] or 'Noodle'
+            })
+            # 以中文品名為 key (訂單 content_json 內記錄的是 name_zh)
+            option_lists[p[1]] = {
+                'zh': _split_opts(p[6]),
+                'en': _split_opts(p[11]),
+                'jp': _split_opts(p[12]),
+                'kr': _split_opts(p[13])
+            }
+            print_categories[p[1]] = p[14] or 'Other'
+            prices[p[1]] = p[2]
+
+        self.menu_items = tuple(menu_items)      # 菜單頁使用 (依 sort_order 排序)
+        self.option_lists = option_lists        # 品名 -> 各語系選項清單
+        self.print_categories = print_categories  # 品名 -> 出單分類
+        self.prices = prices                    # 品名 -> 原價
+        self.option_translations = _build_option_translations(option_lists)
+
+    def print_category(self, product_name):
+        """出單分類，找不到商品時歸類為 Other"""
+        return self.print_categories.get(product_name, 'Other')
+
+    def translate_option(self, product_name, option_text, lang):
+        """把任一語系的選項文字翻成 lang (查表一次)，找不到對應時原樣回傳"""
+        return self.option_translations.get((product_name, option_text, lang), option_text)
+
+
+def content_version(rows):
+    """商品資料的內容雜湊 (16 個十六進位字元)"""
+    return hashlib.blake2b(repr(rows).encode('utf-8'), digest_size=8).hexdigest()
+
+
+def _build_option_translations(option_lists):
+    """
+    預先算好 (品名, 選項文字, 目標語系) -> 翻譯結果。
+    選項文字依 zh -> en -> jp -> kr 的順序找第一個出現的位置當作標準索引，
+    再取目標語系同一位置的文字 (目標語系沒有該位置時不建表，維持原文)。
+    """
+    translations = {}
+    for name, lists in option_lists.items():
+        canonical = {}
+        for l in LANGS:
+            for idx, opt in enumerate(lists[l]):
+                canonical.setdefault(opt, idx)
+        for opt, idx in canonical.items():
+            for target in LANGS:
+                target_list = lists[target]
+                if idx < len(target_list):
+                    translations[(name, opt, target)] = target_list[idx]
+    return translations
+
+
+def _load(generation):
+    # generation 只用來判斷載入途中是否失效 (見 db_events.SnapshotCache)；version 用內容雜湊，
+    # 否則沒有 LISTEN 或過期重新載入時 version 不變，衍生快取會一直用舊的商品資料
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT id, name, price, category, image_url, is_available, custom_options, sort_order,
+                    name_en, name_jp, name_kr,
+                    custom_options_en, custom_options_jp, custom_options_kr,
+                    print_category,
+                    category_en, category_jp, category_kr
+            FROM products
+            ORDER BY sort_order ASC, id ASC
+        """)
+        rows = cur.fetchall()
+        cur.close()
+        conn.rollback()
+    return CatalogSnapshot(rows)
+
+
+_cache = db_events.SnapshotCache(
+    CHANNEL, _load, ttl=CATALOG_CACHE_TTL, fallback_ttl=CATALOG_CACHE_FALLBACK_TTL
+)
+
+
+def get_catalog():
+    """取得目前的商品目錄快照"""
+    return _cache.get()
+
+
+def invalidate(payload=None):
+    """讓本 worker 的快照失效 (修改商品的 worker 在 commit 後立即呼叫，不必等通知)"""
+    _cache.invalidate()
+
+
+def notify_catalog_changed(cur):
+    """在修改商品的交易內呼叫；commit 後所有 worker 的快照都會失效"""
+    _cache.notify(cur)
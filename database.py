@@ -1,210 +1,353 @@
 import os  # 匯入作業系統模組，用於讀取環境變數
+import time  # 用於計算連線等待時間與閒置時間
+import threading  # 用於連線池的執行緒鎖
+from business_day import day_range  # 台灣營業日 -> UTC 半開區間
+from contextlib import contextmanager  # 用於建立 with 語法的連線管理器
 import psycopg2  # 匯入 PostgreSQL 資料庫驅動模組
+import psycopg2.extensions
+import psycopg2.pool
 from urllib.parse import urlparse  # 匯入網址解析工具
-import bcrypt # 匯入 bcrypt 模組用於密碼雜湊 (需先安裝: pip install bcrypt)
+from flask import g, has_app_context, has_request_context, current_app, request
 
-# --- 資料庫基礎連線 --- 
+# ==========================================
+# 🔌 連線池設定 (可由環境變數調整)
+# ==========================================
+# ⚠️ gunicorn 每個 worker 各自擁有一個連線池，
+#    因此資料庫的總連線數上限 = worker 數量 x DB_POOL_MAX，請勿超過主機方案的 max_connections
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", "1"))              # 預先建立並保留的連線數
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", "10"))             # 單一 worker 最多同時借出的連線數
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))   # 連線全被借走時，最多等待幾秒
+DB_POOL_PING_AFTER = float(os.environ.get("DB_POOL_PING_AFTER", "30"))       # 閒置超過幾秒的連線，借出前先 SELECT 1 檢查
+DB_POOL_MAX_LIFETIME = float(os.environ.get("DB_POOL_MAX_LIFETIME", "1800"))  # 連線最長存活秒數，超過就換新的
+
+
+class PoolTimeoutError(psycopg2.pool.PoolError):
+    """在 DB_POOL_TIMEOUT 秒內借不到連線"""
+
+
+class ConnectionPool:
+    """
+    執行緒安全的 PostgreSQL 連線池。
+    - 借出時檢查閒置過久的連線 (SELECT 1)，自動汰換已斷線或過老的 socket
+    - 歸還時自動 rollback 未完成的交易並還原 autocommit
+    - 記錄借出次數、等待時間、逾時與汰換次數
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=10.0, ping_after=30.0, max_lifetime=1800.0):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.max_lifetime = max_lifetime
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)  # 控制同時借出的數量
+        self._idle = []        # 閒置連線: [(conn, 建立時間, 上次使用時間), ...]
+        self._born = {}        # id(conn) -> 建立時間
+        self._in_use = 0
+
+        # 統計數據
+        self._stats = {
+            'checkouts': 0,        # 總借出次數
+            'connects': 0,         # 實際建立新連線次數
+            'timeouts': 0,         # 等待逾時次數
+            'discarded': 0,        # 因斷線/過老/異常而汰換的連線數
+            'pings': 0,            # 借出前健康檢查次數
+            'wait_total_ms': 0.0,  # 累計等待時間
+            'wait_max_ms': 0.0,    # 最長單次等待時間
+        }
+
+        for _ in range(minconn):
+            conn = self._connect()
+            self._idle.append((conn, self._born[id(conn)], time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn)
+        self._born[id(conn)] = time.monotonic()
+        with self._lock:
+            self._stats['connects'] += 1
+        return conn
+
+    def _discard(self, conn):
+        self._born.pop(id(conn), None)
+        with self._lock:
+            self._stats['discarded'] += 1
+        try:
+            if not conn.closed:
+                conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn, born, last_used):
+        """判斷閒置連線是否還能用"""
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        if self.max_lifetime and now - born > self.max_lifetime:
+            return False
+        if now - last_used < self.ping_after:
+            return True
+        # 閒置太久 (雲端主機常會默默切斷 socket)，先打一發 SELECT 1 確認
+        with self._lock:
+            self._stats['pings'] += 1
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self):
+        """借出一條連線 (必要時等待，最多 timeout 秒)"""
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise PoolTimeoutError(f"資料庫連線池已滿 ({self.maxconn})，等待 {self.timeout} 秒仍借不到連線")
+
+        try:
+            conn = None
+            while conn is None:
+                with self._lock:
+                    item = self._idle.pop() if self._idle else None
+                if item is None:
+                    conn = self._connect()
+                elif self._is_healthy(*item):
+                    conn = item[0]
+                else:
+                    self._discard(item[0])
+        except Exception:
+            self._slots.release()
+            raise
+
+        waited_ms = (time.monotonic() - started) * 1000
+        with self._lock:
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            self._stats['wait_total_ms'] += waited_ms
+            self._stats['wait_max_ms'] = max(self._stats['wait_max_ms'], waited_ms)
+        return conn
+
+    def putconn(self, conn, discard=False):
+        """歸還連線；交易未結束會先 rollback，壞掉的連線直接汰換"""
+        try:
+            if not discard and not conn.closed:
+                status = conn.info.transaction_status
+                if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                    discard = True
+                elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if not discard and conn.autocommit:
+                    conn.autocommit = False
+        except Exception:
+            discard = True
+
+        if discard or conn.closed:
+            self._discard(conn)
+        else:
+            with self._lock:
+                self._idle.append((conn, self._born.get(id(conn), time.monotonic()), time.monotonic()))
+
+        with self._lock:
+            self._in_use -= 1
+        self._slots.release()
+
+    def closeall(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s['in_use'] = self._in_use
+            s['idle'] = len(self._idle)
+            s['max'] = self.maxconn
+        s['wait_avg_ms'] = round(s['wait_total_ms'] / s['checkouts'], 3) if s['checkouts'] else 0.0
+        s['wait_total_ms'] = round(s['wait_total_ms'], 3)
+        s['wait_max_ms'] = round(s['wait_max_ms'], 3)
+        return s
+
+
+class PooledConnection:
+    """
+    包裝從連線池借出的連線。
+    用法與 psycopg2 連線完全相同，唯一差別是 close() 會把連線「還給連線池」而不是真的斷線，
+    所以既有的 conn = get_db_connection() ... conn.close() 寫法不需要修改。
+    """
+
+    def __init__(self, pool, conn):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_conn', conn)
+
+    def __getattr__(self, name):
+        conn = object.__getattribute__(self, '_conn')
+        if conn is None:
+            raise psycopg2.InterfaceError("connection already returned to pool")
+        return getattr(conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    @property
+    def closed(self):
+        conn = object.__getattribute__(self, '_conn')
+        return 1 if conn is None else conn.closed
+
+    def close(self):
+        """歸還連線 (重複呼叫也沒關係)"""
+        conn = object.__getattribute__(self, '_conn')
+        if conn is None:
+            return
+        object.__setattr__(self, '_conn', None)
+        self._pool.putconn(conn)
+
+    # 與 psycopg2 相同：with conn: 代表一個交易 (commit / rollback)，不會關閉連線
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """取得本行程的連線池 (gunicorn fork 出的每個 worker 各建一個)"""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            # 從資料庫環境變數中取得 DATABASE_URL（包含資料庫主機、帳密等資訊）
+            db_uri = os.environ.get("DATABASE_URL")
+            if not db_uri:
+                # 如果找不到連線資訊，拋出錯誤訊息
+                raise ValueError("錯誤：找不到環境變數 DATABASE_URL")
+            # 💡 注意：fork 之後「不能」關閉父行程留下的連線 (會把父行程的 session 一起切斷)，直接丟棄參照即可
+            _pool = ConnectionPool(
+                db_uri,
+                minconn=DB_POOL_MIN,
+                maxconn=DB_POOL_MAX,
+                timeout=DB_POOL_TIMEOUT,
+                ping_after=DB_POOL_PING_AFTER,
+                max_lifetime=DB_POOL_MAX_LIFETIME,
+            )
+            _pool_pid = pid
+    return _pool
+
+
+# --- 資料庫基礎連線 ---
 def get_db_connection():
-    """建立並回傳資料庫連線物件"""
-    # 從作業系統環境變數中取得 DATABASE_URL（包含資料庫主機、帳密等資訊）
-    db_uri = os.environ.get("DATABASE_URL")
-    if not db_uri:
-        # 如果找不到連線資訊，拋出錯誤訊息
-        raise ValueError("錯誤：找不到環境變數 DATABASE_URL") 
-    # 使用 psycopg2 套件建立與 PostgreSQL 的連線
-    return psycopg2.connect(db_uri)
+    """從連線池借出一條連線 (呼叫 close() 即歸還)"""
+    pool = _get_pool()
+    conn = PooledConnection(pool, pool.getconn())
+
+    # 在 Flask 請求中借出的連線會被記錄下來，請求結束時若忘了 close() 會自動歸還
+    if has_app_context():
+        if '_db_conns' not in g:
+            g._db_conns = []
+            # 記下借出連線的路由；teardown 時請求已結束，讀不到 request
+            if has_request_context():
+                g._db_where = f"{request.method} {request.path} (endpoint={request.endpoint})"
+        g._db_conns.append(conn)
+    return conn
+
+
+@contextmanager
+def db_connection():
+    """with db_connection() as conn: ...  離開區塊時自動歸還連線"""
+    conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def release_request_connections(exc=None):
+    """Flask teardown：歸還本次請求中未 close() 的連線，避免連線池被借光"""
+    conns = g.pop('_db_conns', None)
+    if not conns:
+        return
+    leaked = [conn for conn in conns if not conn.closed]
+    if not leaked:
+        return
+    for conn in leaked:
+        conn.close()
+    # 記下是哪個路由忘了 close()，方便找出並修正
+    current_app.logger.warning("偵測到 %d 條未歸還的資料庫連線，已自動歸還連線池：%s",
+                               len(leaked), g.pop('_db_where', 'app context'))
+
+
+def init_db_pool(app):
+    """註冊連線池的請求生命週期管理"""
+    app.teardown_appcontext(release_request_connections)
+
+
+def get_pool_stats():
+    """回傳本 worker 連線池的統計數據 (借出次數、等待時間等)"""
+    if _pool is None or _pool_pid != os.getpid():
+        return {}
+    return _pool.stats()
 
 # --- 資料庫初始化 ---
+# 是否在 worker 啟動時自動套用 migration (設為 0 則只檢查版本，DDL 一律由 python migrate.py 執行)
+DB_AUTO_MIGRATE = os.environ.get("DB_AUTO_MIGRATE", "1") == "1"
+
 def init_db():
     """
-    建立所有必要的資料表與預設設定。
+    確認資料庫結構為最新版本。
+    結構已是最新時只會執行一次 SELECT；有待套用的 migration 才會執行 DDL (見 migrate.py)。
     回傳 True 表示成功，False 表示失敗。
     """
+    import migrate  # 延遲匯入，避免 migrate.py 與本模組互相引用
+
     conn = None # 預設連線變數為空
-    cur = None  # 預設遊標（Cursor）變數為空
     try:
         conn = get_db_connection() # 取得資料庫連線
-        conn.autocommit = True     # 設定為「自動提交」，每執行一個 SQL 指令即生效
-        cur = conn.cursor()        # 開啟遊標以執行 SQL 指令
-
-        # 1. 建立產品表 (products)
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS products (
-                id SERIAL PRIMARY KEY,            -- 自動遞增的主鍵 ID
-                name VARCHAR(100) NOT NULL,       -- 產品名稱（必填）
-                price INTEGER NOT NULL,           -- 價格（必填）
-                category VARCHAR(50),             -- 分類名稱
-                image_url TEXT,                   -- 圖片網址
-                is_available BOOLEAN DEFAULT TRUE,-- 是否上架（預設為是）
-                custom_options TEXT,              -- 自定義選項（如：辣度、冰塊）
-                sort_order INTEGER DEFAULT 100,   -- 排序序號
-                name_en VARCHAR(100),             -- 英文品名
-                name_jp VARCHAR(100),             -- 日文品名
-                name_kr VARCHAR(100),             -- 韓文品名
-                custom_options_en TEXT,           -- 英文自定義選項
-                custom_options_jp TEXT,           -- 日文自定義選項
-                custom_options_kr TEXT,           -- 韓文自定義選項
-                print_category VARCHAR(20) DEFAULT 'Noodle', -- 出單分類（用於廚房出單）
-                category_en VARCHAR(50),          -- 英文分類名
-                category_jp VARCHAR(50),          -- 日文分類名
-                category_kr VARCHAR(50)           -- 韓文分類名
-            );
-        ''')
-        
-        # 2. 建立訂單表 (orders)
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS orders (
-                id SERIAL PRIMARY KEY,            -- 訂單 ID
-                table_number VARCHAR(10),         -- 桌號
-                items TEXT NOT NULL,              -- 訂單項目內容（文字描述）
-                total_price INTEGER NOT NULL,     -- 總金額
-                status VARCHAR(20) DEFAULT 'Pending', -- 訂單狀態（預設為待處理）
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, -- 建立時間
-                daily_seq INTEGER DEFAULT 0,      -- 當日流水號
-                content_json TEXT,                -- 以 JSON 格式存儲的訂單明細
-                need_receipt BOOLEAN DEFAULT FALSE, -- 是否需要收據
-                lang VARCHAR(10) DEFAULT 'zh',    -- 下單時使用的語系
-                
-                -- 外送相關欄位
-                order_type VARCHAR(50) DEFAULT 'dine_in', -- 訂單類型（內用/外送/自取）
-                delivery_info TEXT,               -- 綜合外送資訊
-                customer_name TEXT,               -- 客戶姓名
-                customer_phone TEXT,              -- 客戶電話
-                customer_address TEXT,            -- 客戶地址
-                scheduled_for TEXT,               -- 預約送達時間
-                delivery_fee INTEGER DEFAULT 0,   -- 外送費
-
-                -- 👇 新增：綠界電子發票相關欄位 (已放寬長度)
-                invoice_number VARCHAR(50),       -- 發票號碼 (例: AB12345678)
-                invoice_status VARCHAR(20) DEFAULT 'Not Issued', -- 發票狀態 (Not Issued: 未開立, Issued: 已開立, Void: 已作廢)
-                tax_id VARCHAR(15),               -- 統一編號 (買方統編，放寬至 15)
-                carrier_type VARCHAR(10),         -- 載具類別 (1: 綠界, 2: 自然人憑證, 3: 手機條碼，放寬至 10 以容納 'don')
-                carrier_num VARCHAR(50)           -- 載具隱碼 (例: /AB12345)
-            );
-        ''')
-        
-        # 3. 建立系統設定表 (settings)
-        cur.execute('''CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT);''')
-
-        # 4. 插入預設設定 (新增了 shop_open 與其他外送參數)
-        default_settings = [
-            ('sender_email', 'onboarding@resend.dev'), # 預設發信人郵件
-            ('shop_open', '1'),                        # 預設全店營業中 (1: 開啟)
-            ('delivery_enabled', '1'),                 # 是否啟用外送功能 (後端用)
-            ('enable_delivery', '1'),                  # 前端按鈕可能使用的 key (保持相容)
-            ('delivery_min_price', '500'),             # 外送起送價
-            ('delivery_fee_base', '0'),                # 基礎外送費
-            ('delivery_max_km', '5'),                  # 最大外送距離 (公里)
-            ('delivery_fee_per_km', '10')              # 超過基礎距離後的每公里加價
-        ]
-        
-        for k, v in default_settings:
-            # 插入設定值，如果 Key 已經存在則跳過 (ON CONFLICT DO NOTHING)
-            # 這樣可以確保新增加的設定 (如 shop_open) 會被寫入，而已存在的設定不會被覆蓋
-            cur.execute("INSERT INTO settings (key, value) VALUES (%s, %s) ON CONFLICT DO NOTHING", (k, v))
+        cur = conn.cursor()
+        current = migrate.current_version(cur)
+        cur.close()
+        latest = migrate.latest_version()
 
+        # ⚡ 快速路徑：結構已是最新，不需要任何 DDL
+        if current >= latest:
+            return True
 
-        # === 💡 關鍵修正：砍掉舊的 users 表格，確保能夠建立最新帶有 password_hash 的版本 ===
-        #cur.execute("DROP TABLE IF EXISTS users CASCADE;")
-        
-        # 建立使用者資料表 (users)
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,            -- 使用者 ID
-                username VARCHAR(50) UNIQUE NOT NULL, -- 帳號名稱 (必須唯一)
-                password_hash TEXT NOT NULL,      -- 密碼的雜湊值 (絕對不存明文)
-                role VARCHAR(20) DEFAULT 'admin', -- 角色權限 (例如: admin, staff)
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP -- 建立時間
-            );
-        ''')
-
-        # 建立一個預設的 Admin 帳號 (因為上面我們 DROP TABLE 了，所以這裡一定會重新建立)
-        cur.execute("SELECT COUNT(*) FROM users")
-        user_count = cur.fetchone()[0]
-        
-        if user_count == 0:
-            print("👤 尚未建立任何使用者，正在建立預設的 Admin 帳號...")
-            default_username = "admin"
-            default_password = "password123" # ⚠️ 請在登入後台後立即更改此密碼！
-            
-            # 使用 bcrypt 對密碼進行雜湊處理
-            # 必須將字串轉為 bytes (encode('utf-8'))
-            salt = bcrypt.gensalt()
-            hashed_password = bcrypt.hashpw(default_password.encode('utf-8'), salt).decode('utf-8')
-            
-            cur.execute(
-                "INSERT INTO users (username, password_hash, role) VALUES (%s, %s, %s)",
-                (default_username, hashed_password, 'admin')
-            )
-            print(f"✅ 預設 Admin 帳號建立完成。帳號: {default_username} / 密碼: {default_password}")
-
-
-        # 5. 【關鍵】欄位自動補全與類型修正 (Migration)
-        # 此段確保如果資料表已經存在，但缺少新開發的欄位時，會自動新增欄位
-        alters = [
-            # --- Orders 表格補全 ---
-            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS lang VARCHAR(10) DEFAULT 'zh';",
-            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS content_json TEXT;",
-            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS order_type VARCHAR(50) DEFAULT 'dine_in';",
-            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS delivery_info TEXT;",
-            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS customer_name TEXT;",
-            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS customer_phone TEXT;",
-            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS customer_address TEXT;",
-            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS scheduled_for TEXT;",
-            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS delivery_fee INTEGER DEFAULT 0;",
-            
-            # 👇 新增：綠界發票欄位自動補全 (修正為正確長度)
-            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS invoice_number VARCHAR(50);",
-            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS invoice_status VARCHAR(20) DEFAULT 'Not Issued';",
-            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS tax_id VARCHAR(15);",
-            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS carrier_type VARCHAR(10);",
-            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS carrier_num VARCHAR(50);",
-
-            # 👇 終極修復：強制把已經存在的舊欄位「撐大」，解決 VARCHAR(1) 報錯問題！
-            "ALTER TABLE orders ALTER COLUMN carrier_type TYPE VARCHAR(10);",
-            "ALTER TABLE orders ALTER COLUMN tax_id TYPE VARCHAR(15);",
-            "ALTER TABLE orders ALTER COLUMN carrier_num TYPE VARCHAR(50);",
-
-            # --- Products 表格補全 (防止舊資料庫缺少多語系欄位) ---
-            "ALTER TABLE products ADD COLUMN IF NOT EXISTS sort_order INTEGER DEFAULT 100;",
-            "ALTER TABLE products ADD COLUMN IF NOT EXISTS print_category VARCHAR(20) DEFAULT 'Noodle';",
-            "ALTER TABLE products ADD COLUMN IF NOT EXISTS name_en VARCHAR(100);",
-            "ALTER TABLE products ADD COLUMN IF NOT EXISTS name_jp VARCHAR(100);",
-            "ALTER TABLE products ADD COLUMN IF NOT EXISTS name_kr VARCHAR(100);",
-            "ALTER TABLE products ADD COLUMN IF NOT EXISTS category_en VARCHAR(50);",
-            "ALTER TABLE products ADD COLUMN IF NOT EXISTS category_jp VARCHAR(50);",
-            "ALTER TABLE products ADD COLUMN IF NOT EXISTS category_kr VARCHAR(50);",
-            "ALTER TABLE products ADD COLUMN IF NOT EXISTS custom_options_en TEXT;",
-            "ALTER TABLE products ADD COLUMN IF NOT EXISTS custom_options_jp TEXT;",
-            "ALTER TABLE products ADD COLUMN IF NOT EXISTS custom_options_kr TEXT;"
-        ]
-        
-        print("🔄 正在檢查資料庫欄位結構...")
-        for cmd in alters:
-            try:
-                cur.execute(cmd) # 執行增加/修改欄位的指令
-            except Exception as e:
-                # 攔截錯誤，如果是「重複欄位」或「已存在」的報錯則忽略，其餘印出警告
-                if 'duplicate' not in str(e).lower() and 'exists' not in str(e).lower():
-                    print(f"⚠️ Warning during migration: {e}")
+        if not DB_AUTO_MIGRATE:
+            print(f"⚠️ 資料庫結構版本 {current:04d} 落後於程式版本 {latest:04d}，請執行: python migrate.py")
+            return False
 
-        print("✅ 資料庫初始化檢查完成 (含 order_type, delivery_info, 發票欄位長度修復, products 多語系欄位, 及 users 表格)")
+        # 需要長時間鎖表的 migration 不會在這裡執行 (見 migrate.py 的 requires_manual)
+        applied = migrate.apply_migrations(conn, auto=True)
+        if (applied[-1] if applied else current) < latest:
+            return False
         return True
 
     except Exception as e:
         # 捕獲初始化過程中的任何重大錯誤
         print(f"❌ 資料庫初始化錯誤: {e}")
         return False
-    
+
     finally:
-        # 無論成功或失敗，最後都必須關閉遊標與連線，釋放資源
-        if cur:
-            cur.close()
+        # 無論成功或失敗，最後都必須歸還連線
         if conn:
             conn.close()
 
 if __name__ == "__main__":
-    # 當直接執行此 .py 檔案時，啟啟初始化程序
+    # 當直接執行此 .py 檔案時，啟動初始化程序 (等同 python migrate.py)
     init_db()
 
 
@@ -281,7 +424,7 @@ def get_order_by_id(order_id):
         conn.close()
 
 
-def update_order_invoice(order_id, new_invoice_no, status="正常"):
+def update_order_invoice(order_id, new_invoice_no, status="Issued"):
     """開立(或重開)發票後，將新發票號碼寫回資料庫"""
     conn = get_db_connection()
     cur = conn.cursor()
@@ -310,8 +453,8 @@ def get_orders_by_date(target_date):
                    invoice_number AS invoice_no, 
                    invoice_status 
             FROM orders 
-            WHERE DATE(created_at) = %s
-        """, (target_date,))
+            WHERE created_at >= %s AND created_at < %s
+        """, day_range(target_date))
         
         columns = [desc[0] for desc in cur.description]
         rows = cur.fetchall()
@@ -0,0 +1,183 @@
+"""
+跨 worker 的資料變更通知 (PostgreSQL LISTEN / NOTIFY)
+
+每個 gunicorn worker 各開一條「專用」連線 (不佔用連線池) 並在背景執行緒 LISTEN，
+收到通知後呼叫已註冊的 callback (通常是讓記憶體快取失效)。
+
+    db_events.subscribe('settings_changed', lambda payload: ...)
+    db_events.notify(cur, 'settings_changed')   # 在寫入的交易內呼叫，commit 後才會送出
+
+連線中斷期間可能漏接通知，因此每次 (重新) 連上時會呼叫 on_reconnect 註冊的 callback，
+讓各快取整個重新載入。
+"""
+import os
+import re
+import time
+import select
+import threading
+
+import psycopg2
+import psycopg2.extensions
+
+# 設為 0 可關閉 LISTEN (例如經過 pgbouncer transaction mode 時無法 LISTEN)，快取改以 TTL 過期為準
+DB_EVENTS_ENABLED = os.environ.get("DB_EVENTS_ENABLED", "1") == "1"
+RECONNECT_DELAY = 5   # 連線失敗後幾秒重試
+POLL_INTERVAL = 1.0   # 多久檢查一次是否有新的頻道要 LISTEN
+
+_CHANNEL_PATTERN = re.compile(r'^[a-z_][a-z0-9_]*$')
+
+_lock = threading.Lock()
+_subscribers = {}       # channel -> [callback(payload), ...]
+_reconnect_hooks = []   # [callback(), ...]
+_listener_pid = None
+_connected = False
+
+
+def subscribe(channel, callback):
+    """註冊頻道的通知處理函式 (callback 會在背景執行緒中被呼叫，請保持輕量)"""
+    if not _CHANNEL_PATTERN.match(channel):
+        raise ValueError(f"不合法的頻道名稱: {channel}")
+    with _lock:
+        _subscribers.setdefault(channel, []).append(callback)
+    ensure_listener()
+
+
+def on_reconnect(callback):
+    """註冊「LISTEN 連線建立 / 重新建立」時要執行的函式 (期間的通知可能已經漏接)"""
+    with _lock:
+        _reconnect_hooks.append(callback)
+
+
+def notify(cur, channel, payload=''):
+    """送出通知；與呼叫端同一個交易，commit 之後所有 worker 才會收到 (rollback 則不會送出)"""
+    cur.execute("SELECT pg_notify(%s, %s)", (channel, str(payload)))
+
+
+def is_listening():
+    """本 worker 的 LISTEN 連線目前是否正常"""
+    return _connected and _listener_pid == os.getpid()
+
+
+def ensure_listener():
+    """確保本行程已啟動 LISTEN 背景執行緒 (gunicorn fork 後每個 worker 各自啟動一次)"""
+    global _listener_pid
+    if not DB_EVENTS_ENABLED or _listener_pid == os.getpid():
+        return
+    with _lock:
+        if _listener_pid == os.getpid():
+            return
+        _listener_pid = os.getpid()
+    t = threading.Thread(target=_listen_loop, name="db-events", daemon=True)
+    t.start()
+
+
+def _dispatch(channel, payload):
+    with _lock:
+        callbacks = list(_subscribers.get(channel, []))
+    for cb in callbacks:
+        try:
+            cb(payload)
+        except Exception as e:
+            print(f"⚠️ 事件處理失敗 ({channel}): {e}")
+
+
+def _run_reconnect_hooks():
+    with _lock:
+        hooks = list(_reconnect_hooks)
+    for hook in hooks:
+        try:
+            hook()
+        except Exception as e:
+            print(f"⚠️ 重連處理失敗: {e}")
+
+
+def _listen_loop():
+    global _connected
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(os.environ.get("DATABASE_URL"))
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            cur = conn.cursor()
+            listening = set()
+            _connected = True
+            _run_reconnect_hooks()
+
+            while True:
+                with _lock:
+                    channels = set(_subscribers)
+                for channel in channels - listening:
+                    cur.execute(f"LISTEN {channel}")
+                    listening.add(channel)
+
+                if select.select([conn], [], [], POLL_INTERVAL) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    n = conn.notifies.pop(0)
+                    _dispatch(n.channel, n.payload)
+
+        except Exception as e:
+            print(f"⚠️ LISTEN 連線中斷，{RECONNECT_DELAY} 秒後重試: {e}")
+        finally:
+            _connected = False
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        time.sleep(RECONNECT_DELAY)
+
+
+# ==========================================
+# 📦 通用記憶體快照 (收到通知即失效)
+# ==========================================
+class SnapshotCache:
+    """
+    每個 worker 一份的唯讀快照：第一次使用時呼叫 loader(generation) 載入，之後直接讀記憶體。
+    收到 channel 的通知或 LISTEN 重新連線時失效；LISTEN 不可用時改用 fallback_ttl 自動過期。
+    """
+
+    def __init__(self, channel, loader, ttl=300, fallback_ttl=5):
+        if not _CHANNEL_PATTERN.match(channel):
+            raise ValueError(f"不合法的頻道名稱: {channel}")
+        self.channel = channel
+        self.loader = loader
+        self.ttl = ttl
+        self.fallback_ttl = fallback_ttl
+        self._lock = threading.Lock()
+        self._value = None
+        self._loaded_at = 0
+        self._generation = 0  # 每次失效 +1，避免「載入途中收到通知」時把舊資料存回去
+        self._subscribed_pid = None
+
+    def invalidate(self, payload=None):
+        """讓本 worker 的快照失效，下一次 get() 會重新載入"""
+        with self._lock:
+            self._value = None
+            self._generation += 1
+
+    def notify(self, cur):
+        """在寫入的交易內呼叫；commit 後所有 worker 的快照都會失效"""
+        notify(cur, self.channel)
+
+    def get(self):
+        if self._subscribed_pid != os.getpid():
+            self._subscribed_pid = os.getpid()
+            on_reconnect(self.invalidate)
+            subscribe(self.channel, self.invalidate)
+
+        ttl = self.ttl if is_listening() else self.fallback_ttl
+        value = self._value
+        if value is not None and time.time() - self._loaded_at < ttl:
+            return value
+
+        with self._lock:
+            generation = self._generation
+        value = self.loader(generation)
+        with self._lock:
+            # 載入期間若已被通知失效，這份資料可能是舊的：照樣回傳給本次呼叫，但不存起來
+            if generation == self._generation:
+                self._value = value
+                self._loaded_at = time.time()
+        return value
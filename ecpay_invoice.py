@@ -1,8 +1,11 @@
 import os
 import time
+import bisect
+import threading
 import json
 import urllib.parse
 import requests
+import requests.adapters
 import base64
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad, unpad
@@ -19,6 +22,36 @@ HASH_IV = os.environ.get("ECPAY_INVOICE_HASH_IV", "q9jcZX8Ib9LM8wYk")
 ISSUE_URL = os.environ.get("ECPAY_INVOICE_URL", "https://einvoice-stage.ecpay.com.tw/B2CInvoice/Issue")
 INVALID_URL = os.environ.get("ECPAY_INVOICE_INVALID_URL", "https://einvoice-stage.ecpay.com.tw/B2CInvoice/Invalid")
 PRINT_URL = os.environ.get("ECPAY_INVOICE_PRINT_URL", "https://einvoice-stage.ecpay.com.tw/B2CInvoice/InvoicePrint")
+QUERY_URL = os.environ.get("ECPAY_INVOICE_QUERY_URL", "https://einvoice-stage.ecpay.com.tw/B2CInvoice/GetIssue")
+
+# 呼叫綠界的逾時秒數 (連線, 讀取)；各 API 可用 ECPAY_<名稱>_READ_TIMEOUT 個別調整，例如 ECPAY_QUERY_READ_TIMEOUT
+ECPAY_CONNECT_TIMEOUT = float(os.environ.get("ECPAY_CONNECT_TIMEOUT", "5"))
+ECPAY_READ_TIMEOUT = float(os.environ.get("ECPAY_READ_TIMEOUT", "20"))
+ECPAY_POOL_SIZE = int(os.environ.get("ECPAY_POOL_SIZE", "10"))                   # 每個行程保持的連線數上限
+ECPAY_BREAKER_FAILURES = int(os.environ.get("ECPAY_BREAKER_FAILURES", "5"))      # 連續失敗幾次後斷路
+ECPAY_BREAKER_COOLDOWN = float(os.environ.get("ECPAY_BREAKER_COOLDOWN", "30"))   # 斷路幾秒後放一個請求試探
+# 查詢發票 (GetIssue) 時代表「查無此發票」的 RtnCode；其他非 1 的代碼視為查詢失敗 (不能當作沒開立)
+ECPAY_QUERY_NOT_FOUND_CODES = {int(c) for c in os.environ.get("ECPAY_QUERY_NOT_FOUND_CODES", "1200003").split(",") if c.strip()}
+
+
+def _read_timeout(name, default):
+    return float(os.environ.get(f"ECPAY_{name.upper()}_READ_TIMEOUT", default))
+
+
+# API 名稱 -> (網址, (連線逾時, 讀取逾時))
+ENDPOINTS = {
+    'issue': (ISSUE_URL, (ECPAY_CONNECT_TIMEOUT, _read_timeout('issue', ECPAY_READ_TIMEOUT))),
+    'invalid': (INVALID_URL, (ECPAY_CONNECT_TIMEOUT, _read_timeout('invalid', ECPAY_READ_TIMEOUT))),
+    'query': (QUERY_URL, (ECPAY_CONNECT_TIMEOUT, _read_timeout('query', min(ECPAY_READ_TIMEOUT, 10)))),
+    'print': (PRINT_URL, (ECPAY_CONNECT_TIMEOUT, _read_timeout('print', min(ECPAY_READ_TIMEOUT, 15)))),
+}
+
+# 延遲分布的上界 (毫秒)，最後一格為超過 10 秒
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class EcpayUnavailable(Exception):
+    """斷路器開啟中：綠界最近連續失敗，暫不送出請求"""
 
 def aes_encrypt(data_dict, key, iv):
     """綠界新版電子發票專用的 AES 加密"""
@@ -43,11 +76,147 @@ def aes_decrypt(encrypted_base64, key, iv):
         print(f"AES Decrypt Error: {e}")
         return {}
 
-def issue_ecpay_invoice(order):
+# ==========================================
+# 🌐 共用的綠界連線 (keep-alive 連線池 + 斷路器 + 延遲統計)
+# ==========================================
+class EcpayClient:
+    """
+    所有綠界 API 都經由同一個 requests.Session 送出，重複使用 TCP/TLS 連線。
+    連線錯誤、逾時、HTTP 5xx 算失敗 (綠界退件不算)；連續失敗 ECPAY_BREAKER_FAILURES 次後斷路，
+    ECPAY_BREAKER_COOLDOWN 秒內直接丟出 EcpayUnavailable，之後只放一個請求試探，成功才恢復。
+    """
+
+    def __init__(self, endpoints=None, pool_size=ECPAY_POOL_SIZE,
+                 breaker_failures=ECPAY_BREAKER_FAILURES, breaker_cooldown=ECPAY_BREAKER_COOLDOWN):
+        self.endpoints = dict(ENDPOINTS if endpoints is None else endpoints)
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._lock = threading.Lock()
+        self._failures = 0          # 連續失敗次數
+        self._opened_at = None      # 斷路的時間 (None = 正常)
+        self._probing = False       # 斷路冷卻後是否已有試探請求在送出中
+        self._stats = {}
+        self.rejected = 0           # 斷路中被直接拒絕的請求數
+
+    # --- 斷路器 ---
+    def _before(self, name):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            wait = self._opened_at + self.breaker_cooldown - time.monotonic()
+            if wait <= 0 and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+        raise EcpayUnavailable(f"綠界暫時無法連線，{max(wait, 0):.0f} 秒後再試 ({name})")
+
+    def _after(self, name, ok, seconds):
+        with self._lock:
+            st = self._stats.get(name)
+            if st is None:
+                st = self._stats[name] = {'count': 0, 'errors': 0, 'sum_ms': 0.0, 'max_ms': 0.0,
+                                          'buckets': [0] * (len(LATENCY_BUCKETS_MS) + 1)}
+            ms = seconds * 1000
+            st['count'] += 1
+            st['sum_ms'] += ms
+            st['max_ms'] = max(st['max_ms'], ms)
+            st['buckets'][bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+            if not ok:
+                st['errors'] += 1
+
+            self._probing = False
+            if ok:
+                if self._opened_at is not None:
+                    print("✅ 綠界連線恢復，斷路器關閉")
+                self._failures = 0
+                self._opened_at = None
+            else:
+                self._failures += 1
+                if self._opened_at is not None or self._failures >= self.breaker_failures:
+                    if self._opened_at is None:
+                        print(f"🚧 綠界連續失敗 {self._failures} 次，斷路 {self.breaker_cooldown:.0f} 秒")
+                    self._opened_at = time.monotonic()
+
+    def post(self, name, payload):
+        """送出 JSON 到指定的 API，回傳 requests.Response；連線失敗 / 逾時時丟出例外"""
+        url, timeout = self.endpoints[name]
+        self._before(name)
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            response = self.session.post(url, json=payload, timeout=timeout)
+            ok = response.status_code < 500
+            return response
+        finally:
+            self._after(name, ok, time.perf_counter() - t0)
+
+    def call(self, name, data):
+        """加密 Data 後送出 (綠界 B2C 共用的外層格式)"""
+        payload = {
+            "MerchantID": MERCHANT_ID,
+            "RqHeader": {"Timestamp": int(time.time()), "Revision": "3.0.0"},
+            "Data": aes_encrypt(data, HASH_KEY, HASH_IV)
+        }
+        return self.post(name, payload)
+
+    def stats(self):
+        """斷路器狀態與各 API 的延遲分布 (buckets 對應 LATENCY_BUCKETS_MS，最後一格為超過上限)"""
+        with self._lock:
+            endpoints = {}
+            for name, st in self._stats.items():
+                endpoints[name] = {
+                    'count': st['count'],
+                    'errors': st['errors'],
+                    'avg_ms': round(st['sum_ms'] / st['count'], 1) if st['count'] else 0.0,
+                    'max_ms': round(st['max_ms'], 1),
+                    'buckets': dict(zip([f"le_{b}" for b in LATENCY_BUCKETS_MS] + ['inf'], st['buckets'])),
+                }
+            if self._opened_at is None:
+                state = 'closed'
+            elif time.monotonic() - self._opened_at >= self.breaker_cooldown:
+                state = 'half_open'
+            else:
+                state = 'open'
+            return {'breaker': state, 'consecutive_failures': self._failures,
+                    'rejected': self.rejected, 'endpoints': endpoints}
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """本行程共用的 EcpayClient (gunicorn fork 後各 worker 各自建立，不共用 socket)"""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = EcpayClient()
+                _client_pid = pid
+    return _client
+
+
+def get_ecpay_stats():
+    if _client is None or _client_pid != os.getpid():
+        return {'breaker': 'closed', 'consecutive_failures': 0, 'rejected': 0, 'endpoints': {}}
+    return _client.stats()
+
+
+def issue_ecpay_invoice(order, relate_number=None):
     """
     發送開立發票請求給綠界
     修正點：支援 unit_price 解析、長度裁切，並自動補齊外送費/折扣差額，
             及處理愛心捐贈碼與各類載具格式翻譯。
+    relate_number：自訂的交易編號 (發票佇列與後台開立使用 invoice_outbox.relate_number，重送時綠界不會重複開立)
     """
     order_id = order.get('id', '')
     
@@ -190,7 +359,7 @@ def issue_ecpay_invoice(order):
     # 3. 組裝 Data 物件
     data = {
         "MerchantID": MERCHANT_ID,
-        "RelateNumber": f"ORDER{order_id}T{int(time.time())}", 
+        "RelateNumber": relate_number or f"ORDER{order_id}T{int(time.time())}", 
         "CustomerID": "",
         "CustomerIdentifier": tax_id if is_company else "",
         "CustomerName": customer_name,
@@ -218,19 +387,8 @@ def issue_ecpay_invoice(order):
         data.pop("CustomerIdentifier", None)
 
     # 4. 加密與 API 發送
-    encrypted_data = aes_encrypt(data, HASH_KEY, HASH_IV)
-    payload = {
-        "MerchantID": MERCHANT_ID,
-        "RqHeader": {
-            "Timestamp": int(time.time()),
-            "Revision": "3.0.0" 
-        },
-        "Data": encrypted_data
-    }
-
     try:
-        headers = {'Content-Type': 'application/json'}
-        response = requests.post(ISSUE_URL, json=payload, headers=headers)
+        response = get_client().call('issue', data)
         result_json = response.json()
         
         if result_json.get("TransCode") == 1:
@@ -243,6 +401,7 @@ def issue_ecpay_invoice(order):
                     "success": True, 
                     "invoice_no": response_data.get("InvoiceNo", ""), 
                     "random_number": response_data.get("RandomNumber", ""),
+                    "invoice_date": str(response_data.get("InvoiceDate") or "")[:10] or None,  # 作廢時要帶的開立日期
                     "message": "OK"
                 }
             else:
@@ -252,24 +411,20 @@ def issue_ecpay_invoice(order):
     except Exception as e:
         return {"success": False, "message": f"Request failed: {str(e)}"}
 
-def invalid_ecpay_invoice(invoice_no, reason="訂單取消"):
-    """發送作廢發票請求"""
+def invalid_ecpay_invoice(invoice_no, reason="訂單取消", invoice_date=None):
+    """
+    發送作廢發票請求
+    invoice_date：發票的開立日期 (date 或 'YYYY-MM-DD'，見 invoice_outbox.invoice_date_of)；與開立日期不符時綠界會退件
+    """
     data = {
         "MerchantID": MERCHANT_ID,
         "InvoiceNo": invoice_no,
-        "InvoiceDate": time.strftime("%Y-%m-%d"), 
+        "InvoiceDate": str(invoice_date)[:10] if invoice_date else time.strftime("%Y-%m-%d"), 
         "Reason": reason[:20] 
     }
-    
-    encrypted_data = aes_encrypt(data, HASH_KEY, HASH_IV)
-    payload = {
-        "MerchantID": MERCHANT_ID,
-        "RqHeader": { "Timestamp": int(time.time()), "Revision": "3.0.0" },
-        "Data": encrypted_data
-    }
 
     try:
-        response = requests.post(INVALID_URL, json=payload)
+        response = get_client().call('invalid', data)
         result_json = response.json()
         if result_json.get("TransCode") == 1:
             response_data = aes_decrypt(result_json.get("Data", ""), HASH_KEY, HASH_IV)
@@ -279,6 +434,46 @@ def invalid_ecpay_invoice(invoice_no, reason="訂單取消"):
     except Exception as e:
         return {"success": False, "message": str(e)}
 
+def query_ecpay_invoice(relate_number=None, invoice_no=None, invoice_date=None):
+    """
+    查詢發票：以 RelateNumber (前一次送出後逾時、不確定綠界有沒有收到時使用)，
+    或以發票號碼 + 開立日期 'YYYY-MM-DD' (對帳時使用)
+    回傳 {"success": True, "found": bool, "invoice_no": ..., "voided": bool}；
+    只有綠界明確回覆查無資料 (ECPAY_QUERY_NOT_FOUND_CODES) 時 found 為 False，其他錯誤 success 為 False (呼叫端應稍後重試)
+    """
+    data = {"MerchantID": MERCHANT_ID}
+    if invoice_no:
+        data["InvoiceNo"] = invoice_no
+        data["InvoiceDate"] = invoice_date or time.strftime("%Y-%m-%d")
+    else:
+        data["RelateNumber"] = relate_number
+
+    try:
+        response = get_client().call('query', data)
+        result_json = response.json()
+        if result_json.get("TransCode") != 1:
+            return {"success": False, "message": f"API 通訊失敗: {result_json.get('TransMsg')}"}
+        response_data = aes_decrypt(result_json.get("Data", ""), HASH_KEY, HASH_IV)
+        rtn_code = response_data.get("RtnCode")
+        rtn_msg = response_data.get("RtnMsg", "無錯誤訊息")
+        if rtn_code == 1 and response_data.get("IIS_Number"):
+            return {
+                "success": True, "found": True,
+                "invoice_no": response_data.get("IIS_Number"),
+                "random_number": response_data.get("IIS_Random_Number", ""),
+                "invoice_date": str(response_data.get("IIS_Create_Date") or "")[:10] or None,
+                "voided": str(response_data.get("IIS_Invalid_Status", "0")) == "1",
+            }
+        try:
+            not_found = int(rtn_code) in ECPAY_QUERY_NOT_FOUND_CODES
+        except (TypeError, ValueError):
+            not_found = False
+        if not_found:
+            return {"success": True, "found": False, "message": rtn_msg}
+        return {"success": False, "message": f"查詢失敗: {rtn_msg} (代碼: {rtn_code})"}
+    except Exception as e:
+        return {"success": False, "message": f"Request failed: {str(e)}"}
+
 def print_ecpay_invoice(invoice_no):
     """發送列印發票請求並取得 HTML"""
     data = {
@@ -287,16 +482,9 @@ def print_ecpay_invoice(invoice_no):
         "PrintStyle": "1", 
         "IsPrint": "1"
     }
-    
-    encrypted_data = aes_encrypt(data, HASH_KEY, HASH_IV)
-    payload = {
-        "MerchantID": MERCHANT_ID,
-        "RqHeader": { "Timestamp": int(time.time()), "Revision": "3.0.0" },
-        "Data": encrypted_data
-    }
 
     try:
-        response = requests.post(PRINT_URL, json=payload)
+        response = get_client().call('print', data)
         try:
             result_json = response.json()
             if result_json.get("TransCode") == 1:
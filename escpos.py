@@ -0,0 +1,96 @@
+"""
+ESC/POS 指令組合 (80mm 出單機)
+
+結帳單、廚房分區單、日結報表都以 Ticket 組合：內容寫進同一個 bytearray，最後 getvalue() 一次取出，
+不必反覆 bytes += 產生新物件。
+
+編碼：一律使用 ENCODING (big5-hkscs，涵蓋 Big5 / cp950 的常用中文字與香港增補字)；印表機無法顯示的
+字元 (emoji 等) 以 ? 取代，不會讓整張單產生失敗。文字的編碼結果有快取 (品名、選項、標籤會一再重複)。
+
+排版：80mm 紙、標準字體一行 PAPER_COLS (48) 個半形字 (中文字佔 2 格)；放大字體 (SIZE_*) 時要除以倍寬。
+
+    t = Ticket()
+    t.raw(INIT + ALIGN_CENTER)
+    t.line("結帳單", SIZE_TRIPLE + BOLD_ON)
+    t.rule()
+    t.line("牛肉麵 x2 $360")
+    t.cut()
+    data = t.getvalue()
+"""
+from functools import lru_cache
+
+ENCODING = 'big5-hkscs'
+PAPER_COLS = 48          # 80mm、標準字體每行半形字數
+
+ESC, GS, FS = b'\x1b', b'\x1d', b'\x1c'
+INIT = ESC + b'@'
+# 進入中文模式 + 設定字體代碼頁 (每張單開頭送一次，見 tickets.INIT_CMDS)
+CHINESE_MODE = FS + b'&'
+CODEPAGE = ESC + b't\x0d'
+
+BOLD_ON, BOLD_OFF = ESC + b'E\x01', ESC + b'E\x00'
+ALIGN_LEFT, ALIGN_CENTER, ALIGN_RIGHT = ESC + b'a\x00', ESC + b'a\x01', ESC + b'a\x02'
+
+# 字體大小 (GS ! n：高 4 位元為倍寬、低 4 位元為倍高)
+SIZE_NORMAL = GS + b'!\x00'   # 標準
+SIZE_TALL = GS + b'!\x01'     # 1x2 拉高 (適合閱讀)
+SIZE_DOUBLE = GS + b'!\x11'   # 2x2 重要資訊
+SIZE_TRIPLE = GS + b'!\x22'   # 3x3 標題
+
+CUT = GS + b'V\x42\x00'       # 進紙後切紙
+NEWLINE = b'\n'
+
+
+@lru_cache(maxsize=4096)
+def encode(text):
+    """文字 -> 印表機編碼 (無法編碼的字元以 ? 取代)"""
+    return text.encode(ENCODING, 'replace')
+
+
+class Ticket:
+    """一張單的 ESC/POS 內容"""
+
+    __slots__ = ('buf',)
+
+    def __init__(self, prefix=b''):
+        self.buf = bytearray(prefix)
+
+    def raw(self, data):
+        """直接寫入指令 bytes"""
+        self.buf += data
+        return self
+
+    def text(self, text, style=b''):
+        """寫入文字 (不換行)；style 為寫在文字前的指令，例如 SIZE_DOUBLE + BOLD_ON"""
+        self.buf += style
+        self.buf += encode(text)
+        return self
+
+    def line(self, text='', style=b'', after=b''):
+        """寫入一行文字；after 為換行後緊接的指令 (例如 BOLD_OFF)"""
+        self.buf += style
+        self.buf += encode(text)
+        self.buf += NEWLINE
+        self.buf += after
+        return self
+
+    def rule(self, char='-', width=PAPER_COLS, style=b''):
+        """整行分隔線"""
+        self.buf += style
+        self.buf += encode(char) * width
+        self.buf += NEWLINE
+        return self
+
+    def feed(self, lines=1):
+        self.buf += NEWLINE * lines
+        return self
+
+    def cut(self):
+        self.buf += CUT
+        return self
+
+    def getvalue(self):
+        return bytes(self.buf)
+
+    def __len__(self):
+        return len(self.buf)
@@ -0,0 +1,559 @@
+"""
+電子發票待送佇列 (invoice_outbox)
+
+出餐 (complete_order) 時在更新訂單狀態的同一個交易內呼叫 enqueue_issue(cur, oid)，作廢時呼叫
+enqueue_void(...)；commit 後立即回應收銀台，由背景 worker 呼叫綠界並把 invoice_number /
+invoice_status 寫回 orders。綠界變慢或斷線只會讓發票晚一點開出，不會卡住出餐按鈕。
+
+- 領取使用 FOR UPDATE SKIP LOCKED，多個 worker (多個 gunicorn 行程) 同時處理也不會重複送出
+- 開立的 RelateNumber 以訂單為準 (ORDER{order_id}，作廢後重開為 ORDER{order_id}V{作廢次數})，不論哪一筆工作送出都相同；
+  之前送出過 (逾時、worker 當機、前一筆工作失敗後又重新排入) 時，先以 RelateNumber 查詢是否已開立，
+  已開立就直接寫回，不會開出兩張發票
+- 失敗依退避時間重試，超過 INVOICE_MAX_ATTEMPTS 次標記為 failed (可用 python invoice_outbox.py retry 重新排入)
+- 開立途中訂單被作廢時，寫回發票號碼後自動排入作廢
+
+    enqueue_issue(cur, oid)                        出餐時排入開立
+    issue_order_invoice(order, check_first)        以訂單的 RelateNumber 開立 (先查詢，已開立就沿用)
+    invoice_date_of(cur, oid, invoice_no)          作廢時要帶給綠界的發票開立日期
+    enqueue_void(cur, oid, invoice_no, reason)     作廢已開立的發票
+    cancel_pending(cur, oid)                       訂單作廢時取消還沒送出的開立
+    start_workers()                                啟動本行程的 worker 執行緒
+    run_order(oid, action, worker)                 後台立即開立 / 作廢一張訂單 (一樣經過佇列)
+    bulk_run(action, targets, worker)              後台批次開立 / 作廢 (限制同時筆數與每秒筆數)
+
+指令：
+    python invoice_outbox.py status     各狀態的工作數
+    python invoice_outbox.py retry      把失敗的工作重新排入
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import psycopg2
+import psycopg2.extras
+
+import db_events
+import invoice_print_cache
+from database import db_connection
+from kitchen_events import notify_order_changed
+from ecpay_invoice import issue_ecpay_invoice, invalid_ecpay_invoice, query_ecpay_invoice
+
+CHANNEL = 'invoice_outbox'
+INVOICE_WORKERS = int(os.environ.get("INVOICE_WORKERS", "2"))                  # 每個行程的 worker 執行緒數 (0 = 不在此行程處理)
+INVOICE_MAX_ATTEMPTS = int(os.environ.get("INVOICE_MAX_ATTEMPTS", "8"))        # 超過就標記 failed
+INVOICE_RETRY_BASE = float(os.environ.get("INVOICE_RETRY_BASE", "10"))         # 第一次失敗後幾秒重試，之後每次加倍
+INVOICE_RETRY_MAX = float(os.environ.get("INVOICE_RETRY_MAX", "600"))          # 重試間隔上限 (秒)
+INVOICE_CLAIM_TIMEOUT = int(os.environ.get("INVOICE_CLAIM_TIMEOUT", "120"))    # 送出後幾秒沒回報就放回佇列
+INVOICE_POLL_INTERVAL = float(os.environ.get("INVOICE_POLL_INTERVAL", "5"))    # 沒有通知時多久檢查一次佇列
+
+
+def relate_number(oid, void_count=0):
+    """開立用的 RelateNumber：同一張訂單固定不變，發票作廢後 (orders.invoice_void_count 加 1) 才換新的"""
+    return f"ORDER{oid}V{void_count}" if void_count else f"ORDER{oid}"
+
+
+def issue_order_invoice(order, check_first=True):
+    """
+    以訂單的 RelateNumber 開立 (order 為 orders 的一列 dict)，回傳格式同 issue_ecpay_invoice。
+    check_first 時先查詢綠界：已開立就沿用那張，不再送出；已開立但已作廢時回傳 success False、voided True
+    (呼叫端把號碼寫回為 Void，作廢次數加 1 後才會以新的 RelateNumber 重開)。查詢失敗時不送出，回傳 success False
+    """
+    rn = relate_number(order['id'], order.get('invoice_void_count') or 0)
+    if check_first:
+        found = query_ecpay_invoice(rn)
+        if not found.get('success'):
+            return found
+        if found.get('found'):
+            if found.get('voided'):
+                return {'success': False, 'voided': True, 'invoice_no': found.get('invoice_no'),
+                        'message': f"綠界上 {rn} 的發票 {found.get('invoice_no')} 已作廢"}
+            print(f"🧾 發票已於先前送出時開立 ({rn}): {found.get('invoice_no')}")
+            return found
+    return issue_ecpay_invoice(order, relate_number=rn)
+
+
+def enqueue_issue(cur, oid):
+    """在出餐的交易內呼叫：排入開立 (已有處理中的開立時不重複排入)，回傳工作 id 或 None"""
+    cur.execute("""
+        INSERT INTO invoice_outbox (order_id, action) VALUES (%s, 'issue')
+        ON CONFLICT (order_id, action) WHERE status IN ('queued', 'sending') DO NOTHING
+        RETURNING id
+    """, (oid,))
+    row = cur.fetchone()
+    if row:
+        db_events.notify(cur, CHANNEL)
+    return _first(row)
+
+
+def enqueue_void(cur, oid, invoice_no, reason="訂單取消"):
+    """在作廢訂單的交易內呼叫：排入作廢已開立的發票，回傳工作 id 或 None"""
+    cur.execute("""
+        INSERT INTO invoice_outbox (order_id, action, invoice_number, reason) VALUES (%s, 'void', %s, %s)
+        ON CONFLICT (order_id, action) WHERE status IN ('queued', 'sending') DO NOTHING
+        RETURNING id
+    """, (oid, invoice_no, reason[:100]))
+    row = cur.fetchone()
+    if row:
+        db_events.notify(cur, CHANNEL)
+    return _first(row)
+
+
+def cancel_pending(cur, oid):
+    """
+    訂單作廢時呼叫：還沒送出的開立直接取消。
+    回傳 True 表示沒有開立正在送出中；False 表示綠界可能正在開立 (worker 寫回時會自動排入作廢)
+    """
+    cur.execute("""
+        UPDATE invoice_outbox SET status = 'cancelled', done_at = CURRENT_TIMESTAMP, last_error = '訂單已作廢'
+        WHERE order_id = %s AND action = 'issue' AND status = 'queued'
+    """, (oid,))
+    cur.execute("SELECT 1 FROM invoice_outbox WHERE order_id = %s AND action = 'issue' AND status = 'sending'", (oid,))
+    return cur.fetchone() is None
+
+
+def invoice_date_of(cur, oid, invoice_no):
+    """
+    發票的開立日期 (台灣日期)：orders.invoice_date；沒有記錄時以發票佇列完成開立的時間，
+    再沒有 (佇列上線前同步開立的舊發票) 以出餐時開立的慣例用下單日期。找不到訂單時回傳 None
+    """
+    cur.execute("""
+        SELECT COALESCE(
+            CASE WHEN o.invoice_number = %s THEN o.invoice_date END,
+            (SELECT (j.done_at + interval '8 hours')::date FROM invoice_outbox j
+             WHERE j.order_id = o.id AND j.action = 'issue' AND j.status = 'done' AND j.invoice_number = %s
+             ORDER BY j.id DESC LIMIT 1),
+            (o.created_at + interval '8 hours')::date
+        ) AS invoice_date
+        FROM orders o WHERE o.id = %s
+    """, (invoice_no, invoice_no, oid))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return row['invoice_date'] if isinstance(row, dict) else row[0]
+
+
+def _first(row):
+    if row is None:
+        return None
+    return row['id'] if isinstance(row, dict) else row[0]
+
+
+def _recover(cur):
+    """領取前的整理：送出後沒有回報的工作 (worker 當機) 放回佇列，重送前會先查詢是否已開立"""
+    cur.execute("""
+        UPDATE invoice_outbox
+        SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+            last_error = '送出後逾時未回報', claimed_by = NULL
+        WHERE status = 'sending' AND claimed_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+    """, (INVOICE_MAX_ATTEMPTS, INVOICE_CLAIM_TIMEOUT))
+
+
+def claim(cur, worker, limit=1):
+    """
+    領取待送工作 (最舊的先送)，回傳 [(job_id, order_id, action, invoice_number, reason, attempts, resent), ...]
+    resent 為 True 表示這筆工作之前送出過 (結果可能不明)
+    """
+    _recover(cur)
+    cur.execute("""
+        UPDATE invoice_outbox j
+        SET status = 'sending', attempts = j.attempts + 1, claimed_by = %s, claimed_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT id FROM invoice_outbox
+            WHERE status = 'queued' AND next_attempt_at <= CURRENT_TIMESTAMP
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        ) picked
+        WHERE j.id = picked.id
+        RETURNING j.id, j.order_id, j.action, j.invoice_number, j.reason, j.attempts, j.last_error IS NOT NULL
+    """, (worker, limit))
+    return sorted(tuple(r) for r in cur.fetchall())
+
+
+def _finish(cur, job_id, status='done', invoice_no=None, error=None):
+    cur.execute("""
+        UPDATE invoice_outbox
+        SET status = %s, done_at = CURRENT_TIMESTAMP, last_error = %s,
+            invoice_number = COALESCE(%s, invoice_number)
+        WHERE id = %s AND status = 'sending'
+    """, (status, error, invoice_no, job_id))
+
+
+def _retry(cur, job_id, error):
+    cur.execute("""
+        UPDATE invoice_outbox
+        SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+            last_error = %s, claimed_by = NULL,
+            next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => LEAST(%s * power(2, attempts - 1), %s))
+        WHERE id = %s AND status = 'sending'
+    """, (INVOICE_MAX_ATTEMPTS, str(error)[:500], INVOICE_RETRY_BASE, INVOICE_RETRY_MAX, job_id))
+
+
+# ==========================================
+# 🧾 處理單筆工作
+# ==========================================
+def _load_order(cur, oid, lock=False):
+    cur.execute(f"SELECT * FROM orders WHERE id = %s{' FOR UPDATE' if lock else ''}", (oid,))
+    return cur.fetchone()
+
+
+def _sent_before(cur, oid, job_id):
+    """同一張訂單之前的開立工作是否送出過 (失敗或取消後重新排入時，結果可能不明)"""
+    cur.execute("""
+        SELECT 1 FROM invoice_outbox
+        WHERE order_id = %s AND action = 'issue' AND id <> %s AND attempts > 0
+        LIMIT 1
+    """, (oid, job_id))
+    return cur.fetchone() is not None
+
+
+def _process_issue(job_id, oid, attempts, resent):
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        order = _load_order(cur, oid)
+        send = False
+        if order is None:
+            _finish(cur, job_id, 'cancelled', error='找不到訂單')
+        elif order.get('invoice_status') == 'Issued':
+            _finish(cur, job_id, 'done', invoice_no=order.get('invoice_number'), error='訂單已有發票')
+        elif order.get('status') == 'Cancelled':
+            _finish(cur, job_id, 'cancelled', error='訂單已作廢')
+        else:
+            send = True
+            check_first = resent or _sent_before(cur, oid, job_id)
+        conn.commit()
+    if not send:
+        return None
+
+    # 呼叫綠界期間不占用連線池的連線；之前送出過 (可能逾時而結果不明) 時先查詢，已開立就不再送出
+    res = issue_order_invoice(order, check_first)
+
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        if res.get('voided'):
+            # 綠界上這個 RelateNumber 的發票已作廢：寫回作廢 (作廢次數加 1)，重試時以新的 RelateNumber 重開
+            cur.execute("""
+                UPDATE orders SET invoice_number = %s, invoice_status = 'Void', invoice_date = %s
+                WHERE id = %s AND COALESCE(invoice_status, 'Not Issued') <> 'Issued'
+            """, (res.get('invoice_no'), res.get('invoice_date'), oid))
+            notify_order_changed(cur, oid)
+        if not res.get('success'):
+            print(f"⚠️ 訂單 #{oid} 發票開立失敗 (第 {attempts} 次): {res.get('message')}")
+            _retry(cur, job_id, res.get('message'))
+            conn.commit()
+            return None
+
+        invoice_no = res.get('invoice_no')
+        current = _load_order(cur, oid, lock=True)
+        cur.execute("""
+            UPDATE orders SET invoice_number = %s, invoice_status = 'Issued', invoice_date = %s
+            WHERE id = %s
+        """, (invoice_no, res.get('invoice_date'), oid))
+        if current is not None and current.get('status') == 'Cancelled':
+            # 開立期間訂單被作廢：發票也要作廢
+            enqueue_void(cur, oid, invoice_no, f"訂單 {oid} 取消作廢")
+        notify_order_changed(cur, oid)
+        _finish(cur, job_id, 'done', invoice_no=invoice_no)
+        conn.commit()
+    print(f"🧾 發票開立成功: 訂單 #{oid} {invoice_no}")
+    return invoice_no
+
+
+def _process_void(job_id, oid, invoice_no, reason):
+    with db_connection() as conn:
+        cur = conn.cursor()
+        invoice_date = invoice_date_of(cur, oid, invoice_no)
+        conn.commit()
+    res = invalid_ecpay_invoice(invoice_no, reason or "訂單取消", invoice_date)
+    with db_connection() as conn:
+        cur = conn.cursor()
+        if not res.get('success'):
+            print(f"⚠️ 發票 {invoice_no} 作廢失敗: {res.get('message')}")
+            _retry(cur, job_id, res.get('message'))
+        else:
+            cur.execute("UPDATE orders SET invoice_status = 'Void' WHERE id = %s AND invoice_number = %s",
+                        (oid, invoice_no))
+            invoice_print_cache.invalidate(cur, invoice_no)
+            notify_order_changed(cur, oid)
+            _finish(cur, job_id, 'done')
+            print(f"🗑️ 發票作廢成功: 訂單 #{oid} {invoice_no}")
+        conn.commit()
+
+
+def process_job(job):
+    """
+    處理一筆已領取的工作：讀取 / 寫回時各自向連線池借一條連線，呼叫綠界期間不占用連線。
+    回傳這次開立成功的發票號碼 (交給 invoice_print_cache.prefetch)，其他情況回傳 None
+    """
+    job_id, oid, action, invoice_no, reason, attempts, resent = job
+    t0 = time.monotonic()
+    try:
+        if action == 'void':
+            return _process_void(job_id, oid, invoice_no, reason)
+        return _process_issue(job_id, oid, attempts, resent)
+    except Exception as e:
+        print(f"❌ 發票工作 #{job_id} 例外錯誤: {e}")
+        with db_connection() as conn:
+            cur = conn.cursor()
+            _retry(cur, job_id, e)
+            conn.commit()
+    finally:
+        _record(action, time.monotonic() - t0)
+
+
+def process_once(worker, limit=1):
+    """領取並處理一批工作，回傳處理筆數"""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        jobs = claim(cur, worker, limit)
+        conn.commit()
+        cur.close()
+    for job in jobs:
+        # 開立成功後預先取得列印 HTML，第一次補印也不必等綠界
+        invoice_print_cache.prefetch(process_job(job))
+    return len(jobs)
+
+
+# ==========================================
+# 🔁 背景 worker
+# ==========================================
+_wake = threading.Condition()
+_pending_wake = 0
+_workers_pid = None
+_stats_lock = threading.Lock()
+_stats = {'issue': 0, 'void': 0, 'seconds': 0.0, 'max_seconds': 0.0}
+
+
+def _record(action, seconds):
+    with _stats_lock:
+        _stats[action] = _stats.get(action, 0) + 1
+        _stats['seconds'] += seconds
+        _stats['max_seconds'] = max(_stats['max_seconds'], seconds)
+
+
+def get_worker_stats():
+    """本行程 worker 的處理筆數與每筆耗時 (含呼叫綠界)"""
+    with _stats_lock:
+        stats = dict(_stats)
+    n = stats['issue'] + stats['void']
+    stats['avg_seconds'] = round(stats['seconds'] / n, 3) if n else 0.0
+    stats['seconds'] = round(stats['seconds'], 3)
+    stats['max_seconds'] = round(stats['max_seconds'], 3)
+    stats['workers'] = INVOICE_WORKERS if _workers_pid == os.getpid() else 0
+    return stats
+
+
+def _notify(payload=None):
+    global _pending_wake
+    with _wake:
+        _pending_wake += 1
+        _wake.notify_all()
+
+
+def _worker_loop(n):
+    global _pending_wake
+    worker = f"{socket.gethostname()}:{os.getpid()}:{n}"
+    while True:
+        try:
+            if process_once(worker):
+                continue
+        except Exception as e:
+            print(f"⚠️ 發票 worker 錯誤: {e}")
+        with _wake:
+            if _pending_wake == 0:
+                _wake.wait(INVOICE_POLL_INTERVAL)
+            _pending_wake = 0
+
+
+def start_workers():
+    """啟動本行程的發票 worker (gunicorn fork 後每個 worker 各自呼叫一次)"""
+    global _workers_pid
+    if INVOICE_WORKERS <= 0 or _workers_pid == os.getpid():
+        return
+    _workers_pid = os.getpid()
+    db_events.subscribe(CHANNEL, _notify)
+    for n in range(INVOICE_WORKERS):
+        threading.Thread(target=_worker_loop, args=(n,), name=f"invoice-outbox-{n}", daemon=True).start()
+
+
+# ==========================================
+# 📦 批次開立 / 作廢 (後台，綠界停擺後補開)
+# ==========================================
+INVOICE_BULK_CONCURRENCY = int(os.environ.get("INVOICE_BULK_CONCURRENCY", "4"))  # 批次作業同時送出的筆數
+INVOICE_BULK_RATE = float(os.environ.get("INVOICE_BULK_RATE", "5"))              # 批次作業每秒最多送出幾筆 (0 = 不限)
+BULK_LIMIT = 1000                                                              # 一次批次最多處理的訂單數
+
+
+def bulk_targets(cur, action, start, end):
+    """
+    批次作業的對象 (created_at 在 UTC 半開區間 [start, end) 內)，回傳 [(order_id, invoice_number), ...]
+        issue：已出餐但發票未開立的訂單
+        void：已作廢但發票仍為已開立的訂單
+    """
+    if action == 'void':
+        where = "status = 'Cancelled' AND invoice_status = 'Issued' AND invoice_number IS NOT NULL"
+    else:
+        where = "status = 'Completed' AND COALESCE(invoice_status, 'Not Issued') NOT IN ('Issued', 'Void')"
+    cur.execute(f"""
+        SELECT id, invoice_number FROM orders
+        WHERE created_at >= %s AND created_at < %s AND {where}
+        ORDER BY id
+        LIMIT %s
+    """, (start, end, BULK_LIMIT))
+    return [tuple(r) for r in cur.fetchall()]
+
+
+def claim_order(cur, oid, action, worker, invoice_no=None, reason=None):
+    """
+    批次作業直接領取指定訂單的工作：佇列裡已有待送的就領取那一筆，沒有就新增一筆；
+    同一張訂單已有工作送出中時回傳 None。回傳值與 claim() 的每一筆相同。
+    """
+    cur.execute("""
+        UPDATE invoice_outbox
+        SET status = 'sending', attempts = attempts + 1, claimed_by = %s, claimed_at = CURRENT_TIMESTAMP
+        WHERE order_id = %s AND action = %s AND status = 'queued'
+        RETURNING id, order_id, action, invoice_number, reason, attempts, last_error IS NOT NULL
+    """, (worker, oid, action))
+    row = cur.fetchone()
+    if row is None:
+        cur.execute("""
+            INSERT INTO invoice_outbox (order_id, action, invoice_number, reason, status, attempts, claimed_by, claimed_at)
+            VALUES (%s, %s, %s, %s, 'sending', 1, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (order_id, action) WHERE status IN ('queued', 'sending') DO NOTHING
+            RETURNING id, order_id, action, invoice_number, reason, attempts, last_error IS NOT NULL
+        """, (oid, action, invoice_no, (reason or '')[:100] or None, worker))
+        row = cur.fetchone()
+    return tuple(row) if row else None
+
+
+class _RateLimiter:
+    """每秒最多放行 rate 次 (平均分散，不會一次衝出去)"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def run_order(oid, action, worker, invoice_no=None, reason=None, prefetch_async=False):
+    """
+    立即處理指定訂單的開立 / 作廢 (後台手動與批次作業)：領取 -> process_job -> 讀回結果 dict。
+    一樣經過發票佇列：送出期間工作為 sending (訂單被作廢時會自動排入作廢)，失敗留在佇列依退避時間重試。
+    prefetch_async 為 True 時列印 HTML 改在背景執行緒預先取得 (請求中呼叫時不拖慢回應)
+    """
+    with db_connection() as conn:
+        cur = conn.cursor()
+        job = claim_order(cur, oid, action, worker, invoice_no, reason)
+        conn.commit()
+    if job is None:
+        return {'order_id': oid, 'success': False, 'message': '此訂單已有發票工作送出中，請稍後重新整理'}
+    issued = process_job(job)
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT status, invoice_number, last_error FROM invoice_outbox WHERE id = %s", (job[0],))
+        status, number, error = cur.fetchone()
+        conn.commit()
+    if prefetch_async:
+        invoice_print_cache.prefetch_async(issued)
+    else:
+        invoice_print_cache.prefetch(issued)
+    result = {'order_id': oid, 'job_id': job[0], 'success': status == 'done',
+              'invoice_no': number or invoice_no, 'status': status}
+    if status != 'done':
+        result['message'] = error or status
+        if status == 'queued':
+            result['message'] += ' (已排入佇列，稍後自動重試)'
+    return result
+
+
+def _bulk_one(oid, action, worker, invoice_no, reason, limiter):
+    """批次作業的單筆：限速後 run_order"""
+    limiter.wait()
+    return run_order(oid, action, worker, invoice_no, reason)
+
+
+def bulk_run(action, targets, worker, reason=None, concurrency=None, rate=None):
+    """
+    批次開立 / 作廢 targets ([(order_id, invoice_number), ...])，以 generator 依完成順序逐筆回傳結果 dict。
+    同時最多 concurrency 筆、每秒最多 rate 筆；每筆的結果都記在 invoice_outbox (claimed_by = worker)。
+    """
+    concurrency = max(1, concurrency or INVOICE_BULK_CONCURRENCY)
+    limiter = _RateLimiter(INVOICE_BULK_RATE if rate is None else rate)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='invoice-bulk') as pool:
+        futures = {pool.submit(_bulk_one, oid, action, worker, invoice_no, reason, limiter): oid
+                   for oid, invoice_no in targets}
+        try:
+            for future in as_completed(futures):
+                try:
+                    yield future.result()
+                except Exception as e:
+                    yield {'order_id': futures[future], 'success': False, 'message': f"系統錯誤: {e}"}
+        finally:
+            # 中途停止 (例如瀏覽器關閉串流) 時，還沒開始的訂單不再送出；送出中的會處理完
+            for future in futures:
+                future.cancel()
+
+
+def get_queue_stats(cur):
+    """各狀態的工作數與最舊待送工作的等待秒數"""
+    cur.execute("SELECT status, COUNT(*) FROM invoice_outbox GROUP BY status")
+    stats = dict(cur.fetchall())
+    cur.execute("SELECT EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - MIN(created_at)) FROM invoice_outbox WHERE status = 'queued'")
+    oldest = cur.fetchone()[0]
+    stats['oldest_queued_sec'] = round(float(oldest), 1) if oldest is not None else None
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="電子發票待送佇列工具")
+    parser.add_argument('command', choices=['status', 'retry'],
+                        help="status: 各狀態數量 / retry: 失敗的工作重新排入")
+    args = parser.parse_args(argv)
+
+    db_uri = os.environ.get("DATABASE_URL")
+    if not db_uri:
+        sys.exit("錯誤：找不到環境變數 DATABASE_URL")
+
+    conn = psycopg2.connect(db_uri)
+    try:
+        cur = conn.cursor()
+        if args.command == 'status':
+            for status, count in get_queue_stats(cur).items():
+                print(f"   {status:<18} {count}")
+            cur.execute("""
+                SELECT id, order_id, action, attempts, last_error FROM invoice_outbox
+                WHERE status = 'failed' ORDER BY id DESC LIMIT 20
+            """)
+            for row in cur.fetchall():
+                print(f"   ❌ #{row[0]} 訂單 {row[1]} {row[2]} (送出 {row[3]} 次): {row[4]}")
+        else:
+            # 已有同一張訂單同一動作處理中的工作時不重複排入
+            cur.execute("""
+                UPDATE invoice_outbox j SET status = 'queued', attempts = 0, next_attempt_at = CURRENT_TIMESTAMP
+                WHERE status = 'failed' AND NOT EXISTS (
+                    SELECT 1 FROM invoice_outbox a
+                    WHERE a.order_id = j.order_id AND a.action = j.action AND a.status IN ('queued', 'sending')
+                )
+            """)
+            print(f"🔄 已重新排入 {cur.rowcount} 筆失敗的發票工作")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+發票列印 HTML 快取 (invoice_print_cache 表)
+
+同一張已開立的發票，綠界回傳的 InvoiceHtml 永遠相同；第一次列印後存進資料庫，之後補印直接由快取回應，
+不必再做一次加密往返。多個 gunicorn worker / 重新部署後都共用同一份。
+
+- 發票作廢時呼叫 invalidate(cur, invoice_no) 刪除 (作廢後再印會重新向綠界取得，顯示作廢後的狀態)
+- 總大小超過 INVOICE_HTML_CACHE_MAX_MB 時，依 last_used_at 淘汰最久沒用的 (LRU)；不是每次寫入都檢查，
+  本行程每寫入 INVOICE_HTML_CACHE_TRIM_MB 才檢查一次總量 (上限可能暫時超出一點)
+- 向綠界取得 HTML 期間不占用連線池的連線 (列印逾時最長 15 秒)
+- INVOICE_HTML_PREFETCH=1 時，發票開立成功後立即預先取得 HTML，第一次列印也不必等綠界
+
+    get_invoice_html(invoice_no)     與 print_ecpay_invoice 相同的回傳格式，另加 cached
+    invalidate(cur, invoice_no)      在作廢發票的交易內呼叫
+    prefetch(invoice_no)             開立後預先取得 (prefetch_async 在背景執行緒執行)
+"""
+import os
+import threading
+
+from database import db_connection
+from ecpay_invoice import print_ecpay_invoice
+
+INVOICE_HTML_CACHE_MAX_MB = float(os.environ.get("INVOICE_HTML_CACHE_MAX_MB", "50"))  # 快取總大小上限 (MB)
+INVOICE_HTML_CACHE_TRIM_MB = float(os.environ.get("INVOICE_HTML_CACHE_TRIM_MB", "2"))  # 本行程每寫入多少 MB 檢查一次總大小
+INVOICE_HTML_PREFETCH = os.environ.get("INVOICE_HTML_PREFETCH", "1") == "1"           # 開立後預先取得列印 HTML
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'stored': 0, 'prefetched': 0, 'invalidated': 0, 'errors': 0}
+_unchecked_bytes = 0   # 本行程上次檢查總大小之後寫入的位元組數
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def get_stats():
+    """本行程的命中 / 未命中次數"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _lookup(cur, invoice_no):
+    cur.execute("""
+        UPDATE invoice_print_cache SET last_used_at = CURRENT_TIMESTAMP, hits = hits + 1
+        WHERE invoice_number = %s
+        RETURNING html
+    """, (invoice_no,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _store(cur, invoice_no, html):
+    """存入快取，回傳 True 表示本行程累計寫入已達 INVOICE_HTML_CACHE_TRIM_MB，該檢查總大小了"""
+    global _unchecked_bytes
+    size = len(html.encode('utf-8'))
+    cur.execute("""
+        INSERT INTO invoice_print_cache (invoice_number, html, bytes) VALUES (%s, %s, %s)
+        ON CONFLICT (invoice_number) DO UPDATE
+        SET html = EXCLUDED.html, bytes = EXCLUDED.bytes, last_used_at = CURRENT_TIMESTAMP
+    """, (invoice_no, html, size))
+    with _stats_lock:
+        _unchecked_bytes += size
+        if _unchecked_bytes < INVOICE_HTML_CACHE_TRIM_MB * 1024 * 1024:
+            return False
+        _unchecked_bytes = 0
+    return True
+
+
+def _trim(cur):
+    """總大小超過上限時淘汰舊資料 (由最近使用的往回累加大小，超過上限的全部刪除)，回傳淘汰筆數"""
+    limit = int(INVOICE_HTML_CACHE_MAX_MB * 1024 * 1024)
+    cur.execute("SELECT COALESCE(SUM(bytes), 0) FROM invoice_print_cache")
+    if cur.fetchone()[0] <= limit:
+        return 0
+    cur.execute("""
+        DELETE FROM invoice_print_cache WHERE invoice_number IN (
+            SELECT invoice_number FROM (
+                SELECT invoice_number,
+                       SUM(bytes) OVER (ORDER BY last_used_at DESC, invoice_number) AS running
+                FROM invoice_print_cache
+            ) t
+            WHERE running > %s
+        )
+    """, (limit,))
+    return cur.rowcount
+
+
+def _is_void(cur, invoice_no):
+    cur.execute("SELECT 1 FROM orders WHERE invoice_number = %s AND invoice_status = 'Void' LIMIT 1", (invoice_no,))
+    return cur.fetchone() is not None
+
+
+def _save(invoice_no, html):
+    """向綠界取得的 HTML 存入快取 (作廢的發票不存)；失敗只記錄"""
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            try:
+                if _is_void(cur, invoice_no):
+                    conn.rollback()
+                    return
+                check = _store(cur, invoice_no, html)
+                conn.commit()
+                _count('stored')
+                if check:
+                    evicted = _trim(cur)
+                    conn.commit()
+                    if evicted:
+                        print(f"🧹 發票列印快取超過 {INVOICE_HTML_CACHE_MAX_MB:g} MB，淘汰 {evicted} 筆")
+            except Exception:
+                conn.rollback()
+                raise
+    except Exception as e:
+        _count('errors')
+        print(f"⚠️ 發票列印快取寫入失敗 ({invoice_no}): {e}")
+
+
+def get_invoice_html(invoice_no):
+    """取得發票列印 HTML：有快取直接回傳，否則向綠界取得並存入 (作廢的發票不存)"""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        html = _lookup(cur, invoice_no)
+        conn.commit()
+    if html is not None:
+        _count('hits')
+        return {"success": True, "html": html, "cached": True}
+
+    # 呼叫綠界前已歸還連線，存入時再借一條
+    _count('misses')
+    result = print_ecpay_invoice(invoice_no)
+    if result.get("success") and result.get("html"):
+        _save(invoice_no, result["html"])
+    result["cached"] = False
+    return result
+
+
+def invalidate(cur, invoice_no):
+    """發票作廢時呼叫 (與更新 invoice_status 同一個交易)"""
+    if not invoice_no:
+        return
+    cur.execute("DELETE FROM invoice_print_cache WHERE invoice_number = %s", (invoice_no,))
+    if cur.rowcount:
+        _count('invalidated')
+
+
+def prefetch(invoice_no):
+    """開立成功後預先取得列印 HTML (INVOICE_HTML_PREFETCH=0 時不做事)；失敗只記錄，列印時會再取一次"""
+    if not INVOICE_HTML_PREFETCH or not invoice_no:
+        return
+    try:
+        result = get_invoice_html(invoice_no)
+        if result.get("success") and not result.get("cached"):
+            _count('prefetched')
+    except Exception as e:
+        _count('errors')
+        print(f"⚠️ 發票列印 HTML 預先取得失敗 ({invoice_no}): {e}")
+
+
+def prefetch_async(invoice_no):
+    """在背景執行緒 prefetch (給請求中的開立使用，不拖慢回應)"""
+    if INVOICE_HTML_PREFETCH and invoice_no:
+        threading.Thread(target=prefetch, args=(invoice_no,), name="invoice-html-prefetch", daemon=True).start()
@@ -0,0 +1,348 @@
+"""
+電子發票對帳 (本地 orders 與綠界)
+
+本地的 invoice_number / invoice_status 可能與綠界不一致 (例如舊版出餐時開立失敗、作廢失敗被吞掉、
+寫入了不認得的狀態值)。這裡定期向綠界查詢發票狀態：本地資料與綠界不同時直接修正本地，
+需要再呼叫綠界開立 / 作廢的則記錄下來 (後台「批次處理發票」可一次補齊)。
+
+- 只核對上次檢查點之後有變動的訂單 (orders.row_version，與看板增量查詢相同：以快照的 xmin 為界，不會漏掉)
+- 每批 INVOICE_RECONCILE_BATCH 筆、最多 INVOICE_RECONCILE_CONCURRENCY 筆同時查詢；每批處理完就記下游標，
+  中斷 (重新部署、綠界斷線) 後從游標繼續
+- 綠界查詢失敗時停在失敗的那一筆之前，下一輪再從那裡開始
+- 以發票號碼查詢要帶開立日期：orders.invoice_date，沒有時用開立工作的完成時間；都沒有 (舊發票) 時以下單日期推測，
+  查無資料再以訂單的 RelateNumber 確認，不會因為日期猜錯就誤報綠界沒有這張發票
+- 多個 gunicorn worker 同時啟動時以 advisory lock 確保同一時間只有一個在對帳
+- 差異記錄在 invoice_discrepancies (種類見 migrations/0013_invoice_reconcile.sql)
+
+指令：
+    python invoice_reconcile.py run          立即對帳一輪
+    python invoice_reconcile.py report       最近的差異報表 (--days 天數)
+    python invoice_reconcile.py status       檢查點與上一輪的統計
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+import invoice_print_cache
+from database import db_connection
+from business_day import TW_OFFSET
+from kitchen_events import notify_order_changed
+from ecpay_invoice import query_ecpay_invoice
+from invoice_outbox import relate_number
+
+INVOICE_RECONCILE_INTERVAL = int(os.environ.get("INVOICE_RECONCILE_INTERVAL", "300"))         # 背景對帳間隔 (秒，0 = 不自動執行)
+INVOICE_RECONCILE_BATCH = int(os.environ.get("INVOICE_RECONCILE_BATCH", "50"))                # 每批核對的訂單數
+INVOICE_RECONCILE_CONCURRENCY = int(os.environ.get("INVOICE_RECONCILE_CONCURRENCY", "4"))     # 同時查詢綠界的筆數
+INVOICE_RECONCILE_MAX_ORDERS = int(os.environ.get("INVOICE_RECONCILE_MAX_ORDERS", "2000"))    # 每輪最多核對幾筆 (其餘下一輪繼續)
+INVOICE_RECONCILE_LOOKBACK_DAYS = int(os.environ.get("INVOICE_RECONCILE_LOOKBACK_DAYS", "14"))  # 只核對最近幾天建立的訂單
+RECONCILE_LOCK_KEY = 0x494E5652   # pg_advisory_lock 的 key ('INVR')
+
+
+# ==========================================
+# 🔎 單筆核對 (只查詢綠界，不寫資料庫；在執行緒池中執行)
+# ==========================================
+def _invoice_date(inv_no, invoice_date, created_at, jobs):
+    """
+    以發票號碼查詢時要帶的開立日期 (與 invoice_outbox.invoice_date_of 相同的順序)：
+    orders.invoice_date -> 開立這張發票的佇列工作完成時間 -> 下單日期。回傳 (日期, 是否為推測)
+    """
+    if invoice_date:
+        return invoice_date.strftime('%Y-%m-%d'), False
+    done = [done_at for job_id, action, status, number, done_at in sorted(jobs, reverse=True)
+            if action == 'issue' and status == 'done' and number == inv_no and done_at]
+    if done:
+        return (done[0] + TW_OFFSET).strftime('%Y-%m-%d'), False
+    return (created_at + TW_OFFSET).strftime('%Y-%m-%d'), True
+
+
+def _finding(kind, remote_status=None, repair=None, detail=None):
+    """repair 為 (發票號碼, 發票狀態, 開立日期或 None)：要把本地改成的值；None 表示需人工處理"""
+    return {'kind': kind, 'remote_status': remote_status, 'repair': repair, 'detail': detail}
+
+
+def check_order(order, jobs):
+    """
+    核對一筆訂單，回傳差異 dict、一致時回傳 None；綠界查詢失敗時回傳 {'error': 訊息}
+    order = (id, status, invoice_number, invoice_status, created_at, invoice_void_count, invoice_date)
+    jobs  = 這張訂單的發票佇列工作 [(job_id, action, status, invoice_number, done_at), ...]
+    """
+    oid, status, inv_no, inv_status, created_at, void_count, invoice_date = order
+    if any(job[2] in ('queued', 'sending') for job in jobs):
+        return None  # 發票佇列處理中，完成後訂單會再變動，下一輪再核對
+
+    if inv_no:
+        date, guessed = _invoice_date(inv_no, invoice_date, created_at, jobs)
+        res = query_ecpay_invoice(invoice_no=inv_no, invoice_date=date)
+        if res.get('success') and not res.get('found') and guessed:
+            # 沒有開立日期的紀錄、以下單日期推測可能不對：改以訂單的 RelateNumber 查詢
+            by_relate = query_ecpay_invoice(relate_number=relate_number(oid, void_count))
+            if not by_relate.get('success') or by_relate.get('invoice_no') == inv_no:
+                res = by_relate
+        if not res.get('success'):
+            return {'error': res.get('message')}
+        if not res.get('found'):
+            return _finding('missing_remote', 'NotFound', detail=res.get('message'))
+        remote = 'Void' if res.get('voided') else 'Issued'
+        repair_date = res.get('invoice_date')
+        if remote == 'Void' and inv_status != 'Void':
+            return _finding('voided_remote', remote, repair=(inv_no, 'Void', repair_date))
+        if remote == 'Issued' and inv_status == 'Void':
+            return _finding('void_not_remote', remote, repair=(inv_no, 'Issued', repair_date))
+        if remote == 'Issued' and inv_status != 'Issued':
+            return _finding('status_normalized', remote, repair=(inv_no, 'Issued', repair_date))
+        if remote == 'Issued' and status == 'Cancelled':
+            return _finding('cancelled_not_voided', remote)
+        return None
+
+    # 沒有發票號碼：佇列曾經送出的開立可能其實已經開出 (回應遺失)
+    if any(job[1] == 'issue' for job in jobs):
+        rn = relate_number(oid, void_count)
+        res = query_ecpay_invoice(relate_number=rn)
+        if not res.get('success'):
+            return {'error': res.get('message')}
+        if res.get('found'):
+            remote = 'Void' if res.get('voided') else 'Issued'
+            return _finding('issued_remote_only', remote, repair=(res.get('invoice_no'), remote, res.get('invoice_date')),
+                            detail=rn)
+    if status == 'Completed' and inv_status != 'Void':
+        return _finding('not_issued', 'NotFound')
+    return None
+
+
+# ==========================================
+# 🧾 對帳一輪
+# ==========================================
+def _begin(cur):
+    """沒有進行中的一輪時開始新的一輪：核對 [檢查點, 目前快照的 xmin) 之間有變動的訂單"""
+    cur.execute("""
+        UPDATE invoice_reconcile_state
+        SET run_target = pg_snapshot_xmin(pg_current_snapshot()), cursor_version = checkpoint, cursor_id = 0
+        WHERE id = 1 AND run_target IS NULL
+    """)
+    cur.execute("""
+        SELECT checkpoint::text, run_target::text, cursor_version::text, cursor_id
+        FROM invoice_reconcile_state WHERE id = 1
+    """)
+    return cur.fetchone()
+
+
+def _fetch_batch(cur, target, cursor_version, cursor_id, limit):
+    """游標之後、本輪上限之前有變動的最近訂單 (待處理的訂單不核對，但游標照樣前進)"""
+    cur.execute("""
+        SELECT id, status, invoice_number, invoice_status, created_at, invoice_void_count, invoice_date,
+               row_version::text
+        FROM orders
+        WHERE (row_version, id) > (%s::xid8, %s) AND row_version < %s::xid8
+          AND created_at >= %s
+        ORDER BY row_version, id
+        LIMIT %s
+    """, (cursor_version, cursor_id, target,
+          datetime.utcnow() - timedelta(days=INVOICE_RECONCILE_LOOKBACK_DAYS), limit))
+    return cur.fetchall()
+
+
+def _load_jobs(cur, oids):
+    cur.execute("""
+        SELECT order_id, id, action, status, invoice_number, done_at FROM invoice_outbox WHERE order_id = ANY(%s)
+    """, (oids,))
+    jobs = {}
+    for row in cur.fetchall():
+        jobs.setdefault(row[0], []).append(tuple(row[1:]))
+    return jobs
+
+
+def _apply(cur, order, found):
+    """修正本地資料 (訂單在核對期間被改過就不動，等下一輪) 並記錄差異，回傳 'repaired' / 'reported' / None"""
+    oid, status, inv_no, inv_status = order[:4]
+    action = 'reported'
+    if found['repair']:
+        new_no, new_status, new_date = found['repair']
+        cur.execute("""
+            UPDATE orders SET invoice_number = %s, invoice_status = %s, invoice_date = COALESCE(%s, invoice_date)
+            WHERE id = %s AND invoice_number IS NOT DISTINCT FROM %s AND invoice_status IS NOT DISTINCT FROM %s
+        """, (new_no, new_status, new_date, oid, inv_no, inv_status))
+        if not cur.rowcount:
+            return None
+        if new_status == 'Void':
+            invoice_print_cache.invalidate(cur, new_no)
+        notify_order_changed(cur, oid)
+        action = 'repaired'
+    cur.execute("""
+        INSERT INTO invoice_discrepancies (order_id, invoice_number, kind, action, local_status, remote_status, detail)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, (oid, found['repair'][0] if found['repair'] else inv_no, found['kind'], action,
+          (inv_status or '')[:20] or None, found['remote_status'], found['detail']))
+    return action
+
+
+def _run(conn, cur, max_orders, concurrency, batch_size):
+    checkpoint, target, cursor_version, cursor_id = _begin(cur)
+    conn.commit()
+    summary = {'checked': 0, 'repaired': 0, 'reported': 0, 'finished': False}
+    t0 = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='invoice-reconcile') as pool:
+        while summary['checked'] < max_orders:
+            rows = _fetch_batch(cur, target, cursor_version, cursor_id, min(batch_size, max_orders - summary['checked']))
+            if not rows:
+                # 這一輪核對完畢：檢查點前進到本輪上限
+                cur.execute("""
+                    UPDATE invoice_reconcile_state
+                    SET checkpoint = run_target, run_target = NULL, cursor_version = NULL, cursor_id = NULL
+                    WHERE id = 1
+                """)
+                summary['finished'] = True
+                break
+
+            orders = [r[:7] for r in rows if r[1] != 'Pending']
+            jobs = _load_jobs(cur, [o[0] for o in orders]) if orders else {}
+            conn.commit()  # 查詢綠界期間不持有交易
+            results = dict(zip([o[0] for o in orders],
+                               pool.map(lambda o: check_order(o, jobs.get(o[0], [])), orders)))
+
+            # 依游標順序套用；遇到查詢失敗就停在那一筆之前
+            error = None
+            done = 0
+            for row in rows:
+                found = results.get(row[0])
+                if found and found.get('error'):
+                    error = found['error']
+                    break
+                if found:
+                    action = _apply(cur, row[:7], found)
+                    if action:
+                        summary[action] += 1
+                if row[1] != 'Pending':
+                    summary['checked'] += 1
+                done += 1
+            if done:
+                cursor_version, cursor_id = rows[done - 1][7], rows[done - 1][0]
+                cur.execute("UPDATE invoice_reconcile_state SET cursor_version = %s::xid8, cursor_id = %s WHERE id = 1",
+                            (cursor_version, cursor_id))
+            conn.commit()
+            if error:
+                summary['error'] = error
+                break
+
+    summary['seconds'] = round(time.monotonic() - t0, 2)
+    cur.execute("UPDATE invoice_reconcile_state SET last_run_at = CURRENT_TIMESTAMP, last_summary = %s WHERE id = 1",
+                (json.dumps(summary, ensure_ascii=False),))
+    conn.commit()
+    return summary
+
+
+def run_once(max_orders=None, concurrency=None, batch_size=None):
+    """對帳一輪 (或繼續上一輪)，回傳統計；已有其他行程在對帳時回傳 None"""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_try_advisory_lock(%s)", (RECONCILE_LOCK_KEY,))
+        got = cur.fetchone()[0]
+        conn.commit()
+        if not got:
+            return None
+        try:
+            summary = _run(conn, cur, max_orders or INVOICE_RECONCILE_MAX_ORDERS,
+                           concurrency or INVOICE_RECONCILE_CONCURRENCY, batch_size or INVOICE_RECONCILE_BATCH)
+        finally:
+            conn.rollback()
+            cur.execute("SELECT pg_advisory_unlock(%s)", (RECONCILE_LOCK_KEY,))
+            conn.commit()
+    if summary['repaired'] or summary['reported'] or summary.get('error'):
+        print(f"🧾 發票對帳：核對 {summary['checked']} 筆、修正 {summary['repaired']} 筆、需處理 {summary['reported']} 筆"
+              + (f"，查詢中斷: {summary['error']}" if summary.get('error') else ""))
+    return summary
+
+
+# ==========================================
+# 🔁 背景對帳
+# ==========================================
+_worker_pid = None
+
+
+def _worker_loop():
+    time.sleep(60)  # 等啟動時的其他工作先跑完
+    while True:
+        try:
+            run_once()
+        except Exception as e:
+            print(f"⚠️ 發票對帳錯誤: {e}")
+        time.sleep(INVOICE_RECONCILE_INTERVAL)
+
+
+def start_worker():
+    """啟動本行程的對帳執行緒 (每個 gunicorn worker 都會啟動，實際對帳時以 advisory lock 只跑一個)"""
+    global _worker_pid
+    if INVOICE_RECONCILE_INTERVAL <= 0 or _worker_pid == os.getpid():
+        return
+    _worker_pid = os.getpid()
+    threading.Thread(target=_worker_loop, name="invoice-reconcile", daemon=True).start()
+
+
+# ==========================================
+# 📋 差異報表
+# ==========================================
+def get_report(cur, days=1):
+    """最近 days 天的差異：({(種類, 處理方式): 筆數}, [需人工處理的明細])"""
+    cur.execute("""
+        SELECT kind, action, COUNT(*) FROM invoice_discrepancies
+        WHERE created_at >= CURRENT_TIMESTAMP - make_interval(days => %s)
+        GROUP BY kind, action ORDER BY kind, action
+    """, (days,))
+    counts = {(kind, action): n for kind, action, n in cur.fetchall()}
+    cur.execute("""
+        SELECT id, order_id, invoice_number, kind, local_status, remote_status, detail, created_at
+        FROM invoice_discrepancies
+        WHERE action = 'reported' AND created_at >= CURRENT_TIMESTAMP - make_interval(days => %s)
+        ORDER BY id DESC LIMIT 200
+    """, (days,))
+    return counts, cur.fetchall()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="電子發票對帳工具")
+    parser.add_argument('command', choices=['run', 'report', 'status'],
+                        help="run: 立即對帳一輪 / report: 差異報表 / status: 檢查點與上一輪統計")
+    parser.add_argument('--days', type=int, default=1, help="report 的天數 (預設 1)")
+    args = parser.parse_args(argv)
+
+    if not os.environ.get("DATABASE_URL"):
+        sys.exit("錯誤：找不到環境變數 DATABASE_URL")
+
+    if args.command == 'run':
+        summary = run_once()
+        print("⏳ 已有其他行程在對帳" if summary is None else f"✅ {json.dumps(summary, ensure_ascii=False)}")
+        return
+
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    try:
+        cur = conn.cursor()
+        if args.command == 'status':
+            cur.execute("""
+                SELECT checkpoint, run_target, cursor_version, cursor_id, last_run_at, last_summary
+                FROM invoice_reconcile_state WHERE id = 1
+            """)
+            checkpoint, target, cv, cid, last_run, last_summary = cur.fetchone()
+            print(f"   檢查點 {checkpoint}" + (f"，進行中的一輪到 {target} (游標 {cv}/{cid})" if target else ""))
+            print(f"   上一輪 {last_run or '-'}: {last_summary or '-'}")
+        else:
+            counts, rows = get_report(cur, args.days)
+            print(f"📋 最近 {args.days} 天的發票差異")
+            for (kind, action), n in counts.items():
+                print(f"   {kind:<22} {'已修正' if action == 'repaired' else '需處理'} {n}")
+            for _, oid, inv_no, kind, local, remote, detail, created_at in rows:
+                print(f"   ⚠️ 訂單 #{oid} {inv_no or '-'} {kind}: 本地 {local or '-'} / 綠界 {remote or '-'}"
+                      + (f" ({detail})" if detail else ""))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+廚房看板即時推播 (Server-Sent Events)
+
+下單、出餐、作廢時在同一個交易內呼叫 notify_order_changed(cur, oid)，commit 後 PostgreSQL 會
+NOTIFY 到 orders_changed 頻道；每個 worker 的 LISTEN 執行緒 (db_events) 收到後，轉發給本 worker
+所有連上 /kitchen/stream 的看板。看板收到事件後才呼叫 check_new_orders 取得增量資料，
+不必再每 3 秒輪詢一次。
+
+⚠️ 每條 SSE 連線會佔住一個 worker 執行緒，請以 gthread 啟動，例如：
+    gunicorn app:app --worker-class gthread --workers 2 --threads 16
+超過 KITCHEN_STREAM_MAX_CLIENTS 或 LISTEN 關閉時回應 503，看板會自動改回輪詢。
+"""
+import os
+import json
+import time
+import queue
+import threading
+
+import db_events
+
+CHANNEL = 'orders_changed'
+KITCHEN_STREAM_MAX_CLIENTS = int(os.environ.get("KITCHEN_STREAM_MAX_CLIENTS", "20"))  # 單一 worker 最多幾條推播連線
+KITCHEN_STREAM_HEARTBEAT = float(os.environ.get("KITCHEN_STREAM_HEARTBEAT", "15"))    # 幾秒沒事件就送一次心跳
+KITCHEN_STREAM_MAX_AGE = float(os.environ.get("KITCHEN_STREAM_MAX_AGE", "300"))       # 連線最長秒數，到期由瀏覽器自動重連
+
+_lock = threading.Lock()
+_clients = set()         # 每條連線一個 queue
+_subscribed_pid = None
+_stats = {
+    'connects': 0,       # 累計連線次數
+    'rejected': 0,       # 因連線數已滿被拒絕的次數
+    'events': 0,         # 收到的 NOTIFY 次數
+    'delivered': 0,      # 實際送到看板的事件數
+}
+
+
+def notify_order_changed(cur, oid, kind='update'):
+    """在修改訂單的交易內呼叫；commit 後所有 worker 的看板都會收到 (rollback 則不會送出)"""
+    db_events.notify(cur, CHANNEL, json.dumps({'id': oid, 'kind': kind}))
+
+
+def stream_available():
+    """本 worker 是否能提供推播 (LISTEN 已關閉時看板需改用輪詢)"""
+    return db_events.DB_EVENTS_ENABLED
+
+
+def _broadcast(payload):
+    with _lock:
+        _stats['events'] += 1
+        clients = list(_clients)
+    for q in clients:
+        try:
+            q.put_nowait(payload)
+        except queue.Full:
+            pass  # 看板還沒處理上一個事件；它下一次輪詢會一併拿到所有變動，不必重複通知
+
+
+def _resync():
+    """LISTEN 重新連線期間可能漏接通知，讓所有看板各自重新整理一次"""
+    _broadcast(json.dumps({'kind': 'resync'}))
+
+
+def _ensure_subscribed():
+    global _subscribed_pid
+    if _subscribed_pid == os.getpid():
+        return
+    with _lock:
+        if _subscribed_pid == os.getpid():
+            return
+        _subscribed_pid = os.getpid()
+    db_events.on_reconnect(_resync)
+    db_events.subscribe(CHANNEL, _broadcast)
+
+
+def open_stream():
+    """
+    註冊一條看板連線，回傳 SSE 內容的 generator；連線數已滿時回傳 None。
+    每個看板的 queue 只保留一個待送事件 (事件只是「有變動」的提醒，內容由 check_new_orders 提供)。
+    """
+    _ensure_subscribed()
+    with _lock:
+        if len(_clients) >= KITCHEN_STREAM_MAX_CLIENTS:
+            _stats['rejected'] += 1
+            return None
+
+    def generate():
+        # 在 generator 開始執行時才登記，確保連線結束 (finally) 一定會移除
+        q = queue.Queue(maxsize=1)
+        with _lock:
+            _clients.add(q)
+            _stats['connects'] += 1
+        try:
+            yield "retry: 3000\n\n"
+            yield "event: hello\ndata: {}\n\n"
+            deadline = time.time() + KITCHEN_STREAM_MAX_AGE
+            while time.time() < deadline:
+                try:
+                    payload = q.get(timeout=KITCHEN_STREAM_HEARTBEAT)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                with _lock:
+                    _stats['delivered'] += 1
+                yield f"event: orders\ndata: {payload}\n\n"
+        finally:
+            with _lock:
+                _clients.discard(q)
+
+    return generate()
+
+
+def get_stream_stats():
+    """本 worker 的推播統計"""
+    with _lock:
+        stats = dict(_stats)
+        stats['clients'] = len(_clients)
+    stats['listening'] = db_events.is_listening()
+    return stats
@@ -0,0 +1,212 @@
+"""
+資料庫結構版本管理 (Schema Migration)
+
+migrations/ 資料夾內的檔案依檔名編號依序套用，每個檔案只會執行一次：
+    0001_base_schema.sql      -> 純 SQL
+    0003_default_admin.py     -> Python，需定義 upgrade(cur)
+
+SQL 檔第一行若為 "-- migrate:no-transaction"，則逐句以 autocommit 執行
+(例如 CREATE INDEX CONCURRENTLY 不能包在交易裡)。
+
+Python migration 可另外定義 requires_manual(cur)：回傳原因字串時 (例如要鎖住大表整批搬移資料)，
+worker 啟動時的自動套用 (database.init_db) 會停在這個版本，必須由 python migrate.py up 手動執行。
+
+已套用的版本記錄在 schema_version 表。
+應用程式啟動時只會執行一次 SELECT 比對版本，結構已是最新就直接跳過。
+
+指令 (部署時在啟動 gunicorn 之前執行)：
+    python migrate.py            套用所有尚未執行的 migration
+    python migrate.py status     查看目前版本與待套用清單
+"""
+import os
+import re
+import sys
+import argparse
+import importlib.util
+
+import psycopg2
+import psycopg2.errors
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+_FILE_PATTERN = re.compile(r'^(\d{4})_(\w+)\.(sql|py)$')
+
+# 多個 worker 同時啟動時，用 advisory lock 確保只有一個人在跑 migration
+_ADVISORY_LOCK_ID = 80420001
+
+
+def list_migrations():
+    """依版本排序列出所有 migration 檔案: [(version, name, path), ...]"""
+    found = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        m = _FILE_PATTERN.match(filename)
+        if m:
+            found.append((int(m.group(1)), m.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    found.sort()
+
+    versions = [v for v, _, _ in found]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"migrations/ 內有重複的版本號: {versions}")
+    return found
+
+
+def latest_version():
+    """程式碼中最新的結構版本"""
+    migrations = list_migrations()
+    return migrations[-1][0] if migrations else 0
+
+
+def current_version(cur):
+    """資料庫目前的結構版本 (尚未建立 schema_version 表時回傳 0)"""
+    try:
+        cur.execute("SELECT MAX(version) FROM schema_version")
+        return cur.fetchone()[0] or 0
+    except psycopg2.errors.UndefinedTable:
+        cur.connection.rollback()
+        return 0
+
+
+_NO_TRANSACTION_MARK = '-- migrate:no-transaction'
+
+
+def _read_sql(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def _is_no_transaction(path):
+    return path.endswith('.sql') and _read_sql(path).lstrip().startswith(_NO_TRANSACTION_MARK)
+
+
+def _split_statements(sql):
+    """把 SQL 檔拆成單句 (只用於 no-transaction 檔案，內容不可包含 $$ 函式本體)"""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    return [stmt.strip() for stmt in "\n".join(lines).split(';') if stmt.strip()]
+
+
+def _load_module(path):
+    spec = importlib.util.spec_from_file_location(f"migration_{os.path.basename(path)[:-3]}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _run_migration(cur, path):
+    if path.endswith('.sql'):
+        cur.execute(_read_sql(path))
+    else:
+        _load_module(path).upgrade(cur)
+
+
+def _manual_reason(cur, path):
+    """Python migration 的 requires_manual(cur)：需要手動執行時回傳原因，否則 None"""
+    if not path.endswith('.py'):
+        return None
+    check = getattr(_load_module(path), 'requires_manual', None)
+    return check(cur) if check else None
+
+
+def apply_migrations(conn, verbose=True, auto=False):
+    """
+    套用所有尚未執行的 migration。
+    每個 migration 與其 schema_version 記錄在同一個交易中提交，失敗時整個 migration 回滾。
+    auto=True (worker 啟動時自動套用) 遇到 requires_manual 的 migration 就停下，之後的版本也不套用。
+    回傳本次套用的版本清單。
+    """
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("SELECT pg_advisory_lock(%s)", (_ADVISORY_LOCK_ID,))
+    applied = []
+    blocked = None
+    try:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,                   -- migration 編號
+                name TEXT NOT NULL,                            -- migration 名稱
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP -- 套用時間
+            )
+        """)
+        # 取得鎖之後再讀一次版本，其他 worker 可能剛剛已經套用完畢
+        current = current_version(cur)
+        conn.autocommit = False
+
+        for version, name, path in list_migrations():
+            if version <= current:
+                continue
+            if auto:
+                reason = _manual_reason(cur, path)
+                conn.rollback()
+                if reason:
+                    print(f"⛔ migration {version:04d}_{name} 不會在啟動時自動執行：{reason}。"
+                          f"請在打烊後執行: python migrate.py up")
+                    blocked = version
+                    break
+            if verbose:
+                print(f"🔄 套用資料庫 migration {version:04d}_{name} ...")
+
+            if _is_no_transaction(path):
+                # 逐句 autocommit 執行；每句都需可重複執行 (IF NOT EXISTS)，中途失敗重跑即可
+                conn.autocommit = True
+                try:
+                    for stmt in _split_statements(_read_sql(path)):
+                        cur.execute(stmt)
+                    cur.execute("INSERT INTO schema_version (version, name) VALUES (%s, %s)", (version, name))
+                except Exception:
+                    print(f"❌ migration {version:04d}_{name} 失敗 (no-transaction，已執行的語句不會回滾，修正後重跑即可)")
+                    raise
+                conn.autocommit = False
+                applied.append(version)
+                continue
+
+            try:
+                _run_migration(cur, path)
+                cur.execute("INSERT INTO schema_version (version, name) VALUES (%s, %s)", (version, name))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                print(f"❌ migration {version:04d}_{name} 失敗，已回滾")
+                raise
+            applied.append(version)
+    finally:
+        conn.rollback()
+        conn.autocommit = True
+        cur.execute("SELECT pg_advisory_unlock(%s)", (_ADVISORY_LOCK_ID,))
+        cur.close()
+
+    if verbose:
+        if blocked:
+            print(f"⚠️ 資料庫結構停在版本 {(applied[-1] if applied else current):04d}，"
+                  f"{blocked:04d} 之後的 migration 尚未套用")
+        elif applied:
+            print(f"✅ 資料庫結構已更新至版本 {applied[-1]:04d} (本次套用 {len(applied)} 個)")
+        else:
+            print("✅ 資料庫結構已是最新版本")
+    return applied
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="資料庫結構版本管理")
+    parser.add_argument('command', nargs='?', default='up', choices=['up', 'status'],
+                        help="up: 套用待執行的 migration (預設); status: 顯示目前版本")
+    args = parser.parse_args(argv)
+
+    db_uri = os.environ.get("DATABASE_URL")
+    if not db_uri:
+        sys.exit("錯誤：找不到環境變數 DATABASE_URL")
+
+    conn = psycopg2.connect(db_uri)
+    try:
+        if args.command == 'status':
+            cur = conn.cursor()
+            current = current_version(cur)
+            print(f"目前版本: {current:04d} / 最新版本: {latest_version():04d}")
+            for version, name, _ in list_migrations():
+                mark = "✅" if version <= current else "⏳"
+                print(f"  {mark} {version:04d}_{name}")
+        else:
+            apply_migrations(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
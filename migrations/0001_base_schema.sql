@@ -0,0 +1,115 @@
+-- ==========================================
+-- 0001 基礎資料表 (對應舊版 init_db 的 CREATE TABLE 與欄位補全)
+-- 舊資料庫已經有這些表格，因此全部使用 IF NOT EXISTS，可安全重複套用
+-- ==========================================
+
+-- 1. 產品表 (products)
+CREATE TABLE IF NOT EXISTS products (
+    id SERIAL PRIMARY KEY,            -- 自動遞增的主鍵 ID
+    name VARCHAR(100) NOT NULL,       -- 產品名稱（必填）
+    price INTEGER NOT NULL,           -- 價格（必填）
+    category VARCHAR(50),             -- 分類名稱
+    image_url TEXT,                   -- 圖片網址
+    is_available BOOLEAN DEFAULT TRUE,-- 是否上架（預設為是）
+    custom_options TEXT,              -- 自定義選項（如：辣度、冰塊）
+    sort_order INTEGER DEFAULT 100,   -- 排序序號
+    name_en VARCHAR(100),             -- 英文品名
+    name_jp VARCHAR(100),             -- 日文品名
+    name_kr VARCHAR(100),             -- 韓文品名
+    custom_options_en TEXT,           -- 英文自定義選項
+    custom_options_jp TEXT,           -- 日文自定義選項
+    custom_options_kr TEXT,           -- 韓文自定義選項
+    print_category VARCHAR(20) DEFAULT 'Noodle', -- 出單分類（用於廚房出單）
+    category_en VARCHAR(50),          -- 英文分類名
+    category_jp VARCHAR(50),          -- 日文分類名
+    category_kr VARCHAR(50)           -- 韓文分類名
+);
+
+-- 2. 訂單表 (orders)
+CREATE TABLE IF NOT EXISTS orders (
+    id SERIAL PRIMARY KEY,            -- 訂單 ID
+    table_number VARCHAR(10),         -- 桌號
+    items TEXT NOT NULL,              -- 訂單項目內容（文字描述）
+    total_price INTEGER NOT NULL,     -- 總金額
+    status VARCHAR(20) DEFAULT 'Pending', -- 訂單狀態（預設為待處理）
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, -- 建立時間
+    daily_seq INTEGER DEFAULT 0,      -- 當日流水號
+    content_json TEXT,                -- 以 JSON 格式存儲的訂單明細
+    need_receipt BOOLEAN DEFAULT FALSE, -- 是否需要收據
+    lang VARCHAR(10) DEFAULT 'zh',    -- 下單時使用的語系
+
+    -- 外送相關欄位
+    order_type VARCHAR(50) DEFAULT 'dine_in', -- 訂單類型（內用/外送/自取）
+    delivery_info TEXT,               -- 綜合外送資訊
+    customer_name TEXT,               -- 客戶姓名
+    customer_phone TEXT,              -- 客戶電話
+    customer_address TEXT,            -- 客戶地址
+    scheduled_for TEXT,               -- 預約送達時間
+    delivery_fee INTEGER DEFAULT 0,   -- 外送費
+
+    -- 綠界電子發票相關欄位
+    invoice_number VARCHAR(50),       -- 發票號碼 (例: AB12345678)
+    invoice_status VARCHAR(20) DEFAULT 'Not Issued', -- 發票狀態 (Not Issued: 未開立, Issued: 已開立, Void: 已作廢)
+    tax_id VARCHAR(15),               -- 統一編號 (買方統編)
+    carrier_type VARCHAR(10),         -- 載具類別 (1: 綠界, 2: 自然人憑證, 3: 手機條碼, don: 捐贈)
+    carrier_num VARCHAR(50)           -- 載具隱碼 (例: /AB12345)
+);
+
+-- 3. 系統設定表 (settings)
+CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT);
+
+-- 4. 使用者資料表 (users)
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,            -- 使用者 ID
+    username VARCHAR(50) UNIQUE NOT NULL, -- 帳號名稱 (必須唯一)
+    password_hash TEXT NOT NULL,      -- 密碼的雜湊值 (絕對不存明文)
+    role VARCHAR(20) DEFAULT 'admin', -- 角色權限 (例如: admin, staff)
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP -- 建立時間
+);
+
+-- 5. 舊資料庫欄位補全 (早期版本建立的表格可能缺少這些欄位)
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS lang VARCHAR(10) DEFAULT 'zh';
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS content_json TEXT;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS order_type VARCHAR(50) DEFAULT 'dine_in';
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS delivery_info TEXT;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS customer_name TEXT;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS customer_phone TEXT;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS customer_address TEXT;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS scheduled_for TEXT;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS delivery_fee INTEGER DEFAULT 0;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS invoice_number VARCHAR(50);
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS invoice_status VARCHAR(20) DEFAULT 'Not Issued';
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS tax_id VARCHAR(15);
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS carrier_type VARCHAR(10);
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS carrier_num VARCHAR(50);
+
+ALTER TABLE products ADD COLUMN IF NOT EXISTS sort_order INTEGER DEFAULT 100;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS print_category VARCHAR(20) DEFAULT 'Noodle';
+ALTER TABLE products ADD COLUMN IF NOT EXISTS name_en VARCHAR(100);
+ALTER TABLE products ADD COLUMN IF NOT EXISTS name_jp VARCHAR(100);
+ALTER TABLE products ADD COLUMN IF NOT EXISTS name_kr VARCHAR(100);
+ALTER TABLE products ADD COLUMN IF NOT EXISTS category_en VARCHAR(50);
+ALTER TABLE products ADD COLUMN IF NOT EXISTS category_jp VARCHAR(50);
+ALTER TABLE products ADD COLUMN IF NOT EXISTS category_kr VARCHAR(50);
+ALTER TABLE products ADD COLUMN IF NOT EXISTS custom_options_en TEXT;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS custom_options_jp TEXT;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS custom_options_kr TEXT;
+
+-- 6. 發票欄位長度修復 (解決舊版 VARCHAR(1) 報錯問題)
+--    ALTER COLUMN TYPE 會鎖住整張 orders 表，因此只在長度真的不足時才執行
+DO $$
+DECLARE
+    col RECORD;
+BEGIN
+    FOR col IN
+        SELECT c.column_name, c.character_maximum_length AS cur_len, t.new_len
+        FROM information_schema.columns c
+        JOIN (VALUES ('carrier_type', 10), ('tax_id', 15), ('carrier_num', 50)) AS t(name, new_len)
+          ON t.name = c.column_name
+        WHERE c.table_schema = current_schema()
+          AND c.table_name = 'orders'
+          AND c.character_maximum_length < t.new_len
+    LOOP
+        EXECUTE format('ALTER TABLE orders ALTER COLUMN %I TYPE VARCHAR(%s)', col.column_name, col.new_len);
+    END LOOP;
+END $$;
@@ -0,0 +1,14 @@
+-- ==========================================
+-- 0002 預設系統設定
+-- Key 已經存在則跳過 (ON CONFLICT DO NOTHING)，不會覆蓋店家已修改過的值
+-- ==========================================
+INSERT INTO settings (key, value) VALUES
+    ('sender_email', 'onboarding@resend.dev'), -- 預設發信人郵件
+    ('shop_open', '1'),                        -- 預設全店營業中 (1: 開啟)
+    ('delivery_enabled', '1'),                 -- 是否啟用外送功能 (後端用)
+    ('enable_delivery', '1'),                  -- 前端按鈕可能使用的 key (保持相容)
+    ('delivery_min_price', '500'),             -- 外送起送價
+    ('delivery_fee_base', '0'),                -- 基礎外送費
+    ('delivery_max_km', '5'),                  -- 最大外送距離 (公里)
+    ('delivery_fee_per_km', '10')              -- 超過基礎距離後的每公里加價
+ON CONFLICT DO NOTHING;
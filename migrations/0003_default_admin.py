@@ -0,0 +1,22 @@
+# ==========================================
+# 0003 建立預設的 Admin 帳號 (僅在 users 表為空時)
+# ==========================================
+import bcrypt
+
+
+def upgrade(cur):
+    cur.execute("SELECT COUNT(*) FROM users")
+    if cur.fetchone()[0] > 0:
+        return
+
+    print("👤 尚未建立任何使用者，正在建立預設的 Admin 帳號...")
+    default_username = "admin"
+    default_password = "password123" # ⚠️ 請在登入後台後立即更改此密碼！
+
+    # 使用 bcrypt 對密碼進行雜湊處理
+    hashed_password = bcrypt.hashpw(default_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    cur.execute(
+        "INSERT INTO users (username, password_hash, role) VALUES (%s, %s, %s)",
+        (default_username, hashed_password, 'admin')
+    )
+    print(f"✅ 預設 Admin 帳號建立完成。帳號: {default_username} / 密碼: {default_password}")
@@ -0,0 +1,19 @@
+-- migrate:no-transaction
+-- ==========================================
+-- 0004 orders 熱門查詢索引
+-- 使用 CONCURRENTLY 建立，不會在營業中鎖住 orders 的寫入
+-- (若建立中斷留下 INVALID 索引，請先 DROP INDEX CONCURRENTLY 再重跑)
+-- ==========================================
+
+-- 廚房看板、日結報表、銷售排行：依建立時間 + 狀態篩選，再依流水號排序
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_created_status_seq
+    ON orders (created_at, status, daily_seq);
+
+-- 發票查詢 / 作廢：依發票號碼查單 (未開立的訂單不進索引)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_invoice_number
+    ON orders (invoice_number)
+    WHERE invoice_number IS NOT NULL;
+
+-- 客戶查詢：依電話 (+姓名) 查歷史訂單
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_customer_phone_name
+    ON orders (customer_phone, customer_name);
@@ -0,0 +1,18 @@
+-- ==========================================
+-- 0005 每日流水號計數表
+-- 取代下單時 LOCK TABLE orders + MAX(daily_seq) 的做法，
+-- 以台灣營業日為 key，每次下單只鎖住當天這一列
+-- ==========================================
+CREATE TABLE IF NOT EXISTS daily_counters (
+    business_date DATE PRIMARY KEY,    -- 台灣營業日 (UTC+8)
+    last_seq INTEGER NOT NULL DEFAULT 0 -- 當天已配發的最後一個流水號
+);
+
+-- 由既有訂單回填，讓升級當天的流水號接續下去不重複
+INSERT INTO daily_counters (business_date, last_seq)
+SELECT (created_at + interval '8 hours')::date, MAX(daily_seq)
+FROM orders
+WHERE daily_seq IS NOT NULL
+GROUP BY 1
+ON CONFLICT (business_date) DO UPDATE
+    SET last_seq = GREATEST(daily_counters.last_seq, EXCLUDED.last_seq);
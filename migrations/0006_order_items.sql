@@ -0,0 +1,19 @@
+-- ==========================================
+-- 0006 訂單明細正規化表 (order_items)
+-- 與 orders.content_json 同步寫入 (同一個交易)，報表直接 GROUP BY，不必逐筆解析 JSON
+-- 歷史訂單請執行: python order_items.py backfill
+-- ==========================================
+CREATE TABLE IF NOT EXISTS order_items (
+    id BIGSERIAL PRIMARY KEY,
+    order_id INTEGER NOT NULL REFERENCES orders(id) ON DELETE CASCADE, -- 所屬訂單 (刪單時一併刪除)
+    line_no INTEGER NOT NULL,            -- 在購物車中的順序 (從 1 開始)
+    product_id INTEGER,                  -- 商品 ID (歷史資料可能沒有)
+    product_name TEXT NOT NULL,          -- 商品中文名稱 (報表以此彙總)
+    qty INTEGER NOT NULL,                -- 數量
+    unit_price INTEGER NOT NULL,         -- 單價 (含加價選項)
+    options TEXT,                        -- 中文規格，以逗號分隔 (例: 大碗,加蛋)
+    print_category VARCHAR(20),          -- 出單分類 (Noodle / Soup / ...)
+    UNIQUE (order_id, line_no)
+);
+
+CREATE INDEX IF NOT EXISTS idx_order_items_product_name ON order_items (product_name);
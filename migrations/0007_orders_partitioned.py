@@ -0,0 +1,70 @@
+# ==========================================
+# 0007 orders 改為依月份分割 (PARTITION BY RANGE created_at)
+# 既有訂單會整批搬進新的分割表，搬移期間 orders 會被鎖住：已有訂單時不會在 worker 啟動時自動執行，
+# 請在打烊後執行 python migrate.py up
+#
+# - 主鍵改為 (id, created_at)：分割表的唯一鍵必須包含分割欄位 (id 仍由同一個 sequence 配發，不會重複)
+# - order_items.order_id 不再是外鍵 (無法參照不含 created_at 的 orders.id)，刪單時需自行刪除明細
+# - 月份分割的建立 / 封存見 order_partitions.py
+# ==========================================
+import order_partitions
+from business_day import TW_OFFSET
+
+
+def requires_manual(cur):
+    """orders 已有資料時，搬移期間要鎖住整張表 (所有點餐 / 廚房查詢都會卡住)，不能在 worker 啟動時執行"""
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = 'orders'::regclass")
+    if cur.fetchone()[0] == 'p':
+        return None
+    cur.execute("SELECT EXISTS (SELECT 1 FROM orders)")
+    if cur.fetchone()[0]:
+        return "orders 已有訂單，改為分割表需鎖住 orders 並整批搬移"
+    return None
+
+
+def upgrade(cur):
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = 'orders'::regclass")
+    if cur.fetchone()[0] == 'p':
+        return  # 已經是分割表
+
+    cur.execute("SELECT pg_get_serial_sequence('orders', 'id')")
+    id_seq = cur.fetchone()[0]
+
+    # 1. 舊表改名，並移除會與新表撞名的主鍵 / 索引 / 外鍵
+    cur.execute("LOCK TABLE orders IN ACCESS EXCLUSIVE MODE")
+    cur.execute("ALTER TABLE order_items DROP CONSTRAINT IF EXISTS order_items_order_id_fkey")
+    cur.execute("ALTER TABLE orders RENAME TO orders_legacy")
+    cur.execute("ALTER TABLE orders_legacy DROP CONSTRAINT IF EXISTS orders_pkey")
+    cur.execute("DROP INDEX IF EXISTS idx_orders_created_status_seq")
+    cur.execute("DROP INDEX IF EXISTS idx_orders_invoice_number")
+    cur.execute("DROP INDEX IF EXISTS idx_orders_customer_phone_name")
+    if id_seq:
+        cur.execute(f"ALTER SEQUENCE {id_seq} OWNED BY NONE")  # 避免 DROP 舊表時連 sequence 一起刪掉
+    cur.execute("UPDATE orders_legacy SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
+
+    # 2. 建立分割表 (欄位與預設值與舊表完全相同，id 繼續使用原本的 sequence)
+    cur.execute("CREATE TABLE orders (LIKE orders_legacy INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)")
+    cur.execute("ALTER TABLE orders ALTER COLUMN created_at SET NOT NULL")
+    cur.execute("ALTER TABLE orders ADD PRIMARY KEY (id, created_at)")
+    cur.execute(f"CREATE TABLE {order_partitions.DEFAULT_PARTITION} PARTITION OF orders DEFAULT")
+
+    # 與 0004 相同的熱門查詢索引 (建在分割表上，每個分割會自動建立)
+    cur.execute("CREATE INDEX idx_orders_created_status_seq ON orders (created_at, status, daily_seq)")
+    cur.execute("CREATE INDEX idx_orders_invoice_number ON orders (invoice_number) WHERE invoice_number IS NOT NULL")
+    cur.execute("CREATE INDEX idx_orders_customer_phone_name ON orders (customer_phone, customer_name)")
+
+    # 3. 建立既有資料涵蓋的月份到未來幾個月的分割，再整批搬移
+    cur.execute("SELECT MIN(created_at) FROM orders_legacy")
+    oldest = cur.fetchone()[0]
+    start = None
+    if oldest is not None:
+        tw_oldest = oldest + TW_OFFSET
+        start = (tw_oldest.year, tw_oldest.month)
+    created = order_partitions.ensure_partitions(cur, start=start)
+
+    cur.execute("INSERT INTO orders SELECT * FROM orders_legacy")
+    moved = cur.rowcount
+    cur.execute("DROP TABLE orders_legacy")
+    if id_seq:
+        cur.execute(f"ALTER SEQUENCE {id_seq} OWNED BY orders.id")
+    print(f"📦 orders 已改為月份分割表：{len(created)} 個分割，搬移 {moved} 筆訂單")
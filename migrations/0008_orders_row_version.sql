@@ -0,0 +1,22 @@
+-- ==========================================
+-- 0008 orders 資料列版本 (row_version / updated_at)
+-- 每次 INSERT / UPDATE 由 trigger 自動寫入目前交易的 ID (xid8)，
+-- 廚房看板只需查詢「版本 >= 上次游標」的訂單 (見 kitchen_routes.check_new_orders)
+-- 既有訂單的 row_version 為 0，第一次完整載入時一定會包含
+-- ==========================================
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP;          -- 最後修改時間 (UTC)
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS row_version xid8 NOT NULL DEFAULT '0'; -- 最後寫入的交易 ID
+
+CREATE OR REPLACE FUNCTION orders_touch_row_version() RETURNS trigger AS $$
+BEGIN
+    NEW.row_version := pg_current_xact_id();
+    NEW.updated_at := CURRENT_TIMESTAMP;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 建在分割表上，每個月份分割 (含之後新建的) 都會自動套用
+DROP TRIGGER IF EXISTS trg_orders_row_version ON orders;
+CREATE TRIGGER trg_orders_row_version
+    BEFORE INSERT OR UPDATE ON orders
+    FOR EACH ROW EXECUTE FUNCTION orders_touch_row_version();
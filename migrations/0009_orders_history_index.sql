@@ -0,0 +1,9 @@
+-- ==========================================
+-- 0009 廚房看板歷史訂單索引
+-- 看板即時區只放待處理 + 最近完成的訂單，較早的已完成 / 已作廢訂單由 /kitchen/history
+-- 依 (created_at, id) 由新到舊分頁 (keyset)，只需索引非待處理的訂單
+-- 建在分割表上，每個月份分割 (含之後新建的) 都會自動建立
+-- ==========================================
+CREATE INDEX IF NOT EXISTS idx_orders_history
+    ON orders (created_at, id)
+    WHERE status <> 'Pending';
@@ -0,0 +1,35 @@
+-- ==========================================
+-- 0010 列印工作佇列 (print_jobs)
+-- 下單時產生一次各角色的 ESC/POS 存成 payload，由看板 (WebUSB) 或列印程式領取後送印；
+-- 補印直接讀取最新一筆 payload，不必重新查商品表與重新產生
+-- 狀態：queued 待印 / printing 已領取 / done 完成 / failed 重試多次仍失敗 /
+--       held 只保存內容不自動列印 (例如不需要收據) / expired 太久沒人印
+-- ==========================================
+CREATE TABLE IF NOT EXISTS print_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    order_id INTEGER NOT NULL,               -- orders.id (orders 為分割表，不建外鍵)
+    role VARCHAR(20) NOT NULL,               -- receipt / noodle / soup / other
+    payload BYTEA NOT NULL,                  -- 可直接送給印表機的 ESC/POS
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,     -- 已領取次數
+    last_error TEXT,
+    claimed_by VARCHAR(100),                 -- 領取者 (看板 / 列印程式)
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, -- 失敗後的下次重試時間
+    claimed_at TIMESTAMP,
+    printed_at TIMESTAMP
+);
+
+-- 領取待印工作 (只索引 queued，完成的工作不影響領取速度)
+CREATE INDEX IF NOT EXISTS idx_print_jobs_queued
+    ON print_jobs (role, next_attempt_at, id)
+    WHERE status = 'queued';
+
+-- 補印：依訂單找各角色最新的內容
+CREATE INDEX IF NOT EXISTS idx_print_jobs_order_role
+    ON print_jobs (order_id, role, id);
+
+-- 找出領取後沒有回報的工作 (列印端當機)
+CREATE INDEX IF NOT EXISTS idx_print_jobs_printing
+    ON print_jobs (claimed_at)
+    WHERE status = 'printing';
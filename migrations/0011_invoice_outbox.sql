@@ -0,0 +1,41 @@
+-- ==========================================
+-- 0011 電子發票待送佇列 (invoice_outbox)
+-- 出餐 / 作廢時與訂單狀態在同一個交易內寫入，背景 worker 再呼叫綠界開立 / 作廢並寫回 orders，
+-- 收銀按鈕不必等綠界回應
+-- action：issue 開立 / void 作廢
+-- 狀態：queued 待送 / sending 送出中 / done 完成 / failed 重試多次仍失敗 / cancelled 不必再送 (例如訂單已作廢)
+-- 開立的 RelateNumber 固定為 ORDER{order_id} (作廢後重開加上 V{作廢次數}，見 0014)，重試時不會重複開立
+-- ==========================================
+CREATE TABLE IF NOT EXISTS invoice_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    order_id INTEGER NOT NULL,               -- orders.id (orders 為分割表，不建外鍵)
+    action VARCHAR(10) NOT NULL DEFAULT 'issue',
+    invoice_number VARCHAR(50),              -- void：要作廢的發票號碼 / issue：開立結果
+    reason VARCHAR(100),                     -- void 的作廢原因
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,     -- 已送出次數
+    last_error TEXT,
+    claimed_by VARCHAR(100),
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, -- 失敗後的下次重試時間
+    claimed_at TIMESTAMP,
+    done_at TIMESTAMP
+);
+
+-- 領取待送工作 (只索引 queued)
+CREATE INDEX IF NOT EXISTS idx_invoice_outbox_queued
+    ON invoice_outbox (next_attempt_at, id)
+    WHERE status = 'queued';
+
+-- 同一張訂單同一種動作同時只會有一筆在處理中
+CREATE UNIQUE INDEX IF NOT EXISTS idx_invoice_outbox_active
+    ON invoice_outbox (order_id, action)
+    WHERE status IN ('queued', 'sending');
+
+CREATE INDEX IF NOT EXISTS idx_invoice_outbox_order
+    ON invoice_outbox (order_id, id);
+
+-- 找出送出後 worker 沒有回報的工作 (worker 當機)
+CREATE INDEX IF NOT EXISTS idx_invoice_outbox_sending
+    ON invoice_outbox (claimed_at)
+    WHERE status = 'sending';
@@ -0,0 +1,17 @@
+-- ==========================================
+-- 0012 發票列印 HTML 快取 (invoice_print_cache)
+-- 已開立的發票號碼向綠界取得的 InvoiceHtml 不會再變，存起來之後補印不必再呼叫綠界；
+-- 發票作廢時刪除，總大小超過上限時依 last_used_at 淘汰最久沒用的 (見 invoice_print_cache.py)
+-- ==========================================
+CREATE TABLE IF NOT EXISTS invoice_print_cache (
+    invoice_number VARCHAR(50) PRIMARY KEY,
+    html TEXT NOT NULL,
+    bytes INTEGER NOT NULL,                  -- html 的大小 (計算總量上限用)
+    hits INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_used_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 淘汰時由最近使用的往回累加大小
+CREATE INDEX IF NOT EXISTS idx_invoice_print_cache_used
+    ON invoice_print_cache (last_used_at DESC);
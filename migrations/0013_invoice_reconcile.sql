@@ -0,0 +1,41 @@
+-- ==========================================
+-- 0013 電子發票對帳 (invoice_reconcile.py)
+-- 定期以綠界的發票狀態核對本地 orders.invoice_number / invoice_status：
+-- 只檢查上次檢查點之後有變動的訂單 (row_version)，每批處理完就記下游標，中斷後可從游標繼續
+-- ==========================================
+
+-- 對帳進度 (只有一列)
+CREATE TABLE IF NOT EXISTS invoice_reconcile_state (
+    id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    checkpoint xid8 NOT NULL DEFAULT '0',    -- row_version 小於此值的訂單都已核對過
+    run_target xid8,                         -- 進行中的這一輪要核對到的 row_version (不含)；NULL 表示沒有進行中的一輪
+    cursor_version xid8,                     -- 進行中的這一輪已核對到的 (row_version, id)
+    cursor_id INTEGER,
+    last_run_at TIMESTAMP,
+    last_summary TEXT                        -- 上一輪的統計 (JSON)
+);
+INSERT INTO invoice_reconcile_state (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+
+-- 對帳發現的差異 (差異報表)
+-- kind：voided_remote 綠界已作廢 / status_normalized 狀態值不認得 / issued_remote_only 綠界已開立但本地未寫回 /
+--       void_not_remote 本地作廢但綠界仍有效 / missing_remote 綠界查無此發票 /
+--       cancelled_not_voided 訂單已作廢但發票未作廢 / not_issued 已出餐但未開立
+-- action：repaired 已修正本地資料 / reported 需人工處理 (可用後台批次開立 / 作廢)
+CREATE TABLE IF NOT EXISTS invoice_discrepancies (
+    id BIGSERIAL PRIMARY KEY,
+    order_id INTEGER NOT NULL,
+    invoice_number VARCHAR(50),
+    kind VARCHAR(30) NOT NULL,
+    action VARCHAR(20) NOT NULL,
+    local_status VARCHAR(20),
+    remote_status VARCHAR(20),
+    detail TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_invoice_discrepancies_created
+    ON invoice_discrepancies (created_at DESC);
+
+-- 依 row_version 找出檢查點之後有變動的訂單 (建在分割表上，每個月份分割都會自動建立)
+CREATE INDEX IF NOT EXISTS idx_orders_row_version
+    ON orders (row_version, id);
@@ -0,0 +1,22 @@
+-- ==========================================
+-- 0014 發票作廢次數 (orders.invoice_void_count)
+-- 開立的 RelateNumber 以訂單為準：ORDER{id}，作廢後重新開立為 ORDER{id}V{作廢次數} (見 invoice_outbox.relate_number)。
+-- 同一張訂單不論由哪一筆佇列工作、後台手動或批次開立，都用同一個 RelateNumber，
+-- 先查詢就知道綠界是否已開立，不會開出第二張；作廢後次數加 1，才能再開一張新的
+-- ==========================================
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS invoice_void_count INTEGER NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION orders_count_invoice_void() RETURNS trigger AS $$
+BEGIN
+    IF NEW.invoice_status = 'Void' AND OLD.invoice_status IS DISTINCT FROM 'Void' THEN
+        NEW.invoice_void_count := OLD.invoice_void_count + 1;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 建在分割表上，每個月份分割 (含之後新建的) 都會自動套用
+DROP TRIGGER IF EXISTS trg_orders_invoice_void_count ON orders;
+CREATE TRIGGER trg_orders_invoice_void_count
+    BEFORE UPDATE OF invoice_status ON orders
+    FOR EACH ROW EXECUTE FUNCTION orders_count_invoice_void();
@@ -0,0 +1,14 @@
+-- ==========================================
+-- 0015 發票開立日期 (orders.invoice_date)
+-- 綠界作廢 (Invalid) 與以發票號碼查詢 (GetIssue) 都要帶發票的開立日期 InvoiceDate，
+-- 不能用當天日期 (隔天作廢、補開舊訂單的發票都會不符)。開立 / 查詢到發票時一併寫入綠界回覆的日期
+-- 既有的發票以發票佇列完成開立的時間 (台灣日期) 補上；同步開立的舊發票沒有紀錄，維持 NULL
+-- (見 invoice_outbox.invoice_date_of)
+-- ==========================================
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS invoice_date DATE;   -- 發票開立日期 (台灣日期，對應 invoice_number)
+
+UPDATE orders o SET invoice_date = (j.done_at + interval '8 hours')::date
+FROM invoice_outbox j
+WHERE o.invoice_date IS NULL AND o.invoice_number IS NOT NULL
+  AND j.order_id = o.id AND j.action = 'issue' AND j.status = 'done'
+  AND j.invoice_number = o.invoice_number AND j.done_at IS NOT NULL;
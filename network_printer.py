@@ -0,0 +1,297 @@
+"""
+網路印表機 (區網 RAW TCP 9100) 出單
+
+印表機位址存在 settings 表 (後台 → 🖨️ 網路印表機)：
+    printer_receipt / printer_noodle / printer_soup / printer_other = "192.168.1.50" 或 "192.168.1.50:9100"
+空白表示該角色不走網路 (仍由看板的 WebUSB 列印)；printer_other 空白時跟著結帳機。
+
+伺服器端的列印執行緒 (start_worker) 以 print_spooler.claim() 領取有設定位址的角色，送出下單時
+已產生好的 ESC/POS (tickets.render_escpos，即原本 print_order 的 generate_content)，再回報
+complete / fail；失敗的工作依 print_spooler 的退避時間重試。看板不會再領取這些角色。
+
+- 每台印表機保持一條長連線重複使用，閒置 PRINTER_IDLE_CLOSE 秒後關閉 (9100 埠通常一次只接受一條連線)
+- 每張單送出前以 DLE EOT 查詢狀態：可順便確認長連線還活著，缺紙 / 開蓋時不送出
+- 每個 gunicorn worker 都會啟動執行緒，但只有拿到 advisory lock 的那一個會真的送印；
+  持有者結束時連線關閉、鎖自動釋放，其他 worker 幾秒內接手
+"""
+import os
+import socket
+import threading
+import time
+
+import psycopg2
+
+import db_events
+import kitchen_events
+import print_spooler
+from settings_cache import get_settings
+
+NETWORK_PRINTING_ENABLED = os.environ.get("NETWORK_PRINTING_ENABLED", "1") == "1"  # 設為 0 則全部交給看板 (WebUSB)
+PRINTER_DEFAULT_PORT = 9100
+PRINTER_CONNECT_TIMEOUT = float(os.environ.get("PRINTER_CONNECT_TIMEOUT", "3"))   # 建立連線逾時 (秒)
+PRINTER_WRITE_TIMEOUT = float(os.environ.get("PRINTER_WRITE_TIMEOUT", "10"))      # 送出一張單的逾時 (秒)
+PRINTER_STATUS_TIMEOUT = float(os.environ.get("PRINTER_STATUS_TIMEOUT", "2"))     # 等待狀態回應的逾時 (秒)
+PRINTER_IDLE_CLOSE = float(os.environ.get("PRINTER_IDLE_CLOSE", "60"))            # 長連線閒置幾秒後關閉
+PRINTER_POLL_INTERVAL = float(os.environ.get("PRINTER_POLL_INTERVAL", "2"))       # 沒有新訂單通知時多久檢查一次佇列
+PRINTER_BATCH = int(os.environ.get("PRINTER_BATCH", "10"))                        # 每次領取的工作數
+
+SETTING_KEYS = {role: f'printer_{role}' for role in ('receipt', 'noodle', 'soup', 'other')}
+WORKER_LOCK_KEY = 0x5052494E   # pg_advisory_lock 的 key ('PRIN')
+
+# DLE EOT n：即時狀態查詢 (印表機正在列印時也會立即回應)
+DLE_EOT = b'\x10\x04'
+STATUS_PRINTER, STATUS_OFFLINE_CAUSE, STATUS_PAPER = 1, 2, 4
+
+
+class PrinterError(Exception):
+    """印表機無法列印 (缺紙、開蓋、離線)；連線問題則是 OSError"""
+
+
+def parse_address(value):
+    """'host' 或 'host:port' -> (host, port)；空白回傳 None，格式錯誤丟出 ValueError"""
+    value = (value or '').strip()
+    if not value:
+        return None
+    host, sep, port = value.rpartition(':')
+    if not sep:
+        host, port = value, PRINTER_DEFAULT_PORT
+    if not host or not str(port).isdigit() or not 0 < int(port) < 65536:
+        raise ValueError(f"印表機位址格式錯誤: {value} (例如 192.168.1.50:9100)")
+    return host, int(port)
+
+
+def printer_map(settings=None):
+    """目前設定的網路印表機 -> {角色: (host, port)}；格式錯誤的設定視為未設定"""
+    settings = settings or get_settings()
+    mapping = {}
+    for role, key in SETTING_KEYS.items():
+        try:
+            addr = parse_address(settings.get(key))
+        except ValueError as e:
+            print(f"⚠️ {e}")
+            addr = None
+        if addr:
+            mapping[role] = addr
+    if 'other' not in mapping and 'receipt' in mapping:
+        mapping['other'] = mapping['receipt']
+    return mapping
+
+
+def network_roles(settings=None):
+    """由伺服器送印的角色 (看板不必領取)；關閉網路列印時為空"""
+    if not NETWORK_PRINTING_ENABLED:
+        return set()
+    return set(printer_map(settings))
+
+
+# ==========================================
+# 🖨️ 單一印表機 (長連線)
+# ==========================================
+class NetworkPrinter:
+    """一台 RAW TCP 印表機；連線在多張單之間重複使用，斷線時自動重連一次"""
+
+    def __init__(self, host, port=PRINTER_DEFAULT_PORT):
+        self.host = host
+        self.port = port
+        self._sock = None
+        self._lock = threading.Lock()
+        self.last_used = 0.0
+        self.stats = {'connects': 0, 'jobs': 0, 'bytes': 0, 'errors': 0}
+
+    def __repr__(self):
+        return f"{self.host}:{self.port}"
+
+    def _connect(self):
+        if self._sock is None:
+            self._sock = socket.create_connection((self.host, self.port), timeout=PRINTER_CONNECT_TIMEOUT)
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.stats['connects'] += 1
+        return self._sock
+
+    def _close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def close_if_idle(self, idle=PRINTER_IDLE_CLOSE):
+        with self._lock:
+            if self._sock is not None and time.monotonic() - self.last_used > idle:
+                self._close()
+
+    def _query(self, n):
+        sock = self._connect()
+        sock.settimeout(PRINTER_STATUS_TIMEOUT)
+        sock.sendall(DLE_EOT + bytes([n]))
+        reply = sock.recv(1)
+        if not reply:
+            raise ConnectionError("印表機已關閉連線")
+        return reply[0]
+
+    def _status(self):
+        printer = self._query(STATUS_PRINTER)
+        cause = self._query(STATUS_OFFLINE_CAUSE)
+        paper = self._query(STATUS_PAPER)
+        return {
+            'online': not printer & 0x08,
+            'cover_open': bool(cause & 0x04),
+            'paper_out': bool(cause & 0x20 or paper & 0x60),
+            'paper_near_end': bool(paper & 0x0C),
+            'error': bool(cause & 0x40),
+        }
+
+    def status(self):
+        """查詢狀態；連不上時回傳 {'online': False, 'error': 原因}"""
+        with self._lock:
+            try:
+                st = self._status()
+                self.last_used = time.monotonic()
+                return st
+            except OSError as e:
+                self._close()
+                return {'online': False, 'error': str(e)}
+
+    def send(self, data):
+        """送出一張單；印表機不能印時丟出 PrinterError，連線失敗 (重連一次後) 丟出 OSError"""
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    st = self._status()
+                    if st['paper_out'] or st['cover_open'] or not st['online'] or st['error']:
+                        raise PrinterError(
+                            "缺紙" if st['paper_out'] else "上蓋未關" if st['cover_open'] else "印表機離線或錯誤")
+                    self._sock.settimeout(PRINTER_WRITE_TIMEOUT)
+                    self._sock.sendall(data)
+                    self.last_used = time.monotonic()
+                    self.stats['jobs'] += 1
+                    self.stats['bytes'] += len(data)
+                    return st
+                except PrinterError:
+                    self.stats['errors'] += 1
+                    raise
+                except OSError:
+                    # 長連線可能已被印表機關閉 (重開機、閒置逾時)，重連一次再試
+                    self._close()
+                    if attempt == 2:
+                        self.stats['errors'] += 1
+                        raise
+
+
+_printers_lock = threading.Lock()
+_printers = {}   # (host, port) -> NetworkPrinter
+
+
+def get_printer(host, port=PRINTER_DEFAULT_PORT):
+    """取得 (或建立) 指定位址的印表機物件，同一位址共用同一條連線"""
+    with _printers_lock:
+        key = (host, port)
+        if key not in _printers:
+            _printers[key] = NetworkPrinter(host, port)
+        return _printers[key]
+
+
+def status_all(settings=None):
+    """各角色的印表機位址與即時狀態 (同一台印表機只查詢一次)"""
+    mapping = printer_map(settings)
+    cache = {}
+    result = {}
+    for role, addr in mapping.items():
+        if addr not in cache:
+            cache[addr] = get_printer(*addr).status()
+        result[role] = dict(cache[addr], address=f"{addr[0]}:{addr[1]}")
+    return result
+
+
+def get_printer_stats():
+    with _printers_lock:
+        printers = list(_printers.values())
+    return {repr(p): dict(p.stats, connected=p._sock is not None) for p in printers}
+
+
+# ==========================================
+# 🔁 伺服器端列印執行緒
+# ==========================================
+def process_once(conn, worker, mapping=None, limit=PRINTER_BATCH):
+    """領取一批網路印表機的工作並送印，回傳領取的張數 (conn 由呼叫端提供，每張單各自 commit)"""
+    mapping = printer_map() if mapping is None else mapping
+    if not mapping:
+        return 0
+    cur = conn.cursor()
+    try:
+        jobs = print_spooler.claim(cur, list(mapping), worker, limit)
+        conn.commit()
+        for job_id, oid, role, payload in jobs:
+            printer = get_printer(*mapping[role])
+            try:
+                printer.send(payload)
+                print_spooler.complete(cur, job_id)
+            except (PrinterError, OSError) as e:
+                print(f"⚠️ 訂單 #{oid} {role} 送印失敗 ({printer}): {e}")
+                print_spooler.fail(cur, job_id, f"{printer}: {e}")
+            conn.commit()
+        return len(jobs)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+_wake = threading.Event()
+_worker_pid = None
+
+
+def _worker_loop():
+    worker = f"net:{socket.gethostname()}:{os.getpid()}"
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(os.environ.get("DATABASE_URL"))
+            cur = conn.cursor()
+            # 只有一個行程送印；其他 worker 持續等待，持有者結束時接手
+            while True:
+                cur.execute("SELECT pg_try_advisory_lock(%s)", (WORKER_LOCK_KEY,))
+                got = cur.fetchone()[0]
+                conn.commit()
+                if got:
+                    break
+                time.sleep(PRINTER_POLL_INTERVAL * 5)
+            print(f"🖨️ 網路印表機列印執行緒已啟動 ({worker})")
+
+            while True:
+                _wake.clear()
+                claimed = process_once(conn, worker)
+                with _printers_lock:
+                    printers = list(_printers.values())
+                for p in printers:
+                    p.close_if_idle()
+                if claimed < PRINTER_BATCH:
+                    _wake.wait(PRINTER_POLL_INTERVAL)
+
+        except Exception as e:
+            print(f"⚠️ 網路印表機列印執行緒錯誤，稍後重試: {e}")
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        time.sleep(PRINTER_POLL_INTERVAL * 5)
+
+
+def start_worker():
+    """啟動本行程的列印執行緒 (gunicorn fork 後每個 worker 各自呼叫一次)"""
+    global _worker_pid
+    if not NETWORK_PRINTING_ENABLED or _worker_pid == os.getpid():
+        return
+    _worker_pid = os.getpid()
+    # 有新訂單時立即處理，不必等到下一次檢查
+    db_events.subscribe(kitchen_events.CHANNEL, lambda payload: _wake.set())
+    t = threading.Thread(target=_worker_loop, name="network-printer", daemon=True)
+    t.start()
@@ -0,0 +1,132 @@
+"""
+訂單明細 (order_items) 寫入與歷史資料回填
+
+下單時由 process_order_submission 在同一個交易內呼叫 write_order_items()，
+orders.content_json 仍保留原樣 (出單、發票、修改訂單都還在使用)。
+
+指令 (部署 migration 0006 之後執行一次，可重複執行，只會補上還沒有明細的訂單)：
+    python order_items.py backfill
+    python order_items.py backfill --batch 1000
+"""
+import os
+import sys
+import json
+import argparse
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+
+def parse_cart(content_json):
+    """把 content_json 解析成購物車 list (相容字串 / list / 單一 dict 三種格式)"""
+    if not content_json:
+        return []
+    try:
+        items = json.loads(content_json) if isinstance(content_json, str) else content_json
+    except (ValueError, TypeError):
+        return []
+    if isinstance(items, dict):
+        items = [items]
+    if not isinstance(items, list):
+        return []
+    return [i for i in items if isinstance(i, dict)]
+
+
+def build_rows(order_id, cart_items):
+    """購物車 -> order_items 的資料列"""
+    rows = []
+    for line_no, item in enumerate(cart_items, start=1):
+        try:
+            qty = int(float(item.get('qty', 1)))
+        except (ValueError, TypeError):
+            qty = 1
+        # 新版購物車用 unit_price (含加價選項)，舊資料可能只有 price
+        raw_price = item.get('unit_price')
+        if raw_price is None:
+            raw_price = item.get('price', 0)
+        try:
+            unit_price = int(float(raw_price))
+        except (ValueError, TypeError):
+            unit_price = 0
+        try:
+            product_id = int(item['id']) if item.get('id') not in (None, '') else None
+        except (ValueError, TypeError):
+            product_id = None
+
+        options = item.get('options_zh') or item.get('options') or []
+        if isinstance(options, list):
+            options = ",".join(str(o) for o in options)
+
+        rows.append((
+            order_id, line_no, product_id,
+            item.get('name_zh') or item.get('name') or '未知品項',
+            qty, unit_price, options or None,
+            item.get('print_category'),
+        ))
+    return rows
+
+
+def write_order_items(cur, order_id, cart_items):
+    """在呼叫端的交易內寫入一張訂單的明細 (一次 INSERT 多列)"""
+    rows = build_rows(order_id, cart_items)
+    if not rows:
+        return 0
+    execute_values(cur, """
+        INSERT INTO order_items (order_id, line_no, product_id, product_name, qty, unit_price, options, print_category)
+        VALUES %s
+        ON CONFLICT (order_id, line_no) DO NOTHING
+    """, rows)
+    return len(rows)
+
+
+def backfill(conn, batch_size=500, verbose=True):
+    """
+    為還沒有明細的歷史訂單補上 order_items。
+    依訂單 id 分批 (keyset)，每批各自提交，中斷後重跑會從頭檢查但只補缺的部分。
+    """
+    cur = conn.cursor()
+    last_id = 0
+    total_orders = total_items = 0
+    while True:
+        cur.execute("""
+            SELECT o.id, o.content_json FROM orders o
+            WHERE o.id > %s
+              AND NOT EXISTS (SELECT 1 FROM order_items oi WHERE oi.order_id = o.id)
+            ORDER BY o.id
+            LIMIT %s
+        """, (last_id, batch_size))
+        batch = cur.fetchall()
+        if not batch:
+            break
+        for order_id, content_json in batch:
+            total_items += write_order_items(cur, order_id, parse_cart(content_json))
+        conn.commit()
+        last_id = batch[-1][0]
+        total_orders += len(batch)
+        if verbose:
+            print(f"🔄 已回填至訂單 #{last_id} (累計 {total_orders} 筆訂單 / {total_items} 筆明細)")
+    cur.close()
+    if verbose:
+        print(f"✅ 回填完成：{total_orders} 筆訂單，{total_items} 筆明細")
+    return total_orders, total_items
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="訂單明細 (order_items) 工具")
+    parser.add_argument('command', choices=['backfill'], help="backfill: 為歷史訂單補上明細")
+    parser.add_argument('--batch', type=int, default=500, help="每批處理的訂單數 (預設 500)")
+    args = parser.parse_args(argv)
+
+    db_uri = os.environ.get("DATABASE_URL")
+    if not db_uri:
+        sys.exit("錯誤：找不到環境變數 DATABASE_URL")
+
+    conn = psycopg2.connect(db_uri)
+    try:
+        backfill(conn, batch_size=args.batch)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
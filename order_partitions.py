@@ -0,0 +1,316 @@
+"""
+orders 月份分割表 (partition) 的建立與封存
+
+orders 依 created_at 以「台灣月份」切成 orders_pYYYYMM (例如 orders_p202610)，
+每個分割的範圍是該月 1 日 00:00 (台灣時間) 起到下個月 1 日 00:00 止，換算成 UTC 存放；
+這樣任何一個營業日都只會落在單一分割內，廚房看板與日結報表只會掃到當月的分割。
+找不到對應月份的訂單會寫入 orders_default，之後建立該月份分割時會自動搬過去。
+
+    ensure_partitions(cur)                 建立本月起往後 ORDER_PARTITION_MONTHS_AHEAD 個月的分割
+    archive_partition(conn, name, out_dir) 卸離 (DETACH) 一個月份，匯出成 CSV.gz 後刪除，不做逐筆 DELETE
+
+背景維護執行緒每天會執行 maintenance()；設定 ORDER_RETENTION_MONTHS 後也會自動封存舊月份。
+
+指令：
+    python order_partitions.py list
+    python order_partitions.py ensure --ahead 3
+    python order_partitions.py archive --older-than 24 --out archive/ [--dry-run]
+"""
+import os
+import re
+import sys
+import gzip
+import argparse
+from datetime import datetime
+
+import psycopg2
+
+from business_day import TW_OFFSET, tw_today
+
+ORDER_PARTITION_MONTHS_AHEAD = int(os.environ.get("ORDER_PARTITION_MONTHS_AHEAD", "3"))  # 預先建立幾個月的分割
+ORDER_RETENTION_MONTHS = int(os.environ.get("ORDER_RETENTION_MONTHS", "0"))              # 保留幾個月 (0: 不自動封存)
+ORDER_ARCHIVE_DIR = os.environ.get("ORDER_ARCHIVE_DIR", "archive")                       # 封存檔輸出資料夾
+PARTITION_LOCK_TIMEOUT = os.environ.get("PARTITION_LOCK_TIMEOUT", "5s")                  # 等不到表鎖就放棄，避免卡住下單
+
+DEFAULT_PARTITION = 'orders_default'
+_NAME_PATTERN = re.compile(r'^orders_p(\d{4})(\d{2})$')
+
+
+# ==========================================
+# 📅 月份與分割名稱
+# ==========================================
+def add_months(year, month, n):
+    idx = year * 12 + (month - 1) + n
+    return idx // 12, idx % 12 + 1
+
+
+def partition_name(year, month):
+    return f"orders_p{year:04d}{month:02d}"
+
+
+def parse_partition_name(name):
+    """orders_p202610 -> (2026, 10)；不是月份分割時回傳 None"""
+    m = _NAME_PATTERN.match(name)
+    return (int(m.group(1)), int(m.group(2))) if m else None
+
+
+def month_bounds(year, month):
+    """台灣月份 -> UTC 半開區間 (start, end)"""
+    next_year, next_month = add_months(year, month, 1)
+    return (datetime(year, month, 1) - TW_OFFSET,
+            datetime(next_year, next_month, 1) - TW_OFFSET)
+
+
+# ==========================================
+# 🧱 建立分割
+# ==========================================
+def list_partitions(cur):
+    """目前掛在 orders 底下的分割: [(名稱, (年, 月) 或 None), ...]，依名稱排序"""
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'orders'::regclass
+        ORDER BY c.relname
+    """)
+    return [(name, parse_partition_name(name)) for (name,) in cur.fetchall()]
+
+
+def create_partition(cur, year, month):
+    """
+    建立單一月份分割 (已存在就略過)，回傳是否有新建立。
+    orders_default 內若已有該月份的訂單，先搬到新表再 ATTACH (否則 PostgreSQL 會拒絕建立)。
+    """
+    name = partition_name(year, month)
+    cur.execute("SELECT to_regclass(%s)", (name,))
+    if cur.fetchone()[0] is not None:
+        return False
+
+    start, end = month_bounds(year, month)
+    cur.execute(f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s LIMIT 1", (start, end))
+    if cur.fetchone() is None:
+        cur.execute(f"CREATE TABLE {name} PARTITION OF orders FOR VALUES FROM (%s) TO (%s)", (start, end))
+        return True
+
+    cur.execute(f"CREATE TABLE {name} (LIKE orders INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """, (start, end))
+    moved = cur.rowcount
+    cur.execute(f"ALTER TABLE orders ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", (start, end))
+    print(f"📦 {name}: 已從 {DEFAULT_PARTITION} 搬移 {moved} 筆訂單")
+    return True
+
+
+def ensure_partitions(cur, months_ahead=None, start=None):
+    """
+    建立 start (台灣月份 (年, 月)，預設本月) 到本月之後 months_ahead 個月的所有分割。
+    在呼叫端的交易內執行，回傳新建立的分割名稱。
+    """
+    if months_ahead is None:
+        months_ahead = ORDER_PARTITION_MONTHS_AHEAD
+    today = tw_today()
+    year, month = start or (today.year, today.month)
+    last = add_months(today.year, today.month, months_ahead)
+
+    created = []
+    while (year, month) <= last:
+        if create_partition(cur, year, month):
+            created.append(partition_name(year, month))
+        year, month = add_months(year, month, 1)
+    return created
+
+
+# ==========================================
+# 🗄️ 封存舊月份
+# ==========================================
+def _export(cur, sql, path):
+    """COPY 查詢結果成 CSV.gz (含標題列)，回傳寫入的資料列數"""
+    # copy_expert 之後的 cur.rowcount 不可靠，另外算筆數 (呼叫端以 REPEATABLE READ 確保兩者看到同一份資料)
+    cur.execute(f"SELECT count(*) FROM ({sql}) AS s")
+    count = cur.fetchone()[0]
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, 'wb') as f:
+        cur.copy_expert(f"COPY ({sql}) TO STDOUT WITH CSV HEADER", f)
+    os.replace(tmp_path, path)
+    return count
+
+
+def _reattach(conn, name):
+    """封存失敗時把已卸離的分割掛回 orders (資料不會遺失)"""
+    start, end = month_bounds(*parse_partition_name(name))
+    cur = conn.cursor()
+    try:
+        cur.execute("SET LOCAL lock_timeout = %s", (PARTITION_LOCK_TIMEOUT,))
+        cur.execute(f"ALTER TABLE orders ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", (start, end))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"⚠️ {name} 已卸離但無法掛回 orders，請手動 ATTACH 或重新封存: {e}")
+    finally:
+        cur.close()
+
+
+def archive_partition(conn, name, out_dir=None):
+    """
+    封存一個月份：DETACH 分割 -> 匯出訂單與明細成 CSV.gz -> 刪除明細 -> DROP 分割。
+    DETACH 會鎖住整個 orders (ACCESS EXCLUSIVE)，所以單獨一個交易先 commit，匯出期間不會擋住下單；
+    匯出或刪除失敗時回滾並把分割重新掛回 orders。
+    回傳 (訂單筆數, 明細筆數)。
+    """
+    if parse_partition_name(name) is None:
+        raise ValueError(f"不是月份分割: {name}")
+    out_dir = out_dir or ORDER_ARCHIVE_DIR
+    os.makedirs(out_dir, exist_ok=True)
+
+    cur = conn.cursor()
+    try:
+        # 1. 卸離 (短交易，等不到鎖就放棄)
+        try:
+            cur.execute("SET LOCAL lock_timeout = %s", (PARTITION_LOCK_TIMEOUT,))
+            cur.execute(f"ALTER TABLE orders DETACH PARTITION {name}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        # 2. 匯出並刪除 (已卸離的表不會再有人寫入)
+        try:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            n_orders = _export(cur, f"SELECT * FROM {name} ORDER BY id",
+                               os.path.join(out_dir, f"{name}.csv.gz"))
+            n_items = _export(cur, f"SELECT oi.* FROM order_items oi WHERE oi.order_id IN (SELECT id FROM {name}) ORDER BY oi.id",
+                              os.path.join(out_dir, f"{name}_items.csv.gz"))
+            cur.execute(f"DELETE FROM order_items WHERE order_id IN (SELECT id FROM {name})")
+            cur.execute(f"DROP TABLE {name}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            _reattach(conn, name)
+            raise
+    finally:
+        cur.close()
+    return n_orders, n_items
+
+
+def archivable_partitions(cur, retention_months):
+    """超過保留月數 (不含本月) 的月份分割名稱"""
+    today = tw_today()
+    cutoff = add_months(today.year, today.month, -retention_months)
+    return [name for name, ym in list_partitions(cur) if ym is not None and ym < cutoff]
+
+
+def archive_older_than(conn, retention_months, out_dir=None, dry_run=False):
+    """封存所有超過保留月數的分割，回傳已封存的名稱"""
+    cur = conn.cursor()
+    names = archivable_partitions(cur, retention_months)
+    cur.close()
+    conn.rollback()
+
+    done = []
+    for name in names:
+        if dry_run:
+            print(f"🔍 將封存 {name}")
+            continue
+        n_orders, n_items = archive_partition(conn, name, out_dir)
+        print(f"🗄️ 已封存 {name}: {n_orders} 筆訂單 / {n_items} 筆明細")
+        done.append(name)
+    return done
+
+
+# ==========================================
+# 🧹 依時間範圍刪除 (後台「刪除區間訂單」)
+# ==========================================
+def delete_range(cur, utc_start, utc_end):
+    """
+    刪除 [utc_start, utc_end) 的訂單與明細，回傳刪除的訂單數。
+    整個月份都在範圍內的分割直接 TRUNCATE，只有頭尾不完整的月份才逐筆 DELETE。
+    """
+    deleted = 0
+    for name, ym in list_partitions(cur):
+        if ym is None:
+            continue
+        start, end = month_bounds(*ym)
+        if start >= utc_start and end <= utc_end:
+            cur.execute(f"SELECT COUNT(*) FROM {name}")
+            deleted += cur.fetchone()[0]
+            cur.execute(f"DELETE FROM order_items WHERE order_id IN (SELECT id FROM {name})")
+            cur.execute(f"TRUNCATE TABLE {name}")
+
+    # 剩下的部分 (不完整的月份、orders_default) 照一般方式刪除；已 TRUNCATE 的分割是空的
+    cur.execute("DELETE FROM orders WHERE created_at >= %s AND created_at < %s RETURNING id", (utc_start, utc_end))
+    ids = [r[0] for r in cur.fetchall()]
+    if ids:
+        cur.execute("DELETE FROM order_items WHERE order_id = ANY(%s)", (ids,))
+    return deleted + len(ids)
+
+
+# ==========================================
+# ⏰ 每日維護
+# ==========================================
+def maintenance(conn):
+    """建立未來月份的分割；有設定 ORDER_RETENTION_MONTHS 時順便封存舊月份"""
+    cur = conn.cursor()
+    try:
+        cur.execute("SET LOCAL lock_timeout = %s", (PARTITION_LOCK_TIMEOUT,))
+        created = ensure_partitions(cur)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    if created:
+        print(f"📅 已建立訂單分割: {', '.join(created)}")
+
+    if ORDER_RETENTION_MONTHS > 0:
+        archive_older_than(conn, ORDER_RETENTION_MONTHS)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="orders 月份分割工具")
+    parser.add_argument('command', choices=['list', 'ensure', 'archive'],
+                        help="list: 列出分割; ensure: 建立未來月份; archive: 封存舊月份")
+    parser.add_argument('--ahead', type=int, default=ORDER_PARTITION_MONTHS_AHEAD,
+                        help=f"ensure: 預先建立幾個月 (預設 {ORDER_PARTITION_MONTHS_AHEAD})")
+    parser.add_argument('--older-than', type=int, default=ORDER_RETENTION_MONTHS,
+                        help="archive: 封存超過幾個月的分割 (不含本月)")
+    parser.add_argument('--out', default=ORDER_ARCHIVE_DIR, help=f"archive: 輸出資料夾 (預設 {ORDER_ARCHIVE_DIR})")
+    parser.add_argument('--dry-run', action='store_true', help="archive: 只列出將封存的分割")
+    args = parser.parse_args(argv)
+
+    db_uri = os.environ.get("DATABASE_URL")
+    if not db_uri:
+        sys.exit("錯誤：找不到環境變數 DATABASE_URL")
+
+    conn = psycopg2.connect(db_uri)
+    try:
+        cur = conn.cursor()
+        if args.command == 'list':
+            for name, ym in list_partitions(cur):
+                cur.execute(f"SELECT COUNT(*) FROM {name}")
+                count = cur.fetchone()[0]
+                if ym:
+                    start, end = month_bounds(*ym)
+                    print(f"  {name:<16} {count:8d} 筆  UTC {start} ~ {end}")
+                else:
+                    print(f"  {name:<16} {count:8d} 筆")
+        elif args.command == 'ensure':
+            created = ensure_partitions(cur, months_ahead=args.ahead)
+            conn.commit()
+            print(f"✅ 新建立 {len(created)} 個分割 {', '.join(created)}")
+        else:
+            if args.older_than <= 0:
+                sys.exit("錯誤：請以 --older-than 指定保留月數")
+            done = archive_older_than(conn, args.older_than, args.out, dry_run=args.dry_run)
+            if not args.dry_run:
+                print(f"✅ 封存完成，共 {len(done)} 個分割 (輸出至 {args.out})")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
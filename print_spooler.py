@@ -0,0 +1,212 @@
+"""
+列印工作佇列 (print_jobs)
+
+下單時在同一個交易內呼叫 enqueue_order(cur, oid)：每個出單角色 (結帳 / 麵區 / 湯區 / 其他) 的
+ESC/POS 只產生一次並存進 print_jobs。看板 (WebUSB) 定期以 claim() 領取自己有接印表機的角色，
+印完回報 complete()，失敗回報 fail() 後會依退避時間重試。領取使用 FOR UPDATE SKIP LOCKED，
+多台看板同時領取也不會重複列印。補印 (reprint_tickets) 直接讀取存好的內容。
+
+    enqueue_order(cur, oid)              產生並排入待印 (PRINT_AUTO_ROLES 以外的角色只保存不列印)
+    claim(cur, roles, worker, limit)     領取待印工作
+    complete(cur, job_id) / fail(cur, job_id, error)
+    hold_order(cur, oid)                 訂單作廢 / 修改時，尚未印出的工作不再自動列印
+    reprint_tickets(cur, oid, roles)     補印內容
+
+指令：
+    python print_spooler.py status           各狀態的工作數
+    python print_spooler.py retry            把失敗的工作重新排入待印
+    python print_spooler.py purge --days 30  刪除 30 天前的紀錄
+"""
+import os
+import sys
+import argparse
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+import tickets
+from catalog import get_catalog
+
+PRINT_AUTO_ROLES = [r.strip() for r in os.environ.get("PRINT_AUTO_ROLES", "receipt,noodle,soup,other").split(",") if r.strip()]  # 下單後自動列印的角色
+PRINT_MAX_ATTEMPTS = int(os.environ.get("PRINT_MAX_ATTEMPTS", "5"))            # 超過就標記 failed，不再自動重試
+PRINT_RETRY_BASE = float(os.environ.get("PRINT_RETRY_BASE", "5"))              # 第一次失敗後幾秒重試，之後每次加倍
+PRINT_RETRY_MAX = float(os.environ.get("PRINT_RETRY_MAX", "300"))              # 重試間隔上限 (秒)
+PRINT_CLAIM_TIMEOUT = int(os.environ.get("PRINT_CLAIM_TIMEOUT", "120"))        # 領取後幾秒沒回報就放回佇列
+PRINT_JOB_MAX_AGE = int(os.environ.get("PRINT_JOB_MAX_AGE", "1800"))           # 排隊超過幾秒就不再自動列印 (避免隔天才印出)
+PRINT_JOB_RETENTION_DAYS = int(os.environ.get("PRINT_JOB_RETENTION_DAYS", "30"))  # 紀錄保留天數 (背景維護每天清理)
+
+
+def _insert(cur, oid, rendered, status_for):
+    rows = [(oid, role, psycopg2.Binary(payload), status_for(role)) for role, payload in rendered.items()]
+    if rows:
+        execute_values(cur, "INSERT INTO print_jobs (order_id, role, payload, status) VALUES %s", rows)
+    return rows
+
+
+def enqueue_order(cur, oid, catalog=None):
+    """
+    在下單的交易內呼叫：產生這張訂單的所有單據並寫入 print_jobs，回傳排入待印的張數。
+    產生失敗不影響下單 (以 SAVEPOINT 隔離)，之後補印時會再產生一次。
+    """
+    cur.execute("SAVEPOINT print_jobs_enqueue")
+    try:
+        order = tickets.load_order(cur, oid)
+        if order is None:
+            cur.execute("RELEASE SAVEPOINT print_jobs_enqueue")
+            return 0
+        rendered = tickets.render_tickets(order, catalog or get_catalog())
+        rows = _insert(cur, oid, rendered, lambda role: 'queued' if role in PRINT_AUTO_ROLES else 'held')
+        cur.execute("RELEASE SAVEPOINT print_jobs_enqueue")
+        return sum(1 for r in rows if r[3] == 'queued')
+    except Exception as e:
+        cur.execute("ROLLBACK TO SAVEPOINT print_jobs_enqueue")
+        print(f"⚠️ 訂單 #{oid} 列印工作建立失敗 (可於看板補印): {e}")
+        return 0
+
+
+def _recover(cur):
+    """領取前的整理：列印端沒回報的工作放回佇列，排太久的工作不再自動列印"""
+    cur.execute("""
+        UPDATE print_jobs
+        SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+            last_error = '領取後逾時未回報', claimed_by = NULL
+        WHERE status = 'printing' AND claimed_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+    """, (PRINT_MAX_ATTEMPTS, PRINT_CLAIM_TIMEOUT))
+    cur.execute("""
+        UPDATE print_jobs SET status = 'expired'
+        WHERE status = 'queued' AND created_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+    """, (PRINT_JOB_MAX_AGE,))
+
+
+def claim(cur, roles, worker, limit=10):
+    """
+    領取 roles 的待印工作 (最舊的先印)，回傳 [(job_id, order_id, role, payload bytes), ...]。
+    呼叫端 commit 後即完成領取；被其他人鎖住的工作會直接跳過，不會等待。
+    """
+    roles = [r for r in roles if r in tickets.ROLES]
+    if not roles:
+        return []
+    _recover(cur)
+    cur.execute("""
+        UPDATE print_jobs j
+        SET status = 'printing', attempts = j.attempts + 1, claimed_by = %s, claimed_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT id FROM print_jobs
+            WHERE status = 'queued' AND role = ANY(%s) AND next_attempt_at <= CURRENT_TIMESTAMP
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        ) picked
+        WHERE j.id = picked.id
+        RETURNING j.id, j.order_id, j.role, j.payload
+    """, (worker, roles, limit))
+    return sorted((job_id, oid, role, bytes(payload)) for job_id, oid, role, payload in cur.fetchall())
+
+
+def complete(cur, job_id):
+    """回報列印完成；工作已不在 printing 狀態 (例如逾時被放回佇列) 時回傳 False"""
+    cur.execute("""
+        UPDATE print_jobs SET status = 'done', printed_at = CURRENT_TIMESTAMP, last_error = NULL
+        WHERE id = %s AND status = 'printing'
+    """, (job_id,))
+    return cur.rowcount == 1
+
+
+def fail(cur, job_id, error):
+    """回報列印失敗：依退避時間重新排入待印，超過 PRINT_MAX_ATTEMPTS 次標記為 failed"""
+    cur.execute("""
+        UPDATE print_jobs
+        SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+            last_error = %s, claimed_by = NULL,
+            next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => LEAST(%s * power(2, attempts - 1), %s))
+        WHERE id = %s AND status = 'printing'
+    """, (PRINT_MAX_ATTEMPTS, str(error)[:500], PRINT_RETRY_BASE, PRINT_RETRY_MAX, job_id))
+    return cur.rowcount == 1
+
+
+def hold_order(cur, oid):
+    """訂單作廢或被修改 (改成新單) 時呼叫：還沒印出的工作改為只保存，不再自動列印"""
+    cur.execute("UPDATE print_jobs SET status = 'held' WHERE order_id = %s AND status = 'queued'", (oid,))
+    return cur.rowcount
+
+
+def stored_tickets(cur, oid):
+    """各角色最新一次產生的內容 -> {角色: bytes}"""
+    cur.execute("""
+        SELECT DISTINCT ON (role) role, payload FROM print_jobs
+        WHERE order_id = %s
+        ORDER BY role, id DESC
+    """, (oid,))
+    return {role: bytes(payload) for role, payload in cur.fetchall()}
+
+
+def reprint_tickets(cur, oid, roles=tickets.ROLES):
+    """
+    補印內容 -> {角色: bytes}，找不到訂單時回傳 None。
+    直接讀取下單時存好的內容；舊訂單 (沒有任何列印紀錄) 第一次補印時產生並保存 (held)。
+    """
+    stored = stored_tickets(cur, oid)
+    if not stored:
+        order = tickets.load_order(cur, oid)
+        if order is None:
+            return None
+        stored = tickets.render_tickets(order, get_catalog())
+        _insert(cur, oid, stored, lambda role: 'held')
+    return {role: payload for role, payload in stored.items() if role in roles}
+
+
+def purge(cur, days=None):
+    """刪除 days 天前建立、已不會再自動列印的紀錄，回傳刪除筆數"""
+    days = PRINT_JOB_RETENTION_DAYS if days is None else days
+    cur.execute("""
+        DELETE FROM print_jobs
+        WHERE status IN ('done', 'failed', 'held', 'expired')
+          AND created_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+    """, (days,))
+    return cur.rowcount
+
+
+def get_queue_stats(cur):
+    """各狀態的工作數與最舊待印工作的等待秒數"""
+    cur.execute("SELECT status, COUNT(*) FROM print_jobs GROUP BY status")
+    stats = dict(cur.fetchall())
+    cur.execute("SELECT EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - MIN(created_at)) FROM print_jobs WHERE status = 'queued'")
+    oldest = cur.fetchone()[0]
+    stats['oldest_queued_sec'] = round(float(oldest), 1) if oldest is not None else None
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="列印工作佇列工具")
+    parser.add_argument('command', choices=['status', 'retry', 'purge'],
+                        help="status: 各狀態數量 / retry: 失敗的工作重新排入 / purge: 刪除舊紀錄")
+    parser.add_argument('--days', type=int, default=None, help=f"purge 保留天數 (預設 {PRINT_JOB_RETENTION_DAYS})")
+    args = parser.parse_args(argv)
+
+    db_uri = os.environ.get("DATABASE_URL")
+    if not db_uri:
+        sys.exit("錯誤：找不到環境變數 DATABASE_URL")
+
+    conn = psycopg2.connect(db_uri)
+    try:
+        cur = conn.cursor()
+        if args.command == 'status':
+            for status, count in get_queue_stats(cur).items():
+                print(f"   {status:<18} {count}")
+        elif args.command == 'retry':
+            # created_at 一併重設，避免馬上又被視為排隊過久 (expired)
+            cur.execute("""
+                UPDATE print_jobs SET status = 'queued', attempts = 0, next_attempt_at = CURRENT_TIMESTAMP,
+                                      created_at = CURRENT_TIMESTAMP
+                WHERE status = 'failed'
+            """)
+            print(f"🔄 已重新排入 {cur.rowcount} 筆失敗的列印工作")
+        else:
+            print(f"🧹 已刪除 {purge(cur, args.days)} 筆列印紀錄")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
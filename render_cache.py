@@ -0,0 +1,49 @@
+"""
+已產生 HTML 片段的 LRU 快取 (每個 worker 一份)
+
+key 需包含所有會影響輸出的欄位 (例如訂單的 row_version)，資料一改 key 就不同，
+因此不需要主動失效，舊的片段會因為太久沒用而被淘汰。
+"""
+import threading
+from collections import OrderedDict
+
+
+class RenderCache:
+    """執行緒安全的 LRU 快取，記錄命中 / 未命中 / 淘汰次數"""
+
+    def __init__(self, maxsize=500):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get_or_render(self, key, render):
+        """有快取就直接回傳，否則呼叫 render() 產生並存起來 (render 在鎖外執行)"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self._stats['hits'] += 1
+                return self._data[key]
+            self._stats['misses'] += 1
+
+        value = render()
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats['evictions'] += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._data)
+        stats['maxsize'] = self.maxsize
+        total = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / total, 3) if total else 0.0
+        return stats
@@ -1,17 +1,24 @@
 # routes/admin_orders_routes.py
 
+import json
+import time
 import psycopg2
 import psycopg2.extras
-from flask import Blueprint, request, jsonify, render_template, session, redirect, url_for
+from flask import Blueprint, request, jsonify, render_template, session, redirect, url_for, Response, stream_with_context
 import bcrypt
-from datetime import date, datetime
+from datetime import datetime
 
-# 💡 引入您的綠界發票功能 (加上了 print_ecpay_invoice)
-from ecpay_invoice import invalid_ecpay_invoice, issue_ecpay_invoice, print_ecpay_invoice
+# 💡 引入您的綠界發票功能 (列印發票改經由 invoice_print_cache)
+from ecpay_invoice import invalid_ecpay_invoice
 
 import database
 from database import get_db_connection
 from utils import login_required, role_required  
+from business_day import tw_today, day_range, days_range
+from kitchen_events import notify_order_changed
+import print_spooler
+import invoice_outbox
+import invoice_print_cache
 
 admin_orders_bp = Blueprint('admin_orders', __name__)
 
@@ -79,14 +86,29 @@ def void_invoice():
     
     if not invoice_no:
         return jsonify({"success": False, "message": "缺少發票號碼"})
-        
-    result = invalid_ecpay_invoice(invoice_no, reason)
+
+    # 綠界作廢要帶發票的開立日期 (不是今天)
+    invoice_date = None
+    try:
+        c = get_db_connection()
+        cur = c.cursor()
+        cur.execute("SELECT id FROM orders WHERE invoice_number=%s ORDER BY id DESC LIMIT 1", (invoice_no,))
+        row = cur.fetchone()
+        if row:
+            invoice_date = invoice_outbox.invoice_date_of(cur, row[0], invoice_no)
+        c.rollback()
+        c.close()
+    except Exception as e:
+        print(f"[{get_current_time_str()}] DB Error (void_invoice): {e}")
+
+    result = invalid_ecpay_invoice(invoice_no, reason, invoice_date)
     
     if result.get("success"):
         try:
             c = get_db_connection()
             cur = c.cursor()
             cur.execute("UPDATE orders SET invoice_status='Void' WHERE invoice_number=%s", (invoice_no,))
+            invoice_print_cache.invalidate(cur, invoice_no)
             c.commit()
             c.close()
         except Exception as e:
@@ -107,27 +129,20 @@ def issue_invoice():
         
     try:
         c = get_db_connection()
-        cur = c.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cur.execute("SELECT * FROM orders WHERE id=%s", (order_id,))
-        order_data = cur.fetchone()
+        cur = c.cursor()
+        cur.execute("SELECT 1 FROM orders WHERE id=%s", (order_id,))
+        found = cur.fetchone()
+        c.close()
         
-        if not order_data:
-             c.close()
+        if not found:
              return jsonify({"success": False, "message": "找不到該筆訂單"})
-             
-        result = issue_ecpay_invoice(order_data)
-        
+
+        # 與批次作業相同，經過發票佇列立即開立：送出期間工作為 sending (此時作廢訂單會自動排入發票作廢)，
+        # 失敗留在佇列自動重試；呼叫綠界期間不占用資料庫連線
+        result = invoice_outbox.run_order(int(order_id), 'issue', f"admin:{session.get('username')}",
+                                          prefetch_async=True)
         if result.get("success"):
-            new_invoice_no = result.get("invoice_no")
-            cur.execute("""
-                UPDATE orders 
-                SET invoice_number=%s, invoice_status='Issued' 
-                WHERE id=%s
-            """, (new_invoice_no, order_id))
-            c.commit()
-            print(f"[{get_current_time_str()}] 🧾 後台發票開立成功: {new_invoice_no}")
-            
-        c.close()
+            print(f"[{get_current_time_str()}] 🧾 後台發票開立成功: {result.get('invoice_no')}")
         return jsonify(result)
         
     except Exception as e:
@@ -135,6 +150,67 @@ def issue_invoice():
         return jsonify({"success": False, "message": "開立發票發生系統錯誤"})
 
 
+# ==========================================
+# 📦 批次開立 / 作廢 (綠界停擺後補開；逐筆以 NDJSON 串流回報進度)
+# ==========================================
+@admin_orders_bp.route('/api/invoice/bulk', methods=['POST'])
+@login_required
+@role_required('admin')
+def bulk_invoice():
+    """
+    action=issue：日期區間內已出餐但發票未開立的訂單全部開立
+    action=void ：日期區間內已作廢但發票仍為已開立的訂單全部作廢
+    dry_run=true 時只回傳對象清單 (給確認視窗用)；否則每處理完一筆回傳一行 JSON
+    """
+    data = request.json or {}
+    action = data.get('action')
+    if action not in ('issue', 'void'):
+        return jsonify({"success": False, "message": "不支援的批次動作"}), 400
+
+    start_date = data.get('start_date') or tw_today().strftime('%Y-%m-%d')
+    end_date = data.get('end_date') or start_date
+    try:
+        start, end = days_range(start_date, end_date)
+    except ValueError:
+        return jsonify({"success": False, "message": "日期格式錯誤"}), 400
+    if end <= start:
+        return jsonify({"success": False, "message": "結束日期不可早於開始日期"}), 400
+
+    c = get_db_connection()
+    cur = c.cursor()
+    targets = invoice_outbox.bulk_targets(cur, action, start, end)
+    c.close()
+
+    if data.get('dry_run'):
+        return jsonify({"success": True, "total": len(targets), "order_ids": [oid for oid, _ in targets],
+                        "limit": invoice_outbox.BULK_LIMIT})
+
+    worker = f"bulk:{session.get('username')}"
+    reason = (data.get('reason') or '後台批次作廢')[:20]
+    label = '開立' if action == 'issue' else '作廢'
+
+    def generate():
+        ok = failed = 0
+        t0 = time.monotonic()
+        print(f"[{get_current_time_str()}] 📦 批次{label}發票開始: {start_date} ~ {end_date} 共 {len(targets)} 筆 ({worker})")
+        yield json.dumps({"type": "start", "action": action, "total": len(targets)}) + "\n"
+        for res in invoice_outbox.bulk_run(action, targets, worker, reason):
+            if res.get('success'):
+                ok += 1
+            else:
+                failed += 1
+            res.update(type="result", done=ok + failed, total=len(targets))
+            yield json.dumps(res, ensure_ascii=False) + "\n"
+        seconds = round(time.monotonic() - t0, 1)
+        print(f"[{get_current_time_str()}] 📦 批次{label}發票結束: 成功 {ok} 筆、失敗 {failed} 筆 ({seconds} 秒)")
+        yield json.dumps({"type": "end", "success": ok, "failed": failed, "seconds": seconds}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # 避免反向代理緩衝住進度
+    })
+
+
 # ==========================================
 # 🛑 核心作廢路由：確保帳務防呆
 # ==========================================
@@ -159,7 +235,8 @@ def admin_cancel_order(oid):
 
         # 2. 如果這單有發票且尚未作廢，先執行綠界發票作廢
         if invoice_no and invoice_status == 'Issued':
-            void_res = invalid_ecpay_invoice(invoice_no, f"訂單 {oid} 作廢連動")
+            invoice_date = invoice_outbox.invoice_date_of(cur, oid, invoice_no)
+            void_res = invalid_ecpay_invoice(invoice_no, f"訂單 {oid} 作廢連動", invoice_date)
             
             # 🛑 阻斷機制
             if not void_res.get('success'):
@@ -174,9 +251,17 @@ def admin_cancel_order(oid):
             # 作廢成功，更新發票狀態
             print(f"[{get_current_time_str()}] 🗑️ 發票作廢成功: {invoice_no}")
             cur.execute("UPDATE orders SET invoice_status='Void' WHERE id=%s", (oid,))
+            invoice_print_cache.invalidate(cur, invoice_no)
 
         # 3. 再將「訂單」狀態改為 Cancelled
-        cur.execute("UPDATE orders SET status='Cancelled' WHERE id=%s", (oid,))
+        cur.execute("UPDATE orders SET status='Cancelled' WHERE id=%s RETURNING invoice_number, invoice_status", (oid,))
+        current = cur.fetchone()
+        print_spooler.hold_order(cur, oid)
+        # 發票佇列還沒送出的開立取消；讀取訂單後才由 worker 寫回的發票改排入作廢
+        invoice_outbox.cancel_pending(cur, oid)
+        if current and current['invoice_status'] == 'Issued' and current['invoice_number'] != invoice_no:
+            invoice_outbox.enqueue_void(cur, oid, current['invoice_number'], f"訂單 {oid} 作廢連動")
+        notify_order_changed(cur, oid)
         c.commit()
         c.close()
 
@@ -198,7 +283,7 @@ def admin_print_invoice(invoice_no):
     """向綠界索取發票 HTML 並回傳給瀏覽器"""
     try:
         print(f"[{get_current_time_str()}] 🖨️ 準備列印發票: {invoice_no}")
-        result = print_ecpay_invoice(invoice_no)
+        result = invoice_print_cache.get_invoice_html(invoice_no)
         
         if result.get("success"):
             return result.get("html")
@@ -221,7 +306,7 @@ def admin_orders_page():
     search_invoice = request.args.get('invoice_no', '').strip()
     
     if not search_date and not search_invoice:
-        search_date = date.today().strftime('%Y-%m-%d')
+        search_date = tw_today().strftime('%Y-%m-%d')
 
     # 使用 psycopg2 直接取資料以避免 database.py 發生欄位衝突
     c = get_db_connection()
@@ -230,8 +315,8 @@ def admin_orders_page():
     if search_invoice:
         cur.execute("SELECT * FROM orders WHERE invoice_number = %s ORDER BY id DESC", (search_invoice,))
     else:
-        # 假設您的日期欄位叫做 created_at，若不同請自行調整
-        cur.execute("SELECT * FROM orders WHERE DATE(created_at) = %s ORDER BY id DESC", (search_date,))
+        # 依台灣營業日查詢 (UTC 半開區間，可使用 created_at 索引)
+        cur.execute("SELECT * FROM orders WHERE created_at >= %s AND created_at < %s ORDER BY id DESC", day_range(search_date))
         
     orders = cur.fetchall()
     c.close()
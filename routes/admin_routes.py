@@ -12,6 +12,13 @@ from flask import Blueprint, render_template, request, redirect, url_for, jsonif
 
 # 從資料庫模組匯入連線函式 (PostgreSQL)
 from database import get_db_connection
+# 設定快照：儲存後通知所有 worker 重新載入
+from settings_cache import get_settings, notify_settings_changed, invalidate as invalidate_settings
+# 商品目錄快照：修改商品後通知所有 worker 重新載入
+from catalog import notify_catalog_changed, invalidate as invalidate_catalog
+from business_day import days_range
+from order_partitions import delete_range
+from network_printer import SETTING_KEYS, parse_address
 # 從 utils 匯入發信功能
 from utils import send_daily_report
 
@@ -93,7 +100,9 @@ def admin_panel():
                         VALUES (%s, %s) 
                         ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
                     """, (k, v))
+                notify_settings_changed(cur)
                 conn.commit()
+                invalidate_settings()
                 
                 should_test = (request.form.get('test_connection') == 'on') or (action == 'test_email')
 
@@ -174,7 +183,9 @@ def admin_panel():
                     request.form.get('custom_options'), request.form.get('custom_options_en'), request.form.get('custom_options_jp'), request.form.get('custom_options_kr'),
                     request.form.get('category_en'), request.form.get('category_jp'), request.form.get('category_kr')
                 ))
+                notify_catalog_changed(cur)
                 conn.commit()
+                invalidate_catalog()
                 msg = "✅ 品項已新增"
             except Exception as e:
                 conn.rollback()
@@ -185,9 +196,7 @@ def admin_panel():
 
     # --- GET: 讀取資料顯示頁面 ---
     try:
-        cur.execute("SELECT key, value FROM settings")
-        settings_rows = cur.fetchall()
-        config = {row[0]: row[1] for row in settings_rows} 
+        config = get_settings().as_dict()
         
         toggle_keys = ['shop_open', 'enable_delivery', 'delivery_enabled']
         for key in toggle_keys:
@@ -243,7 +252,9 @@ def update_delivery_settings():
                 ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
             """, (key, str(val)))
         
+        notify_settings_changed(cur)
         conn.commit()
+        invalidate_settings()
         msg = "✅ 外送設定已更新 (含運費規則)"
     except Exception as e:
         conn.rollback()
@@ -255,6 +266,46 @@ def update_delivery_settings():
     return redirect(url_for('admin.admin_panel', msg=msg))
 
 
+# ==========================================
+# 網路印表機位址 (表單提交)
+# ==========================================
+@admin_bp.route('/settings/printers', methods=['POST'])
+@login_required
+@role_required('admin')
+def update_printer_settings():
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        settings_to_update = {}
+        for key in SETTING_KEYS.values():
+            val = (request.form.get(key) or '').strip()
+            parse_address(val)  # 格式錯誤時丟出 ValueError，整批不儲存
+            settings_to_update[key] = val
+
+        for key, val in settings_to_update.items():
+            cur.execute("""
+                INSERT INTO settings (key, value) 
+                VALUES (%s, %s) 
+                ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
+            """, (key, val))
+
+        notify_settings_changed(cur)
+        conn.commit()
+        invalidate_settings()
+        msg = "✅ 網路印表機設定已更新"
+    except ValueError as e:
+        conn.rollback()
+        msg = f"❌ {e}"
+    except Exception as e:
+        conn.rollback()
+        msg = f"❌ 設定更新失敗: {e}"
+        traceback.print_exc()
+    finally:
+        cur.close(); conn.close()
+
+    return redirect(url_for('admin.admin_panel', msg=msg))
+
+
 # ==========================================
 # 通用設定切換路由 (AJAX) - 開關店、開關外送
 # ==========================================
@@ -289,7 +340,9 @@ def toggle_config():
                 ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
             """, (k, new_val))
 
+        notify_settings_changed(cur)
         conn.commit()
+        invalidate_settings()
         return jsonify({'status': 'success', 'new_value': (new_val == '1')})
 
     except Exception as e:
@@ -329,7 +382,9 @@ def edit_product(pid):
                 request.form.get('category_en'), request.form.get('category_jp'), request.form.get('category_kr'),
                 pid
             ))
+            notify_catalog_changed(cur)
             conn.commit()
+            invalidate_catalog()
             return redirect(url_for('admin.admin_panel', msg="✅ 產品已更新"))
         except Exception as e:
             conn.rollback()
@@ -495,7 +550,9 @@ def import_menu():
             cur.execute(sql, params)
             cnt += 1
             
+        notify_catalog_changed(cur)
         conn.commit()
+        invalidate_catalog()
         cur.close(); conn.close()
         return redirect(url_for('admin.admin_panel', msg=f"✅ 完整匯入成功！共 {cnt} 筆資料"))
         
@@ -509,7 +566,9 @@ def import_menu():
 def reset_menu():
     conn = get_db_connection(); cur = conn.cursor()
     cur.execute("TRUNCATE TABLE products RESTART IDENTITY CASCADE")
+    notify_catalog_changed(cur)
     conn.commit(); cur.close(); conn.close()
+    invalidate_catalog()
     return redirect(url_for('admin.admin_panel', msg="🗑️ 菜單已清空"))
 
 @admin_bp.route('/reset_orders', methods=['POST'])
@@ -523,7 +582,8 @@ def reset_orders():
         delete_mode = request.form.get('delete_mode')
         
         if delete_mode == 'all':
-            cur.execute("TRUNCATE TABLE orders RESTART IDENTITY CASCADE")
+            # order_items 已不是 orders 的外鍵，需一起清空；流水號計數也一併歸零
+            cur.execute("TRUNCATE TABLE orders, order_items, daily_counters RESTART IDENTITY")
             msg = "💥 已清空所有歷史訂單，流水號已重置！"
             
         elif delete_mode == 'range':
@@ -533,16 +593,8 @@ def reset_orders():
             if not start_date or not end_date:
                 return redirect(url_for('admin.admin_panel', msg="❌ 請選擇完整的開始與結束日期"))
             
-            start_ts = f"{start_date} 00:00:00"
-            end_ts = f"{end_date} 23:59:59"
-            
-            cur.execute("""
-                DELETE FROM orders 
-                WHERE (created_at + interval '8 hours') >= %s 
-                  AND (created_at + interval '8 hours') <= %s
-            """, (start_ts, end_ts))
-            
-            deleted_count = cur.rowcount
+            # 台灣營業日 start_date ~ end_date (含) -> UTC 半開區間；整個月份直接 TRUNCATE 該分割
+            deleted_count = delete_range(cur, *days_range(start_date, end_date))
             msg = f"🗑️ 已刪除 {start_date} 至 {end_date} 期間的訂單，共 {deleted_count} 筆。"
             
         else:
@@ -571,7 +623,9 @@ def toggle_product(pid):
         if row:
             new_s = not row[0]
             cur.execute("UPDATE products SET is_available = %s WHERE id = %s", (new_s, pid))
+            notify_catalog_changed(cur)
             conn.commit()
+            invalidate_catalog()
             return jsonify({'status': 'success', 'is_available': new_s})
         
         return jsonify({'status': 'error', 'message': 'Product not found'}), 404
@@ -587,7 +641,9 @@ def toggle_product(pid):
 def delete_product(pid):
     conn = get_db_connection(); cur = conn.cursor()
     cur.execute("DELETE FROM products WHERE id = %s", (pid,))
+    notify_catalog_changed(cur)
     conn.commit(); cur.close(); conn.close()
+    invalidate_catalog()
     return redirect(url_for('admin.admin_panel', msg="🗑️ 產品已刪除"))
 
 @admin_bp.route('/reorder_products', methods=['POST'])
@@ -599,7 +655,9 @@ def reorder_products():
     try:
         for idx, pid in enumerate(data.get('order', [])):
             cur.execute("UPDATE products SET sort_order = %s WHERE id = %s", (idx, pid))
+        notify_catalog_changed(cur)
         conn.commit()
+        invalidate_catalog()
         return jsonify({'status': 'success'})
     except Exception as e:
         conn.rollback()
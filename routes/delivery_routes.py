@@ -3,7 +3,7 @@ from datetime import datetime, timedelta, time
 from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut, GeocoderUnavailable, GeocoderServiceError
 from haversine import haversine, Unit
-from database import get_db_connection
+from settings_cache import get_settings
 import re
 import random
 
@@ -17,23 +17,17 @@ def get_delivery_settings():
     從資料庫讀取外送設定
     確保欄位名稱與 database.py 的設定 (settings 表) 完全一致
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT key, value FROM settings")
-    rows = cur.fetchall()
-    conn.close()
-    
-    # 將資料轉為字典，例如: {'delivery_fee_base': '0', 'delivery_max_km': '5', ...}
-    s = {row[0]: row[1] for row in rows}
+    # 由記憶體快照提供，不必每次 /delivery/check 都查一次 settings 表
+    s = get_settings()
     
     return {
-        'enabled': s.get('delivery_enabled', '1') == '1',
-        'min_price': int(s.get('delivery_min_price', 500)),
+        'enabled': s.delivery_enabled,
+        'min_price': s.delivery_min_price,
         
         # --- 修正處：確保這裡讀取的是 database.py 定義的鍵名 ---
-        'max_km': float(s.get('delivery_max_km', 5.0)),          # 最大距離
-        'base_fee': int(s.get('delivery_fee_base', 0)),          # 基礎運費 (對應 DB 的 delivery_fee_base)
-        'fee_per_km': int(s.get('delivery_fee_per_km', 10))      # 每公里加價
+        'max_km': s.delivery_max_km,          # 最大距離
+        'base_fee': s.delivery_fee_base,      # 基礎運費 (對應 DB 的 delivery_fee_base)
+        'fee_per_km': s.delivery_fee_per_km   # 每公里加價
     }
 
 def normalize_address(addr):
@@ -1,53 +1,33 @@
-from flask import Blueprint, render_template, request, jsonify, render_template_string, redirect, url_for, session
+from flask import Blueprint, render_template, request, jsonify, render_template_string, redirect, url_for, session, Response, stream_with_context
+import os
+import re
 import json
 import base64  
-import psycopg2.extras
 import traceback  
 import bcrypt  # 💡 新增：引入 bcrypt 用來驗證密碼
 #引入綠界發票api
-from ecpay_invoice import issue_ecpay_invoice, invalid_ecpay_invoice, print_ecpay_invoice
+from ecpay_invoice import get_ecpay_stats
+import invoice_print_cache
 # 🛡️ 引入我們在 utils.py 寫好的雙重防護罩
 from utils import login_required, role_required
 from datetime import datetime, timedelta
-from database import get_db_connection
+from database import get_db_connection, get_pool_stats
+from catalog import get_catalog
+from kitchen_events import notify_order_changed, open_stream, stream_available, get_stream_stats
+from render_cache import RenderCache
+import singleflight
+import tickets
+import print_spooler
+import network_printer
+import invoice_outbox
+# 台灣營業日時間範圍 (一律使用 UTC 半開區間)
+from business_day import parse_range, tw_now, tw_today, day_range
 
 kitchen_bp = Blueprint('kitchen', __name__)
 
 # --- 輔助函式：取得當前台灣時間字串 (用於 Log) ---
 def get_current_time_str():
-    return (datetime.utcnow() + timedelta(hours=8)).strftime("%Y-%m-%d %H:%M:%S")
-
-# --- 輔助函式：計算台灣時間範圍 ---
-def get_tw_time_range(target_date_str=None, end_date_str=None):
-    try:
-        if target_date_str and 'T' in target_date_str:
-            tw_start = datetime.strptime(target_date_str, '%Y-%m-%dT%H:%M')
-            is_specific_time = True
-        elif target_date_str:
-            tw_start = datetime.strptime(target_date_str, '%Y-%m-%d')
-            is_specific_time = False
-        else:
-            tw_start = datetime.utcnow() + timedelta(hours=8)
-            is_specific_time = False
-        
-        if not is_specific_time:
-            tw_start = tw_start.replace(hour=0, minute=0, second=0, microsecond=0)
-
-        if end_date_str and 'T' in end_date_str:
-            tw_end = datetime.strptime(end_date_str, '%Y-%m-%dT%H:%M')
-        elif end_date_str:
-            tw_end = datetime.strptime(end_date_str, '%Y-%m-%d')
-            tw_end = tw_end.replace(hour=23, minute=59, second=59, microsecond=999999)
-        else:
-            tw_end = tw_start.replace(hour=23, minute=59, second=59, microsecond=999999)
-        
-        return tw_start - timedelta(hours=8), tw_end - timedelta(hours=8)
-
-    except Exception as e:
-        print(f"Time Range Error: {e}")
-        now = datetime.utcnow() + timedelta(hours=8)
-        return now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(hours=8), \
-               now.replace(hour=23, minute=59, second=59, microsecond=999999) - timedelta(hours=8)
+    return tw_now().strftime("%Y-%m-%d %H:%M:%S")
 
 # ==========================================
 # 🛡️ 登入與登出系統
@@ -109,528 +89,620 @@ def logout():
 @kitchen_bp.route('/')
 @login_required          # 🛡️ 防護 1：必須登入
 def kitchen_panel():
-    return render_template('kitchen.html')
+    return render_template('kitchen.html', recent_done=KITCHEN_RECENT_DONE)
 
 
 # --- 2. 檢查新訂單 API ---
-@kitchen_bp.route('/check_new_orders')
-#@login_required          # 🛡️ 防護 1：必須登入
-def check_new_orders():
-    try:
-        # 【關鍵修改 1】：接收前端傳來的最後一次看過的序號 (預設為 0)
-        last_seq = request.args.get('last_seq', 0, type=int)
+# 看板卡片需要的欄位 (render_order_card 依此順序解包)
+CARD_COLUMNS = """
+    id, table_number, items, total_price, status, created_at, lang, daily_seq, content_json,
+    customer_name, customer_phone, customer_address, scheduled_for, delivery_fee, order_type,
+    invoice_number, invoice_status, tax_id, carrier_type, carrier_num, row_version
+"""
+EMPTY_BOARD_HTML = "<div id='loading-msg' style='grid-column:1/-1;text-align:center;padding:100px;font-size:1.5em;color:#888;'>🍽️ 目前沒有訂單</div>"
+_CURSOR_PATTERN = re.compile(r'^(\d{4}-\d{2}-\d{2}):(\d+)$')
 
-        utc_start, utc_end = get_tw_time_range()
+# 卡片 HTML 快取：訂單沒變 (row_version 相同) 就直接沿用上次產生的片段
+KITCHEN_CARD_CACHE_SIZE = int(os.environ.get("KITCHEN_CARD_CACHE_SIZE", "1000"))
+_card_cache = RenderCache(maxsize=KITCHEN_CARD_CACHE_SIZE)
 
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # SQL 查詢：加入發票相關的 5 個欄位
-        query = """
-            SELECT id, table_number, items, total_price, status, created_at, lang, daily_seq, content_json,
-                   customer_name, customer_phone, customer_address, scheduled_for, delivery_fee, order_type,
-                   invoice_number, invoice_status, tax_id, carrier_type, carrier_num
-            FROM orders 
-            WHERE created_at >= %s AND created_at <= %s
-            ORDER BY 
-                CASE WHEN status = 'Pending' THEN 0 
-                     WHEN status = 'Completed' THEN 1 
-                     ELSE 2 END, 
-                daily_seq ASC
-        """
-        try:
-            cur.execute(query, (utc_start, utc_end))
-        except Exception as e:
-            conn.rollback() 
-            print(f"SQL Fallback triggered (check_new_orders): {e}")
-            # Fallback (加入發票相關的 5 個欄位)
-            query_fallback = """
-                SELECT id, table_number, items, total_price, status, created_at, lang, daily_seq, content_json,
-                       customer_name, customer_phone, customer_address, scheduled_for, delivery_fee, 'unknown',
-                       invoice_number, invoice_status, tax_id, carrier_type, carrier_num
-                FROM orders 
-                WHERE created_at >= %s AND created_at <= %s
-                ORDER BY status, daily_seq ASC
-            """
-            cur.execute(query_fallback, (utc_start, utc_end))
 
-        orders = cur.fetchall()
+def card_sort_key(status, seq_num):
+    """看板排序：待處理 -> 已完成 -> 已作廢，同狀態依流水號"""
+    rank = 0 if status == 'Pending' else 1 if status == 'Completed' else 2
+    return rank * 100000 + (seq_num or 0)
+
+
+def parse_cursor(cursor, business_date):
+    """
+    看板游標 "營業日:交易版本" -> 版本字串。
+    沒有游標、格式錯誤或已經換日時回傳 None (需要完整重新載入)。
+    """
+    m = _CURSOR_PATTERN.match(cursor or '')
+    if not m or m.group(1) != business_date.isoformat():
+        return None
+    return m.group(2)
+
+
+# 工作站看板 (?station=noodle)：只顯示該出單分類的品項，分類規則與 print_order 分單相同
+STATIONS = {'noodle': 'Noodle', 'soup': 'Soup', 'other': 'Other'}
+
+
+def station_filter(catalog, station):
+    """回傳判斷「品名是否屬於此工作站」的函式；station 為 None 時回傳 None (全部顯示)"""
+    if station is None:
+        return None
+    wanted = STATIONS[station]
+
+    def keep(product_name):
+        category = catalog.print_category(product_name)
+        return (category if category in ('Noodle', 'Soup') else 'Other') == wanted
+    return keep
+
+
+def _has_text(v):
+    return bool(v and str(v).strip() and str(v).strip().lower() != 'none')
+
+
+def order_display_table(c_type, table, c_addr):
+    """看板上的桌號標籤 (外送 / 自取 / 桌號 N)"""
+    table_str = str(table).strip() if table else ""
+    c_type = str(c_type).lower() if c_type else 'unknown'
+    if c_type == 'delivery':
+        return "🛵 外送"
+    if c_type == 'takeout':
+        return "🥡 自取"
+    if c_type == 'dine_in':
+        return f"桌號 {table_str}"
+    # 舊邏輯 Fallback
+    if table_str == '外送' or _has_text(c_addr):
+        return "🛵 外送"
+    if table_str:
+        return f"桌號 {table_str}"
+    return "🥡 外帶"
+
+
+def parse_card_items(c_json):
+    """content_json -> [(品名, 數量, [選項...]), ...]；格式錯誤時丟出例外"""
+    if isinstance(c_json, str):
+        cart = json.loads(c_json)
+    elif isinstance(c_json, (list, dict)):
+        cart = c_json if isinstance(c_json, list) else [c_json]
+    else:
+        cart = []
+    return [(item.get('name_zh', item.get('name', '商品')),
+             item.get('qty', 1),
+             item.get('options_zh', item.get('options', [])) or [])
+            for item in cart]
+
+
+def order_card_model(o, item_filter=None):
+    """
+    把一筆訂單 (CARD_COLUMNS) 轉成看板用的精簡 JSON，由 kitchen.html 在前端組成卡片。
+    空白的欄位一律省略以縮小傳輸量。
+    item_filter 為 station_filter() 的結果；過濾後沒有任何品項時回傳 None (此工作站不顯示這張單)。
+    """
+    oid, table, raw_items, total, status, created, order_lang, seq_num, c_json, \
+    c_name, c_phone, c_addr, c_schedule, c_fee, c_type, \
+    inv_num, inv_status, tax_id, carrier_type, carrier_num, row_version = o
+
+    model = {
+        'id': oid,
+        'seq': seq_num or 0,
+        'status': status,
+        'sort': card_sort_key(status, seq_num),
+        'v': str(row_version),
+        'time': (created + timedelta(hours=8)).strftime('%H:%M'),
+        'lang': order_lang,
+        'table': order_display_table(c_type, table, c_addr),
+        'total': int(total or 0),
+        'inv': str(inv_status).strip() if inv_status else 'Not Issued',
+    }
+    if int(c_fee or 0) > 0:
+        model['fee'] = int(c_fee)
+    for key, value in (('schedule', c_schedule), ('name', c_name), ('phone', c_phone), ('addr', c_addr),
+                       ('inv_no', inv_num), ('tax_id', tax_id), ('carrier', carrier_type)):
+        if _has_text(value):
+            model[key] = str(value).strip()
+    if 'carrier' in model:
+        model['carrier_num'] = str(carrier_num).strip() if carrier_num else ""
+    try:
+        items = parse_card_items(c_json)
+    except Exception:
+        model['items'] = None  # 前端顯示「資料解析錯誤」
+        return model
+    if item_filter is not None:
+        items = [i for i in items if item_filter(i[0])]
+        if not items:
+            return None
+    model['items'] = [[name, qty, options] for name, qty, options in items]
+    return model
+
+
+def render_order_card(o, item_filter=None):
+    """
+    把一筆訂單 (CARD_COLUMNS) 組成看板卡片 HTML (舊版看板與 format=html 使用)。
+    item_filter 的用法同 order_card_model。
+    """
+    try:
+        # 解包變數 (欄位順序見 CARD_COLUMNS)
+        oid, table, raw_items, total, status, created, order_lang, seq_num, c_json, \
+        c_name, c_phone, c_addr, c_schedule, c_fee, c_type, \
+        inv_num, inv_status, tax_id, carrier_type, carrier_num, row_version = o
         
-        # 取得目前最大序號
-        cur.execute("SELECT MAX(daily_seq) FROM orders WHERE created_at >= %s AND created_at <= %s", (utc_start, utc_end))
-        res_max = cur.fetchone()
-        max_seq_val = res_max[0] if res_max and res_max[0] else 0
+        status_cls = status.lower()
+        tw_time = created + timedelta(hours=8)
         
-        conn.close()
+        # 資料預處理
+        c_fee = int(c_fee or 0)
+        
+        # 判斷是否為外送/外帶/預約
+        has_contact = _has_text(c_phone)
+        has_addr = _has_text(c_addr)
+        has_schedule = _has_text(c_schedule)
+        display_table = order_display_table(c_type, table, c_addr)
+
+        # 組合詳細資訊 (HTML)
+        info_html = ""
+        
+        # 預約時間顯示 (醒目)
+        if has_schedule:
+            info_html += f"<div style='background:#fff9c4; color:#f57f17; padding:4px; border-radius:4px; margin-bottom:4px; font-weight:bold; border:1px solid #fbc02d;'>🕒 預約: {c_schedule}</div>"
 
-        html_content = ""
-        pending_ids = []
+        # 姓名
+        if c_name and str(c_name).strip() and str(c_name).lower() != 'none': 
+            info_html += f"<div>👤 {c_name}</div>"
+        
+        # 電話
+        if has_contact:
+            info_html += f"<div>📞 {c_phone}</div>"
+        
+        # 地址顯示
+        if has_addr:
+            info_html += f"<div style='margin-top:2px; line-height:1.2; border-top:1px dashed #aaa; padding-top:2px; font-weight:bold; color:#bf360c;'>📍 {c_addr}</div>"
 
-        if not orders: 
-            html_content = "<div id='loading-msg' style='grid-column:1/-1;text-align:center;padding:100px;font-size:1.5em;color:#888;'>🍽️ 目前沒有訂單</div>"
+        # 🧾 【新增】發票資訊區塊
+        inv_html = "<div style='margin-top:6px; padding-top:4px; border-top:1px dashed #ccc; font-size:0.95em; color:#475569;'>"
         
-        for o in orders:
-            # 解包變數 (確保變數數量擴充至 20)
-            oid, table, raw_items, total, status, created, order_lang, seq_num, c_json, \
-            c_name, c_phone, c_addr, c_schedule, c_fee, c_type, \
-            inv_num, inv_status, tax_id, carrier_type, carrier_num = o
+        # 處理發票狀態
+        inv_status_str = str(inv_status).strip() if inv_status else 'Not Issued'
+        if inv_status_str == 'Issued':
+            status_badge = "<span style='color:#10b981; font-weight:bold;'>✅ 已開立</span>"
+        elif inv_status_str == 'Void':
+            status_badge = "<span style='color:#ef4444; font-weight:bold;'>❌ 已作廢</span>"
+        else:
+            status_badge = "<span style='color:#f59e0b; font-weight:bold;'>⏳ 未開立</span>"
             
-            status_cls = status.lower()
-            tw_time = created + timedelta(hours=8)
+        inv_num_display = str(inv_num).strip() if inv_num else "無"
+        inv_html += f"<div style='margin-bottom:2px;'>🧾 發票: {inv_num_display} {status_badge}</div>"
+        
+        # 處理統編
+        if tax_id and str(tax_id).strip():
+            inv_html += f"<div style='margin-bottom:2px;'>🏢 統編: <span style='font-weight:bold; color:#0f172a;'>{tax_id}</span></div>"
             
-            # 【關鍵修改 2】：只有當狀態是 Pending，且單號「大於」前端已知的 last_seq 時，才視為真正的新訂單
-            if status == 'Pending' and seq_num > last_seq:
-                pending_ids.append(oid)
-
-            # 資料預處理
-            table_str = str(table).strip() if table else ""
-            c_fee = int(c_fee or 0)
-            c_type = str(c_type).lower() if c_type else 'unknown'
+        # 處理載具
+        if carrier_type and str(carrier_type).strip():
+            ctype = str(carrier_type).strip()
+            cname = "載具"
+            if ctype == '3': cname = "📱 手機條碼"
+            elif ctype == '2': cname = "💳 自然人憑證"
+            elif ctype in ['don', '4']: cname = "❤️ 愛心捐贈"
             
-            # 判斷是否為外送/外帶/預約
-            has_contact = (c_phone and str(c_phone).strip() != '' and str(c_phone).strip().lower() != 'none')
-            has_addr = (c_addr and str(c_addr).strip() != '' and str(c_addr).strip().lower() != 'none')
-            has_schedule = (c_schedule and str(c_schedule).strip() != '' and str(c_schedule).lower() != 'none')
-
-            # 邏輯判斷
-            if c_type == 'delivery':
-                is_delivery = True
-                display_table = "🛵 外送"
-            elif c_type == 'takeout':
-                is_delivery = False
-                display_table = "🥡 自取"
-            elif c_type == 'dine_in':
-                is_delivery = False
-                display_table = f"桌號 {table_str}"
-            else:
-                # 舊邏輯 Fallback
-                is_delivery = (table_str == '外送') or has_addr
-                if is_delivery:
-                    display_table = "🛵 外送"
-                elif table_str:
-                    display_table = f"桌號 {table_str}"
-                else:
-                    display_table = "🥡 外帶"
-
-            # 組合詳細資訊 (HTML)
-            info_html = ""
+            cnum = str(carrier_num).strip() if carrier_num else ""
+            inv_html += f"<div>{cname}: <span style='font-weight:bold; color:#0f172a;'>{cnum}</span></div>"
             
-            # 預約時間顯示 (醒目)
-            if has_schedule:
-                info_html += f"<div style='background:#fff9c4; color:#f57f17; padding:4px; border-radius:4px; margin-bottom:4px; font-weight:bold; border:1px solid #fbc02d;'>🕒 預約: {c_schedule}</div>"
+        inv_html += "</div>"
+        info_html += inv_html
 
-            # 姓名
-            if c_name and str(c_name).strip() and str(c_name).lower() != 'none': 
-                info_html += f"<div>👤 {c_name}</div>"
-            
-            # 電話
-            if has_contact:
-                info_html += f"<div>📞 {c_phone}</div>"
-            
-            # 地址顯示
-            if has_addr:
-                info_html += f"<div style='margin-top:2px; line-height:1.2; border-top:1px dashed #aaa; padding-top:2px; font-weight:bold; color:#bf360c;'>📍 {c_addr}</div>"
+        # 將詳細資訊嵌入桌號區塊
+        if info_html:
+            table_html = f"<div class='table-num' style='flex-direction:column; padding:5px;'><div>{display_table}</div><div style='font-size:0.5em; font-weight:normal; text-align:left; width:100%; margin-top:5px; color:#333; word-break:break-all;'>{info_html}</div></div>"
+        else:
+            table_html = f"<div class='table-num'>{display_table}</div>"
 
-            # 🧾 【新增】發票資訊區塊
-            inv_html = "<div style='margin-top:6px; padding-top:4px; border-top:1px dashed #ccc; font-size:0.95em; color:#475569;'>"
-            
-            # 處理發票狀態
-            inv_status_str = str(inv_status).strip() if inv_status else 'Not Issued'
-            if inv_status_str == 'Issued':
-                status_badge = "<span style='color:#10b981; font-weight:bold;'>✅ 已開立</span>"
-            elif inv_status_str == 'Void':
-                status_badge = "<span style='color:#ef4444; font-weight:bold;'>❌ 已作廢</span>"
-            else:
-                status_badge = "<span style='color:#f59e0b; font-weight:bold;'>⏳ 未開立</span>"
-                
-            inv_num_display = str(inv_num).strip() if inv_num else "無"
-            inv_html += f"<div style='margin-bottom:2px;'>🧾 發票: {inv_num_display} {status_badge}</div>"
-            
-            # 處理統編
-            if tax_id and str(tax_id).strip():
-                inv_html += f"<div style='margin-bottom:2px;'>🏢 統編: <span style='font-weight:bold; color:#0f172a;'>{tax_id}</span></div>"
-                
-            # 處理載具
-            if carrier_type and str(carrier_type).strip():
-                ctype = str(carrier_type).strip()
-                cname = "載具"
-                if ctype == '3': cname = "📱 手機條碼"
-                elif ctype == '2': cname = "💳 自然人憑證"
-                elif ctype in ['don', '4']: cname = "❤️ 愛心捐贈"
-                
-                cnum = str(carrier_num).strip() if carrier_num else ""
-                inv_html += f"<div>{cname}: <span style='font-weight:bold; color:#0f172a;'>{cnum}</span></div>"
-                
-            inv_html += "</div>"
-            info_html += inv_html
+        # 解析商品 JSON
+        items_html = ""
+        try:
+            cart = parse_card_items(c_json)
+            if item_filter is not None:
+                cart = [i for i in cart if item_filter(i[0])]
+                if not cart:
+                    return None
+            for name, qty, options in cart:
+                opts_html = f"<div class='item-opts'>└ {' / '.join(options)}</div>" if options else ""
+                items_html += f"<div class='item-row'><div class='item-name'><span>{name}</span><span class='item-qty'>x{qty}</span></div>{opts_html}</div>"
+        except Exception as e: 
+            items_html = "<div class='item-row'>資料解析錯誤</div>"
+
+        formatted_total = f"{int(total or 0)}" 
+        
+        # 運費顯示邏輯
+        fee_html = ""
+        if c_fee > 0:
+            fee_html = f"<span style='font-size:12px; color:#888; margin-right:5px;'>(含運 ${c_fee})</span>"
+
+        buttons = ""
+        print_btn_html = f"<button onclick='askPrintType({oid})' class='btn btn-print' style='flex:1;'>🖨️ 列印</button>"
+
+        if status == 'Pending':
+            buttons += f"""
+                <div style="display:flex; justify-content:space-between; align-items:center; margin-bottom:8px; padding:0 5px;">
+                    <span style="font-size:14px; color:#666; font-weight:bold;">應收總計:</span>
+                    <div>{fee_html}<span style="font-size:22px; color:#d32f2f; font-weight:900;">${formatted_total}</span></div>
+                </div>
+            """
+            buttons += f"<button onclick='action(\"/kitchen/complete/{oid}\")' class='btn btn-main' style='width:100%; margin-bottom:8px;'>✅ 出餐 / 付款</button>"
+            buttons += f"""<div class="btn-group" style="display:flex; gap:5px;">
+                {print_btn_html}
+                <a href='/menu?edit_oid={oid}&lang=zh' target='_blank' class='btn' style='flex:1; background:#ff9800; color:white;'>✏️ 修改</a>
+                <button onclick='if(confirm(\"⚠️ 確定作廢此單？\")) action(\"/kitchen/cancel/{oid}\")' class='btn btn-void' style='width:50px;'>🗑️</button>
+            </div>"""
 
-            # 將詳細資訊嵌入桌號區塊
-            if info_html:
-                table_html = f"<div class='table-num' style='flex-direction:column; padding:5px;'><div>{display_table}</div><div style='font-size:0.5em; font-weight:normal; text-align:left; width:100%; margin-top:5px; color:#333; word-break:break-all;'>{info_html}</div></div>"
-            else:
-                table_html = f"<div class='table-num'>{display_table}</div>"
-
-            # 解析商品 JSON
-            items_html = ""
-            try:
-                if isinstance(c_json, str):
-                    cart = json.loads(c_json)
-                elif isinstance(c_json, (list, dict)):
-                    cart = c_json if isinstance(c_json, list) else [c_json]
-                else:
-                    cart = []
-
-                for item in cart:
-                    name = item.get('name_zh', item.get('name', '商品'))
-                    qty = item.get('qty', 1)
-                    options = item.get('options_zh', item.get('options', []))
-                    opts_html = f"<div class='item-opts'>└ {' / '.join(options)}</div>" if options else ""
-                    items_html += f"<div class='item-row'><div class='item-name'><span>{name}</span><span class='item-qty'>x{qty}</span></div>{opts_html}</div>"
-            except Exception as e: 
-                items_html = "<div class='item-row'>資料解析錯誤</div>"
-
-            formatted_total = f"{int(total or 0)}" 
-            
-            # 運費顯示邏輯
-            fee_html = ""
-            if c_fee > 0:
-                fee_html = f"<span style='font-size:12px; color:#888; margin-right:5px;'>(含運 ${c_fee})</span>"
-
-            buttons = ""
-            print_btn_html = f"<button onclick='askPrintType({oid})' class='btn btn-print' style='flex:1;'>🖨️ 列印</button>"
-
-            if status == 'Pending':
-                buttons += f"""
-                    <div style="display:flex; justify-content:space-between; align-items:center; margin-bottom:8px; padding:0 5px;">
-                        <span style="font-size:14px; color:#666; font-weight:bold;">應收總計:</span>
-                        <div>{fee_html}<span style="font-size:22px; color:#d32f2f; font-weight:900;">${formatted_total}</span></div>
-                    </div>
-                """
-                buttons += f"<button onclick='action(\"/kitchen/complete/{oid}\")' class='btn btn-main' style='width:100%; margin-bottom:8px;'>✅ 出餐 / 付款</button>"
-                buttons += f"""<div class="btn-group" style="display:flex; gap:5px;">
-                    {print_btn_html}
-                    <a href='/menu?edit_oid={oid}&lang=zh' target='_blank' class='btn' style='flex:1; background:#ff9800; color:white;'>✏️ 修改</a>
-                    <button onclick='if(confirm(\"⚠️ 確定作廢此單？\")) action(\"/kitchen/cancel/{oid}\")' class='btn btn-void' style='width:50px;'>🗑️</button>
-                </div>"""
-
-            elif status == 'Cancelled':
-                buttons += f"<div style='text-align:center; color:#d32f2f; font-weight:bold; margin-bottom:5px;'>【此單已作廢】</div>"
-                buttons += f"<button onclick='askPrintType({oid})' class='btn btn-print' style='width:100%; opacity:0.6;'>🖨️ 補印作廢單</button>"
-
-            else: # Completed
-                buttons += f"""
-                    <div style="display:flex; justify-content:space-between; align-items:center; margin-bottom:8px; padding:0 5px; opacity:0.7;">
-                        <span style="font-size:13px; color:#666;">實收總計:</span>
-                        <div>{fee_html}<span style="font-size:18px; color:#333; font-weight:bold;">${formatted_total}</span></div>
-                    </div>
-                """
-                # 👇 修改處：在 Completed 狀態下放入三個按鈕
-                buttons += f"""
-                <div style="display:flex; flex-direction:column; gap:5px;">
-                    <button onclick='askPrintType({oid})' class='btn btn-print' style='width:100%;'>🖨️ 補印單據</button>
+        elif status == 'Cancelled':
+            buttons += f"<div style='text-align:center; color:#d32f2f; font-weight:bold; margin-bottom:5px;'>【此單已作廢】</div>"
+            buttons += f"<button onclick='askPrintType({oid})' class='btn btn-print' style='width:100%; opacity:0.6;'>🖨️ 補印作廢單</button>"
+
+        else: # Completed
+            buttons += f"""
+                <div style="display:flex; justify-content:space-between; align-items:center; margin-bottom:8px; padding:0 5px; opacity:0.7;">
+                    <span style="font-size:13px; color:#666;">實收總計:</span>
+                    <div>{fee_html}<span style="font-size:18px; color:#333; font-weight:bold;">${formatted_total}</span></div>
+                </div>
+            """
+            # 👇 修改處：在 Completed 狀態下放入三個按鈕
+            buttons += f"""
+            <div style="display:flex; flex-direction:column; gap:5px;">
+                <button onclick='askPrintType({oid})' class='btn btn-print' style='width:100%;'>🖨️ 補印單據</button>
+                
+                <div style="display:flex; gap:5px;">
+                    <button onclick='if(confirm(\"⚠️ 確定只要作廢發票，並將此單更改為【作廢狀態】嗎？\")) action(\"/kitchen/cancel/{oid}\")' class='btn' style='flex:1; background:#f44336; color:white; border:none; border-radius:4px; padding:6px; cursor:pointer;'>🗑️ 作廢訂單</button>
                     
-                    <div style="display:flex; gap:5px;">
-                        <button onclick='if(confirm(\"⚠️ 確定只要作廢發票，並將此單更改為【作廢狀態】嗎？\")) action(\"/kitchen/cancel/{oid}\")' class='btn' style='flex:1; background:#f44336; color:white; border:none; border-radius:4px; padding:6px; cursor:pointer;'>🗑️ 作廢訂單</button>
-                        
-                        <button onclick='if(confirm(\"⚠️ 確定要作廢發票並重新修改此單嗎？\")) {{ fetch(\"/kitchen/cancel/{oid}\").then(() => {{ window.open(\"/menu?edit_oid={oid}&lang=zh\", \"_blank\"); window.location.reload(); }}); }}' class='btn' style='flex:1; background:#ff9800; color:white; border:none; border-radius:4px; padding:6px; cursor:pointer;'>✏️ 作廢並修改</button>
-                    </div>
+                    <button onclick='if(confirm(\"⚠️ 確定要作廢發票並重新修改此單嗎？\")) {{ fetch(\"/kitchen/cancel/{oid}\").then(() => {{ window.open(\"/menu?edit_oid={oid}&lang=zh\", \"_blank\"); window.location.reload(); }}); }}' class='btn' style='flex:1; background:#ff9800; color:white; border:none; border-radius:4px; padding:6px; cursor:pointer;'>✏️ 作廢並修改</button>
                 </div>
-                """
+            </div>
+            """
 
-            html_content += f"""
-            <div class="card {status_cls}" data-id="{oid}">
-                <div class="card-header">
-                    <div><div class="seq-num">#{seq_num:03d}</div><div class="time-stamp">{tw_time.strftime('%H:%M')} ({order_lang})</div></div>
-                    {table_html}
-                </div>
-                <div class="items">{items_html}</div>
-                <div class="actions">{buttons}</div>
-            </div>"""
-            
-        return jsonify({
-            'html': html_content, 
-            'max_seq': max_seq_val, 
-            'new_ids': pending_ids 
-        })
+        return f"""
+        <div class="card {status_cls}" data-id="{oid}" data-sort="{card_sort_key(status, seq_num)}" data-version="{row_version}">
+            <div class="card-header">
+                <div><div class="seq-num">#{seq_num:03d}</div><div class="time-stamp">{tw_time.strftime('%H:%M')} ({order_lang})</div></div>
+                {table_html}
+            </div>
+            <div class="items">{items_html}</div>
+            <div class="actions">{buttons}</div>
+        </div>"""
+    except Exception as e:
+        traceback.print_exc()
+        return f"<div class='card' data-id='{o[0]}' data-sort='0'>卡片產生錯誤: {e}</div>"
+
+
+BOARD_FORMATS = {'html': render_order_card, 'json': order_card_model}
+
+
+# 看板即時區：待處理的訂單 + 最近完成 / 作廢的 KITCHEN_RECENT_DONE 張，更早的由 /kitchen/history 分頁載入
+KITCHEN_RECENT_DONE = int(os.environ.get("KITCHEN_RECENT_DONE", "12"))
+KITCHEN_HISTORY_PAGE = int(os.environ.get("KITCHEN_HISTORY_PAGE", "20"))
+_HISTORY_CURSOR_PATTERN = re.compile(r'^(\d{4}-\d{2}-\d{2}T[\d:.]+)_(\d+)$')
+
+
+def render_cards(orders, fmt, station):
+    """
+    把查到的訂單 (CARD_COLUMNS) 轉成卡片，回傳 [(id, 狀態, 流水號, 卡片內容), ...]。
+    fmt='html' 產生卡片 HTML，fmt='json' 產生 order_card_model 的精簡資料。
+    指定 station 時只保留該工作站的品項，沒有相關品項的訂單卡片內容為 None。
+    """
+    render = BOARD_FORMATS[fmt]
+    item_filter = None
+    catalog_version = None
+    if station is not None:
+        catalog = get_catalog()
+        item_filter = station_filter(catalog, station)
+        catalog_version = catalog.version  # 商品改了出單分類，工作站的卡片也要重新產生
+
+    cards = []
+    for o in orders:
+        oid, status, seq_num = o[0], o[4], o[7] or 0
+        # o[16] = invoice_status, o[20] = row_version (見 CARD_COLUMNS)
+        key = (fmt, station, catalog_version, oid, status, o[16], o[20])
+        card = _card_cache.get_or_render(key, lambda o=o: render(o, item_filter))
+        cards.append((oid, status, seq_num, card))
+    return cards
+
+
+def load_board(business_date, since, fmt='html', station=None):
+    """
+    查詢看板即時區並產生卡片 (相同參數的同時請求會合併成一次，見 _board_flight)。
+    完整載入只取待處理 + 最近完成的 KITCHEN_RECENT_DONE 張，傳輸量不會隨營業時間變大；
+    增量輪詢則回傳游標之後有變動的所有訂單 (剛完成的訂單本來就屬於「最近完成」)。
+    回傳 (下次的游標, [(id, 狀態, 流水號, 卡片內容), ...])；結果會被多個請求共用，請勿修改。
+    """
+    utc_start, utc_end = day_range(business_date)
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    # 先取得「目前仍在進行中的最舊交易」，之後才 commit 的修改版本一定 >= 這個值，下次輪詢不會漏掉
+    cur.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())")
+    next_cursor = f"{business_date.isoformat()}:{cur.fetchone()[0]}"
+
+    if since is not None:
+        cur.execute(f"""
+            SELECT {CARD_COLUMNS} FROM orders
+            WHERE created_at >= %s AND created_at < %s AND row_version >= %s
+        """, (utc_start, utc_end, since))
+    else:
+        cur.execute(f"""
+            SELECT {CARD_COLUMNS} FROM orders
+            WHERE created_at >= %(start)s AND created_at < %(end)s AND status = 'Pending'
+            UNION ALL
+            (SELECT {CARD_COLUMNS} FROM orders
+             WHERE created_at >= %(start)s AND created_at < %(end)s AND status <> 'Pending'
+             ORDER BY COALESCE(updated_at, created_at) DESC, id DESC
+             LIMIT %(recent)s)
+        """, {'start': utc_start, 'end': utc_end, 'recent': KITCHEN_RECENT_DONE})
+    orders = cur.fetchall()
+    conn.close()
+
+    cards = render_cards(orders, fmt, station)
+    cards.sort(key=lambda c: card_sort_key(c[1], c[2]))
+    return next_cursor, tuple(cards)
+
+
+# 排行與報表：相同查詢只算一次，結果保留 KITCHEN_POLL_SHARE_TTL 秒
+KITCHEN_POLL_SHARE_TTL = float(os.environ.get("KITCHEN_POLL_SHARE_TTL", "1.0"))
+# 看板輪詢：多台看板同一瞬間的相同輪詢只查一次資料庫，但不沿用舊結果、也不加入請求到達前就開始的查詢，
+# 否則收到推播後的輪詢可能拿到該次 commit 之前的結果，看板要等到保險輪詢才會更新
+_board_flight = singleflight.group('check_new_orders', ttl=0, join_running=False)
+
+
+@kitchen_bp.route('/check_new_orders')
+#@login_required          # 🛡️ 防護 1：必須登入
+def check_new_orders():
+    """
+    廚房看板輪詢。
+    帶 cursor 時只回傳該游標之後新增或修改過的訂單卡片 (cards)，前端逐張替換；
+    不帶 cursor (或已換日) 時回傳當天全部 (full=true)。
+    format=json 時改回傳 orders (精簡資料，由前端組成卡片)，傳輸量只有 HTML 的一小部分。
+    station=noodle / soup / other 時只回傳該工作站的品項；變動後已沒有相關品項的訂單列在 removed。
+    舊版頁面不帶 cursor，因此完整載入時仍附上整頁的 html。
+    """
+    try:
+        # 【關鍵修改 1】：接收前端傳來的最後一次看過的序號 (預設為 0)
+        last_seq = request.args.get('last_seq', 0, type=int)
+        cursor = request.args.get('cursor')
+        fmt = 'json' if request.args.get('format') == 'json' else 'html'
+        station = (request.args.get('station') or '').lower()
+        station = station if station in STATIONS else None
+
+        business_date = tw_today()
+        since = parse_cursor(cursor, business_date)
+        next_cursor, board = _board_flight.do((business_date, since, fmt, station),
+                                              lambda: load_board(business_date, since, fmt, station))
+
+        cards = []
+        removed = []
+        pending_ids = []
+        max_seq_val = 0
+        for oid, status, seq_num, card in board:
+            max_seq_val = max(max_seq_val, seq_num)
+            if card is None:
+                if since is not None:
+                    removed.append(oid)  # 改單後此工作站已沒有這張單的品項
+                continue
+            # 【關鍵修改 2】：只有當狀態是 Pending，且單號「大於」前端已知的 last_seq 時，才視為真正的新訂單
+            if status == 'Pending' and seq_num > last_seq:
+                pending_ids.append(oid)
+            if fmt == 'html':
+                card = {'id': oid, 'sort': card_sort_key(status, seq_num), 'html': card}
+            cards.append(card)
+
+        result = {
+            'cursor': next_cursor,
+            'full': since is None,
+            'orders' if fmt == 'json' else 'cards': cards,
+            'removed': removed,
+            'max_seq': max_seq_val,
+            'new_ids': pending_ids
+        }
+        if cursor is None and fmt == 'html':
+            result['html'] = "".join(c['html'] for c in cards) or EMPTY_BOARD_HTML
+        return jsonify(result)
     except Exception as e:
         traceback.print_exc()
         return jsonify({'html': f"載入錯誤: {str(e)}", 'max_seq': 0, 'new_ids': []})
 
+
+def parse_history_cursor(before):
+    """歷史分頁游標 "建立時間_訂單id" -> (created_at, id)；格式錯誤時丟出 ValueError"""
+    m = _HISTORY_CURSOR_PATTERN.match(before)
+    if not m:
+        raise ValueError(f"游標格式錯誤: {before}")
+    return datetime.fromisoformat(m.group(1)), int(m.group(2))
+
+
+@kitchen_bp.route('/history')
+@login_required
+def order_history():
+    """
+    看板「較早的訂單」：當天已完成 / 已作廢的訂單，依 (created_at, id) 由新到舊分頁。
+    帶上一頁回傳的 next 當作 before 取下一頁，next 為 null 表示沒有更多。
+    format / station 參數與 check_new_orders 相同；date=YYYY-MM-DD 可查其他營業日。
+    """
+    fmt = 'json' if request.args.get('format') == 'json' else 'html'
+    station = (request.args.get('station') or '').lower()
+    station = station if station in STATIONS else None
+    limit = max(1, min(request.args.get('limit', KITCHEN_HISTORY_PAGE, type=int), 100))
+    try:
+        day = datetime.strptime(request.args['date'], '%Y-%m-%d').date() if request.args.get('date') else tw_today()
+        before = parse_history_cursor(request.args['before']) if request.args.get('before') else None
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    utc_start, utc_end = day_range(day)
+    query = f"""
+        SELECT {CARD_COLUMNS} FROM orders
+        WHERE created_at >= %s AND created_at < %s AND status <> 'Pending'
+    """
+    params = [utc_start, utc_end]
+    if before is not None:
+        query += " AND (created_at, id) < (%s, %s)"
+        params += list(before)
+    query += " ORDER BY created_at DESC, id DESC LIMIT %s"
+    params.append(limit)
+
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(query, params)
+        orders = cur.fetchall()
+    finally:
+        conn.close()
+
+    cards = []
+    for oid, status, seq_num, card in render_cards(orders, fmt, station):
+        if card is None:
+            continue  # 此工作站沒有這張單的品項
+        if fmt == 'html':
+            card = {'id': oid, 'sort': card_sort_key(status, seq_num), 'html': card}
+        cards.append(card)
+
+    # o[5] = created_at (見 CARD_COLUMNS)；這一頁沒滿就表示已經到底
+    next_before = f"{orders[-1][5].isoformat()}_{orders[-1][0]}" if len(orders) == limit else None
+    return jsonify({'orders' if fmt == 'json' else 'cards': cards, 'next': next_before})
+
+
+# --- 2-1. 看板監控數據 (本 worker) ---
+@kitchen_bp.route('/metrics')
+@login_required          # 🛡️ 防護 1：必須登入
+@role_required('admin')  # 🛡️ 防護 2：worker 內部狀態只給 admin 看
+def kitchen_metrics():
+    """卡片快取命中率、推播連線與連線池狀態；每個 worker 各自統計"""
+    return jsonify({
+        'pid': os.getpid(),
+        'card_cache': _card_cache.stats(),
+        'singleflight': singleflight.all_stats(),
+        'stream': get_stream_stats(),
+        'db_pool': get_pool_stats(),
+        'network_printers': network_printer.get_printer_stats(),
+        'invoice_outbox': invoice_outbox.get_worker_stats(),
+        'ecpay': get_ecpay_stats(),
+        'invoice_print_cache': invoice_print_cache.get_stats(),
+    })
+
+
+# --- 2-2. 看板即時推播 (SSE) ---
+@kitchen_bp.route('/stream')
+@login_required
+def order_stream():
+    """訂單有變動時推送 orders 事件；無法推播時回應 503，看板會改回輪詢"""
+    if not stream_available():
+        return "推播未啟用", 503
+    stream = open_stream()
+    if stream is None:
+        return "推播連線數已滿", 503
+    return Response(stream_with_context(stream), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # 避免反向代理緩衝住事件
+    })
+
 # --- 3. 核心列印路由 (支援 80mm & 精確字體控制) ---
 @kitchen_bp.route('/print_order/<int:oid>')
 def print_order(oid):
+    """
+    format=base64：補印，回傳各印表機角色的 ESC/POS (直接讀取下單時存好的內容，見 print_spooler)
+    format=preview：HTML 預覽
+    """
     try:
         # 接收前端傳來的參數
         print_type = request.args.get('type', 'all')
         output_format = request.args.get('format', 'html')
-        
+
         conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # 1. 取得訂單資料
-        query = """
-            SELECT table_number, total_price, daily_seq, content_json, created_at, status,
-                   customer_name, customer_phone, customer_address, delivery_fee, scheduled_for, 
-                   order_type, lang
-            FROM orders WHERE id=%s
-        """
         try:
-            cur.execute(query, (oid,))
-            order = cur.fetchone()
-        except Exception as e:
-            conn.rollback() 
-            cur.execute("""
-                SELECT table_number, total_price, daily_seq, content_json, created_at, status,
-                       customer_name, customer_phone, customer_address, delivery_fee, scheduled_for, 
-                       'unknown', 'zh'
-                FROM orders WHERE id=%s
-            """, (oid,))
-            order = cur.fetchone()
-
-        # 2. 取得產品分類與選項對照表
-        cur.execute("""
-            SELECT name, print_category, 
-                   custom_options, custom_options_en, custom_options_jp, custom_options_kr 
-            FROM products
-        """)
-        product_map = {}
-        for row in cur.fetchall():
-            p_name = row[0]
-            def split_opts(opt_str):
-                if not opt_str: return []
-                return [o.strip() for o in opt_str.split(',') if o.strip()]
-            product_map[p_name] = {
-                'cat': row[1] or 'Other',
-                'zh': split_opts(row[2]),
-                'en': split_opts(row[3]),
-                'jp': split_opts(row[4]),
-                'kr': split_opts(row[5])
-            }
-        conn.close()
-        
+            cur = conn.cursor()
+            if output_format == 'base64':
+                payloads = print_spooler.reprint_tickets(cur, oid, tickets.roles_for(print_type))
+                conn.commit()  # 舊訂單第一次補印時會保存產生的內容
+                if payloads is None:
+                    return "訂單不存在", 404
+                tasks = {role: base64.b64encode(data).decode('utf-8') for role, data in payloads.items()}
+                return jsonify({"status": "success", "tasks": tasks})
+
+            order = tickets.load_order(cur, oid)
+        finally:
+            conn.close()
+
         if not order:
             return "訂單不存在", 404
-        
-        table_num, total_price, seq, content_json, created_at, status, \
-        c_name, c_phone, c_addr, c_fee, c_schedule, c_type, c_lang = order
-        
-        order_lang = str(c_lang).lower()
-        c_fee = int(c_fee or 0)
-        table_str = str(table_num).strip() if table_num else ""
-        c_type = str(c_type).lower() if c_type else 'unknown'
-        
-        has_contact = (c_phone and str(c_phone).strip() != '' and str(c_phone).lower() != 'none')
-        has_addr = (c_addr and str(c_addr).strip() != '' and str(c_addr).lower() != 'none')
-        has_schedule = (c_schedule and str(c_schedule).strip() != '' and str(c_schedule).lower() != 'none')
-        
-        def get_display_table(is_en=False):
-            if c_type == 'delivery': return "🛵 Delivery" if is_en else "🛵 外送"
-            if c_type == 'takeout': return "🥡 Takeout" if is_en else "🥡 自取"
-            if c_type == 'dine_in': return f"Table {table_str}" if is_en else f"桌號 {table_str}"
-            is_delivery = (table_str == '外送') or has_addr
-            return "Delivery" if is_delivery else (table_str if table_str else "Takeout")
-
-        if isinstance(content_json, str):
-            try: items = json.loads(content_json)
-            except: items = []
-        else:
-            items = content_json if isinstance(content_json, list) else [content_json]
-        
-        time_str = (created_at + timedelta(hours=8)).strftime('%Y-%m-%d %H:%M:%S')
-
-        noodle_items, soup_items, other_items = [], [], []
-        for item in items:
-            p_name = item.get('name_zh') or item.get('name')
-            p_cat = product_map.get(p_name, {}).get('cat', 'Other') 
-            if p_cat == 'Noodle': noodle_items.append(item)
-            elif p_cat == 'Soup': soup_items.append(item)
-            else: other_items.append(item)
-
-        def translate_option(p_name, opt_str, lang_code):
-            if p_name not in product_map: return opt_str
-            p_data = product_map[p_name]
-            found_idx = -1
-            for l in ['zh', 'en', 'jp', 'kr']:
-                if opt_str in p_data[l]:
-                    found_idx = p_data[l].index(opt_str)
-                    break
-            if found_idx != -1:
-                target_list = p_data.get(lang_code, [])
-                if found_idx < len(target_list): return target_list[found_idx]
-            return opt_str
-
-        # --- 預覽 HTML 生成邏輯 ---
-        if output_format == 'preview':
-            def generate_preview_html(title, item_list, is_receipt=False, lang_override='zh'):
-                if not item_list and not is_receipt: return ""
-                tbl_name = get_display_table(is_en=(lang_override == 'en'))
-                html = f"""
-                <div style="width: 400px; background: white; padding: 20px; border: 1px solid #ddd; font-family: 'Courier New', monospace; box-shadow: 0 4px 8px rgba(0,0,0,0.1); margin: 10px;">
-                    <div style="text-align: center; border-bottom: 2px solid #000; padding-bottom: 10px;">
-                        <h1 style="margin: 5px 0; font-size: 2.5em;">{title}</h1>
-                        <div style="font-size: 2em; font-weight: bold;"># {seq:03d}</div>
-                        <div style="font-size: 1.8em;">{tbl_name}</div>
-                    </div>
-                    <div style="font-size: 1.2em; margin: 10px 0; line-height: 1.5;">
-                        TIME: {time_str}<br>
-                        {f'<span style="background: black; color: white; padding: 2px 5px;">PREORDER: {c_schedule}</span>' if has_schedule else ''}
-                    </div>
-                    <div style="border-top: 1px dashed #000; margin: 10px 0;"></div>
-                """
-                for i in item_list:
-                    name_zh = i.get('name_zh') or i.get('name')
-                    name_to_print = (i.get('name_en') if lang_override == 'en' else name_zh) or name_zh
-                    qty = i.get('qty', 1)
-                    html += f'<div style="font-weight: bold; font-size: 1.8em; display: flex; justify-content: space-between;"><span>{name_to_print}</span><span>x{qty}</span></div>'
-                    raw_opts = i.get('options') or i.get('options_zh') or []
-                    if not isinstance(raw_opts, list): raw_opts = [raw_opts]
-                    opts_translated = [translate_option(name_zh, str(opt), lang_override) for opt in raw_opts if opt]
-                    if opts_translated:
-                        html += f'<div style="font-size: 1.1em; padding-left: 10px; margin-bottom: 5px; color: #333;">+ {", ".join(opts_translated)}</div>'
-                    html += '<div style="border-top: 1px solid #eee; margin: 5px 0;"></div>'
-                if is_receipt:
-                    html += f'<div style="text-align: right; margin-top: 15px;">'
-                    if c_fee > 0: html += f'運費 Fee: ${c_fee}<br>'
-                    html += f'<span style="font-size: 2em; font-weight: bold;">TOTAL: ${int(total_price or 0)}</span>'
-                    if c_name: html += f'<br><span style="font-size: 1.2em;">Cust: {c_name}</span>'
-                    html += '</div>'
-                html += "</div>"
-                return html
-
-            receipt_lang = 'en' if order_lang == 'en' else 'zh'
-            preview_content = '<div style="display: flex; flex-wrap: wrap; justify-content: center; background: #f4f4f4; min-height: 100vh; padding: 20px;">'
-            if print_type in ['all', 'receipt']:
-                preview_content += generate_preview_html("結帳單", items, is_receipt=True, lang_override=receipt_lang)
-            if print_type in ['all', 'kitchen']:
-                if noodle_items: preview_content += generate_preview_html("廚房單-麵區", noodle_items)
-                if soup_items: preview_content += generate_preview_html("廚房單-湯區", soup_items)
-                if other_items: preview_content += generate_preview_html("廚房單-其他", other_items)
-            preview_content += '</div>'
-            return render_template_string(preview_content)
-
-        # --- 3. 核心 ESC/POS 生成函數 (80mm & 獨立字體控制) ---
-        def generate_content(title, item_list, is_receipt=False, lang_override='zh'):
-            if not item_list and not is_receipt: return b""
-            
-            ESC, GS = b'\x1b', b'\x1d'
-            RESET = ESC + b'@'
-            BOLD_ON, BOLD_OFF = ESC + b'E\x01', ESC + b'E\x00'
-            CENTER, LEFT = ESC + b'a\x01', ESC + b'a\x00'
-            CUT = GS + b'V\x42\x00'
-            ENCODE = 'big5-hkscs' # 確保印表機支援此編碼，或使用 'gb18030'
-            
-            # 字體大小設定
-            SIZE_X22 = GS + b'!\x22'     # 3x3 標題
-            SIZE_X11 = GS + b'!\x11'     # 2x2 重要資訊
-            SIZE_X01 = GS + b'!\x01'     # 1x2 拉高字體 (適合閱讀)
-            SIZE_NORM = GS + b'!\x00'    # 標準
-            
-            res = RESET + CENTER
-            
-            # 1. 標題與序號
-            res += SIZE_X22 + BOLD_ON + title.encode(ENCODE, 'replace') + b"\n"
-            res += SIZE_X11 + f"NO: #{seq:03d}\n".encode(ENCODE)
-            
-            # 2. 桌號 / 訂單類型
-            tbl_name = get_display_table(is_en=(lang_override == 'en'))
-            res += BOLD_ON + tbl_name.encode(ENCODE, 'replace') + b"\n" + BOLD_OFF
-            
-            # 3. 基礎資訊區 (靠左)
-            res += LEFT + SIZE_X01
-            res += f"訂單時間: {time_str}\n".encode(ENCODE)
-            
-            # --- 這裡加入所有資料庫欄位的判斷 ---
-            if has_schedule:
-                res += BOLD_ON + f"取單時間: {c_schedule}\n".encode(ENCODE) + BOLD_OFF + SIZE_X01
-            
-            if is_receipt:
-                if c_name:
-                    res += f"姓名: {c_name}\n".encode(ENCODE, 'replace') + SIZE_X01
-                if has_contact:
-                    res += f"電話: {c_phone}\n".encode(ENCODE) + SIZE_X01
-                if has_addr:
-                    # 地址通常較長，使用標準大小避免跑版
-                    res += SIZE_X01 + f"地址: {c_addr}\n".encode(ENCODE, 'replace')
-        
-            # 分隔線
-            res += SIZE_NORM + b"-"*48 + b"\n"
-            
-            # 4. 商品清單
-            for i in item_list:
-                name_zh = i.get('name_zh') or i.get('name')
-                name_to_print = (i.get('name_en') if lang_override == 'en' else name_zh) or name_zh
-                qty = i.get('qty', 1)
-                
-                # 商品名稱 (放大)
-                res += SIZE_X11 + BOLD_ON + f"{name_to_print} x{qty}\n".encode(ENCODE, 'replace') + BOLD_OFF
-                
-                # 客製化選項 (拉高)
-                raw_opts = i.get('options') or i.get('options_zh') or []
-                if not isinstance(raw_opts, list): raw_opts = [raw_opts]
-                opts_translated = [translate_option(name_zh, str(opt), lang_override) for opt in raw_opts if opt]
-                
-                if opts_translated:
-                    opt_str = " + " + ", ".join(opts_translated)
-                    res += SIZE_X01 + f"{opt_str}\n".encode(ENCODE, 'replace')
-                
-                # 商品間分隔線
-                res += SIZE_NORM + b"-"*48 + b"\n"
-            
-            # 5. 結帳區 (僅收據)
-            if is_receipt:
-                res += LEFT + SIZE_X01
-                if c_fee > 0:
-                    res += b"\n"
-                
-                # 總價放大
-                label_total = "TOTAL: " if lang_override == 'en' else "總計: "
-                res += SIZE_X22 + BOLD_ON + f"{label_total}${int(total_price or 0)}\n".encode(ENCODE) + BOLD_OFF
-                
-                # 底部備註 (如果是外送單，再次強調地址)
-                if has_addr:
-                    res += SIZE_NORM + b"*"*48 + b"\n"
-                    res += f"Deliver to: {c_addr}\n".encode(ENCODE, 'replace')
-        
-            res += b"\n" + CUT # 少給一點空白
-            return res
 
-            
-        # 4. 輸出處理 (Base64)
-        if output_format == 'base64':
-            # 初始化指令：重置 + 進入中文模式 + 設定字體代碼頁
-            init_cmds = b'\x1b\x40\x1c\x26\x1b\x74\x0d'
-            tasks = {}
-            receipt_lang = 'en' if order_lang == 'en' else 'zh'
-            receipt_title = "Receipt" if receipt_lang == 'en' else "結帳單"
-            kitchen_lang = 'zh'
-            
-            if print_type in ['all', 'receipt']:
-                tasks["receipt"] = base64.b64encode(
-                    init_cmds + generate_content(receipt_title, items, is_receipt=True, lang_override=receipt_lang)
-                ).decode('utf-8')
-            
-            if print_type in ['all', 'kitchen']:
-                if noodle_items:
-                    tasks["noodle"] = base64.b64encode(
-                        init_cmds + generate_content("廚房單-麵區", noodle_items, lang_override=kitchen_lang)
-                    ).decode('utf-8')
-                if soup_items:
-                    tasks["soup"] = base64.b64encode(
-                        init_cmds + generate_content("廚房單-湯區", soup_items, lang_override=kitchen_lang)
-                    ).decode('utf-8')
-                if other_items:
-                    tasks["other"] = base64.b64encode(
-                        init_cmds + generate_content("廚房單-其他", other_items, lang_override=kitchen_lang)
-                    ).decode('utf-8')
-            
-            return jsonify({"status": "success", "tasks": tasks})
+        # --- 預覽 HTML ---
+        if output_format == 'preview':
+            return render_template_string(tickets.render_preview(order, get_catalog(), print_type))
 
         return "HTML Preview Mode (Not Base64)", 200
 
     except Exception as e:
         traceback.print_exc()
         return f"Print Error: {str(e)}", 500
-        
+
+
+# --- 3-1. 自動列印佇列 (看板以 WebUSB 列印) ---
+@kitchen_bp.route('/print_jobs/claim')
+@login_required
+def claim_print_jobs():
+    """領取待印工作：roles=receipt,noodle 為這台看板有接的印表機角色"""
+    # 有設定網路印表機的角色由伺服器送印，看板不領取
+    skip = network_printer.network_roles()
+    roles = [r for r in (request.args.get('roles') or '').split(',') if r and r not in skip]
+    limit = max(1, min(request.args.get('limit', 5, type=int), 20))
+    worker = f"board:{session.get('username')}@{request.remote_addr}"
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        jobs = print_spooler.claim(cur, roles, worker, limit)
+        conn.commit()
+    finally:
+        conn.close()
+    return jsonify({'jobs': [
+        {'id': job_id, 'order_id': order_id, 'role': role, 'data': base64.b64encode(payload).decode('utf-8')}
+        for job_id, order_id, role, payload in jobs
+    ]})
+
+
+@kitchen_bp.route('/printers')
+@login_required
+def printer_status():
+    """網路印表機的即時狀態 (連線、缺紙、開蓋) 與待印工作數"""
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        queue = print_spooler.get_queue_stats(cur)
+        conn.rollback()
+    finally:
+        conn.close()
+    return jsonify({'printers': network_printer.status_all(), 'queue': queue})
+
+
+@kitchen_bp.route('/print_jobs/<int:job_id>/<result>', methods=['POST'])
+@login_required
+def report_print_job(job_id, result):
+    """回報列印結果：/done 或 /failed (JSON body 可帶 error)"""
+    if result not in ('done', 'failed'):
+        return jsonify({'status': 'error', 'message': '未知的結果'}), 400
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        if result == 'done':
+            ok = print_spooler.complete(cur, job_id)
+        else:
+            error = (request.get_json(silent=True) or {}).get('error') or '看板回報列印失敗'
+            ok = print_spooler.fail(cur, job_id, error)
+            print(f"[{get_current_time_str()}] ⚠️ 列印工作 #{job_id} 失敗: {error}")
+        conn.commit()
+    finally:
+        conn.close()
+    # ok=False 表示工作已逾時被放回佇列 (或已被回報過)
+    return jsonify({'status': 'success', 'updated': ok})
 
         
 # --- 4. 狀態變更 (完成/作廢/列印) ---
@@ -640,44 +712,23 @@ def print_order(oid):
 def complete_order(oid):
     try:
         c = get_db_connection()
-        # 🛠️ 修正這裡：使用 psycopg2 的 RealDictCursor 取代 dictionary=True
-        cur = c.cursor(cursor_factory=psycopg2.extras.RealDictCursor) 
+        cur = c.cursor()
 
-        # 1. 取得訂單詳細資訊
-        cur.execute("SELECT * FROM orders WHERE id=%s", (oid,))
-        order = cur.fetchone()
+        # 1. 更新訂單狀態為 Completed
+        cur.execute("UPDATE orders SET status='Completed' WHERE id=%s RETURNING invoice_status", (oid,))
+        row = cur.fetchone()
 
-        if not order:
+        if not row:
+            c.close()
             return "Order not found", 404
 
-        # 2. 更新訂單狀態為 Completed
-        cur.execute("UPDATE orders SET status='Completed' WHERE id=%s", (oid,))
-        c.commit()
-
-        # 3. 觸發綠界開立發票 (僅限發票尚未開立的情況)
-        if order.get('invoice_status') in ['Not Issued', None]:
-            try:
-                # 傳入訂單資料 (此時 order 字典內已包含 tax_id, carrier_type 等欄位)
-                invoice_res = issue_ecpay_invoice(order)
-                
-                if invoice_res.get('success'):
-                    # 取得綠界回傳的發票號碼
-                    invoice_no = invoice_res.get('invoice_no')
-                    print(f"[{get_current_time_str()}] 🧾 發票開立成功: {invoice_no}")
-                    
-                    # 📝 將發票號碼存回資料庫，並將狀態改為 'Issued'
-                    cur.execute("""
-                        UPDATE orders 
-                        SET invoice_number=%s, invoice_status='Issued' 
-                        WHERE id=%s
-                    """, (invoice_no, oid))
-                    c.commit()
-                else:
-                    print(f"[{get_current_time_str()}] ⚠️ 發票開立失敗: {invoice_res.get('message')}")
-                    
-            except Exception as invoice_e:
-                print(f"[{get_current_time_str()}] ❌ 發票系統例外錯誤: {invoice_e}")
+        # 2. 發票尚未開立時排入發票佇列 (同一個交易)，由背景 worker 呼叫綠界並寫回發票號碼，
+        #    出餐按鈕不必等綠界回應
+        if row[0] in ['Not Issued', None]:
+            invoice_outbox.enqueue_issue(cur, oid)
 
+        notify_order_changed(cur, oid)
+        c.commit()
         c.close() 
         print(f"[{get_current_time_str()}] ✅ 訂單完成: ID {oid}")
         return "OK"
@@ -692,45 +743,27 @@ def complete_order(oid):
 def cancel_order(oid):
     try:
         c = get_db_connection()
-        # 🛠️ 修正這裡：使用 psycopg2 的 RealDictCursor 取代 dictionary=True
-        cur = c.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur = c.cursor()
 
-        # 1. 先取得訂單資訊
-        cur.execute("SELECT * FROM orders WHERE id=%s", (oid,))
-        order = cur.fetchone()
+        # 1. 更新訂單狀態為 Cancelled (還沒印出的單據不再自動列印)
+        #    RETURNING 取得更新當下的發票狀態 (發票 worker 可能剛寫回發票號碼)
+        cur.execute("UPDATE orders SET status='Cancelled' WHERE id=%s RETURNING invoice_number, invoice_status", (oid,))
+        row = cur.fetchone()
 
-        if not order:
+        if not row:
+            c.close()
             return "Order not found", 404
 
-        # 2. 更新訂單狀態為 Cancelled
-        cur.execute("UPDATE orders SET status='Cancelled' WHERE id=%s", (oid,))
-        c.commit()
+        invoice_no, invoice_status = row
+        print_spooler.hold_order(cur, oid)
 
-        # 3. 觸發綠界發票作廢
-        invoice_no = order.get('invoice_number') 
-        invoice_status = order.get('invoice_status')
-        
-        # 只有在「有發票號碼」且「發票狀態為已開立(Issued)」時才呼叫作廢 API
+        # 2. 還沒送出的發票開立直接取消；已開立的發票排入作廢 (由背景 worker 呼叫綠界)
+        invoice_outbox.cancel_pending(cur, oid)
         if invoice_no and invoice_status == 'Issued':
-            try:
-                void_res = invalid_ecpay_invoice(invoice_no, f"訂單 {oid} 取消作廢")
-                
-                if void_res.get('success'):
-                    print(f"[{get_current_time_str()}] 🗑️ 發票作廢成功: {invoice_no}")
-                    
-                    # 📝 更新資料庫的發票狀態為 'Void' (已作廢)
-                    cur.execute("""
-                        UPDATE orders 
-                        SET invoice_status='Void' 
-                        WHERE id=%s
-                    """, (oid,))
-                    c.commit()
-                else:
-                    print(f"[{get_current_time_str()}] ⚠️ 發票作廢失敗: {void_res.get('message')}")
-                    
-            except Exception as void_e:
-                print(f"[{get_current_time_str()}] ❌ 發票作廢系統例外錯誤: {void_e}")
+            invoice_outbox.enqueue_void(cur, oid, invoice_no, f"訂單 {oid} 取消作廢")
 
+        notify_order_changed(cur, oid)
+        c.commit()
         c.close() 
         print(f"[{get_current_time_str()}] 🗑️ 訂單作廢: ID {oid}")
         return "OK"
@@ -750,8 +783,8 @@ def print_invoice_route(invoice_no):
     try:
         print(f"[{get_current_time_str()}] 🖨️ 準備列印發票: {invoice_no}")
         
-        # 呼叫 ecpay_invoice.py 裡的函數
-        result = print_ecpay_invoice(invoice_no)
+        # 已開立的發票 HTML 不會變：先查列印快取，沒有才向綠界取得
+        result = invoice_print_cache.get_invoice_html(invoice_no)
         
         if result.get("success"):
             # 綠界成功回傳 HTML，我們直接把它吐給瀏覽器
@@ -767,38 +800,69 @@ def print_invoice_route(invoice_no):
 
         
 # --- 5. 銷售排名 API ---
+# 多台平板同時查同一區間時只查一次
+_ranking_flight = singleflight.group('sales_ranking', ttl=KITCHEN_POLL_SHARE_TTL)
 @kitchen_bp.route('/sales_ranking')
 @login_required          # 🛡️ 防護 1：必須登入
 @role_required('admin')  # 🛡️ 防護 2：必須是 admin 才能進後台
 def sales_ranking():
     start_time_str = request.args.get('start_time')
     end_time_str = request.args.get('end_time')
-    utc_start, utc_end = get_tw_time_range(start_time_str, end_time_str)
+    utc_start, utc_end = parse_range(start_time_str, end_time_str)
+
+    def load():
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT oi.product_name, SUM(oi.qty) AS total_qty
+            FROM order_items oi
+            JOIN orders o ON o.id = oi.order_id
+            WHERE o.created_at >= %s AND o.created_at < %s 
+            AND o.status IN ('Pending', 'Completed')
+            GROUP BY oi.product_name
+            ORDER BY total_qty DESC
+        """, (utc_start, utc_end))
+        rows = cur.fetchall()
+        conn.close()
+        return tuple((r[0], int(r[1])) for r in rows)
+
+    rows = _ranking_flight.do((utc_start, utc_end), load)
+    sorted_data = [{"name": name, "count": count} for name, count in rows]
+    return jsonify(sorted_data)
 
+
+def load_daily_report(utc_start, utc_end):
+    """日結報表的統計數據；回傳 (有效單數, 有效金額, 作廢單數, 作廢金額, 有效品項, 作廢品項)，結果可能被共用，請勿修改"""
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("""
-        SELECT content_json FROM orders 
-        WHERE created_at >= %s AND created_at <= %s 
-        AND status IN ('Pending', 'Completed')
-    """, (utc_start, utc_end))
-    rows = cur.fetchall()
+
+    # 有效訂單
+    cur.execute("SELECT COUNT(*), COALESCE(SUM(total_price), 0) FROM orders WHERE created_at >= %s AND created_at < %s AND status IN ('Pending', 'Completed')", (utc_start, utc_end))
+    v_count, v_total = cur.fetchone()
+
+    # 作廢訂單
+    cur.execute("SELECT COUNT(*), COALESCE(SUM(total_price), 0) FROM orders WHERE created_at >= %s AND created_at < %s AND status = 'Cancelled'", (utc_start, utc_end))
+    x_count, x_total = cur.fetchone()
+
+    def agg(status_filter):
+        """商品銷售明細：直接由 order_items GROUP BY (金額 = 數量 x 下單當時單價)"""
+        cur.execute(f"""
+            SELECT oi.product_name, SUM(oi.qty), SUM(oi.qty * oi.unit_price)
+            FROM order_items oi
+            JOIN orders o ON o.id = oi.order_id
+            WHERE o.created_at >= %s AND o.created_at < %s AND {status_filter}
+            GROUP BY oi.product_name
+            ORDER BY SUM(oi.qty) DESC
+        """, (utc_start, utc_end))
+        return {r[0]: {'qty': int(r[1]), 'amt': int(r[2])} for r in cur.fetchall()}
+
+    v_stats = agg("o.status IN ('Pending', 'Completed')")
+    x_stats = agg("o.status = 'Cancelled'")
     conn.close()
-    
-    stats = {}
-    for r in rows:
-        if not r[0]: continue
-        try:
-            items = json.loads(r[0]) if isinstance(r[0], str) else r[0]
-            if not isinstance(items, list): items = []
-            for i in items:
-                name = i.get('name_zh', i.get('name', '未知品項'))
-                qty = int(float(i.get('qty', 1)))
-                stats[name] = stats.get(name, 0) + qty
-        except: continue
-        
-    sorted_data = [{"name": k, "count": v} for k, v in sorted(stats.items(), key=lambda item: item[1], reverse=True)]
-    return jsonify(sorted_data)
+    return v_count, v_total, x_count, x_total, v_stats, x_stats
+
+
+_report_flight = singleflight.group('daily_report', ttl=KITCHEN_POLL_SHARE_TTL)
 
 
 # --- 6. 日結報表 (HTML) - 補完部分 ---
@@ -807,115 +871,21 @@ def sales_ranking():
 @role_required('admin')  # 🛡️ 防護 2：必須是 admin 才能進後台
 def daily_report():
     # --- 1. 時間處理 (台灣時區 UTC+8) ---
-    now_tw = datetime.utcnow() + timedelta(hours=8)
+    now_tw = tw_now()
     target_date_str = request.args.get('date') or now_tw.strftime('%Y-%m-%d')
     
-    # 取得資料庫查詢範圍
-    try:
-        utc_start, utc_end = get_tw_time_range(target_date_str)
-    except:
-        utc_start, utc_end = now_tw.replace(hour=0, minute=0), now_tw.replace(hour=23, minute=59)
+    # 取得資料庫查詢範圍 (格式錯誤時為今天整天)
+    utc_start, utc_end = parse_range(target_date_str)
 
     output_format = request.args.get('format', 'html')
-    
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # --- 2. 取得產品數據 ---
-    cur.execute("SELECT name, price FROM products")
-    price_map = {row[0]: row[1] for row in cur.fetchall()}
-    
-    # 有效訂單
-    cur.execute("SELECT total_price, content_json FROM orders WHERE created_at >= %s AND created_at <= %s AND status IN ('Pending', 'Completed')", (utc_start, utc_end))
-    v_raw = cur.fetchall()
-    v_count, v_total = len(v_raw), sum([r[0] for r in v_raw if r[0]])
-
-    # 作廢訂單
-    cur.execute("SELECT total_price, content_json FROM orders WHERE created_at >= %s AND created_at <= %s AND status = 'Cancelled'", (utc_start, utc_end))
-    x_raw = cur.fetchall()
-    x_count, x_total = len(x_raw), sum([r[0] for r in x_raw if r[0]])
-    conn.close()
 
-    def agg(rows):
-        result = {}
-        for r in rows:
-            if not r[1]: continue
-            try:
-                items = json.loads(r[1]) if isinstance(r[1], str) else r[1]
-                for i in items:
-                    name = i.get('name_zh', i.get('name', '商品'))
-                    qty = int(float(i.get('qty', 1)))
-                    p_val = i.get('price')
-                    price = int(float(p_val)) if p_val is not None else price_map.get(name, 0)
-                    if name not in result: result[name] = {'qty':0, 'amt':0}
-                    result[name]['qty'] += qty
-                    result[name]['amt'] += (qty * price)
-            except: continue
-        return result
-
-    v_stats = agg(v_raw)
-    x_stats = agg(x_raw)
+    # --- 2. 取得訂單數據 (同時列印 / 預覽同一天的報表時只查一次) ---
+    v_count, v_total, x_count, x_total, v_stats, x_stats = _report_flight.do(
+        (utc_start, utc_end), lambda: load_daily_report(utc_start, utc_end))
 
     # --- 3. 生成 ESC/POS 二進制 (所有文字放大至 x11) ---
     if output_format == 'blob':
-        ESC, GS = b'\x1b', b'\x1d'
-        ENCODE = 'cp950'
-        SIZE_LARGE = GS + b'!\x11' # 倍寬倍高 (x11)
-        
-        res = ESC + b'@' # 初始化
-        res += SIZE_LARGE # 設定全域最小尺寸為 x11
-        
-        # 標題區 (置中)
-        res += ESC + b'a\x01'
-        res += "日結營收報表\n".encode(ENCODE)
-        res += f"{target_date_str}\n".encode(ENCODE)
-        res += f"時間:{now_tw.strftime('%H:%M:%S')}\n".encode(ENCODE)
-        res += b"="*16 + b"\n"  # 字體變大，分隔線縮短為 16 個
-        
-        # 有效營收 (靠左)
-        res += b"\n" + ESC + b'a\x00'
-        res += ESC + b'E\x01' + "有效營收\n".encode(ENCODE) + ESC + b'E\x00'
-        res += f"單數: {v_count}\n".encode(ENCODE)
-        res += f"總計: ${v_total:,}\n".encode(ENCODE)
-        res += b"\n" + ESC + b'a\x01' + b"-"*20 + b"\n"
-        
-        # 作廢統計
-        res += ESC + b'a\x00'
-        res += ESC + b'E\x01' + "作廢統計\n".encode(ENCODE) + ESC + b'E\x00'
-        res += f"單數: {x_count}\n".encode(ENCODE)
-        res += f"額度: ${x_total:,}\n".encode(ENCODE)
-        res += ESC + b'a\x01' + b"="*16 + b"\n"
-        
-        # 商品銷售明細 (字大，建議名稱與數據分行或截短)
-        res += b"\n" + ESC + b'a\x00'
-        res += ESC + b'E\x01' + "銷售明細\n".encode(ENCODE) + ESC + b'E\x00'
-        if not v_stats:
-            res += "無\n".encode(ENCODE)
-        else:
-            for k, v in sorted(v_stats.items(), key=lambda x:x[1]['qty'], reverse=True):
-                # 因為字體大，採「名稱」一行，「數量金額」一行
-                res += f"{k[:16]}\n".encode(ENCODE, 'replace')
-                res += f"  x{v['qty']:>2} ${v['amt']:,}\n".encode(ENCODE)
-        res += b"\n" + ESC + b'a\x01' + b"-"*20 + b"\n"
-        
-        # 作廢商品明細
-        res += ESC + b'a\x00'
-        res += ESC + b'E\x01' + "作廢明細\n".encode(ENCODE) + ESC + b'E\x00'
-        if not x_stats:
-            res += "無\n".encode(ENCODE)
-        else:
-            for k, v in sorted(x_stats.items(), key=lambda x:x[1]['qty'], reverse=True):
-                res += f"{k[:16]}\n".encode(ENCODE, 'replace')
-                res += f"  x{v['qty']:>2} ${v['amt']:,}\n".encode(ENCODE)
-        res += b"\n" + ESC + b'a\x01' + b"="*16 + b"\n"
-        
-        # 簽名區
-        res += b"\n" + ESC + b'a\x00'
-        res += "經手人簽名:\n\n\n".encode(ENCODE)
-        res += "________________\n".encode(ENCODE)
-        res += "- End Report -\n\n".encode(ENCODE)
-        res += b"\n\n\n" + GS + b'V\x42\x00' # 切刀
-        
+        res = tickets.render_daily_report(target_date_str, now_tw, v_count, v_total, x_count, x_total, v_stats, x_stats)
         return jsonify({"status": "success", "blob": base64.b64encode(res).decode('utf-8')})
 
    # --- 4. HTML 頁面渲染 ---
@@ -1,5 +1,12 @@
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, session
 from database import get_db_connection
+from business_day import tw_today
+from order_items import write_order_items
+from kitchen_events import notify_order_changed
+import print_spooler
+import invoice_outbox
+from settings_cache import get_settings
+from catalog import get_catalog
 from translations import load_translations
 from datetime import timedelta, datetime
 import json
@@ -11,59 +18,15 @@ menu_bp = Blueprint('menu', __name__)
 # 1. 共用函數：讀取產品與設定
 # ==========================================
 def get_menu_data():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # 讀取所有設定 (包含 shop_open, delivery_enabled, delivery_min_price 等)
-    cur.execute("SELECT key, value FROM settings")
-    settings_rows = cur.fetchall()
-    settings = {row[0]: row[1] for row in settings_rows}
+    # 讀取所有設定 (包含 shop_open, delivery_enabled, delivery_min_price 等)，由記憶體快照提供
+    settings = get_settings().as_dict()
     
     # 確保 delivery_min_price 存在於設定中
     if 'delivery_min_price' not in settings:
         settings['delivery_min_price'] = '0'  # 若資料庫未設定，預設為 0
     
-    # 讀取產品 (包含多語系欄位)
-    cur.execute("""
-        SELECT id, name, price, category, image_url, is_available, custom_options, sort_order,
-                name_en, name_jp, name_kr, 
-                custom_options_en, custom_options_jp, custom_options_kr, 
-                print_category, 
-                category_en, category_jp, category_kr
-        FROM products 
-        ORDER BY sort_order ASC, id ASC
-    """)
-    products = cur.fetchall()
-    cur.close()
-    conn.close()
-
-    p_list = []
-    for p in products:
-        # 處理自定義選項字串轉陣列
-        def parse_opts(opt_str, fallback_str=None):
-            if opt_str: return opt_str.split(',')
-            if fallback_str: return fallback_str.split(',')
-            return []
-
-        p_list.append({
-            'id': p[0], 
-            'name_zh': p[1], 
-            'name_en': p[8] or p[1], 
-            'name_jp': p[9] or p[1], 
-            'name_kr': p[10] or p[1],
-            'price': p[2], 
-            'category_zh': p[3], 
-            'category_en': p[15] or p[3], 
-            'category_jp': p[16] or p[3], 
-            'category_kr': p[17] or p[3],
-            'image_url': p[4] or '', 
-            'is_available': p[5], 
-            'custom_options_zh': parse_opts(p[6]),
-            'custom_options_en': parse_opts(p[11], p[6]),
-            'custom_options_jp': parse_opts(p[12], p[6]),
-            'custom_options_kr': parse_opts(p[13], p[6]),
-            'print_category': p[14] or 'Noodle'
-        })
+    # 讀取產品 (包含多語系欄位)，由商品目錄快照提供
+    p_list = list(get_catalog().menu_items)
     return settings, p_list
 
 # ==========================================
@@ -81,10 +44,9 @@ def process_order_submission(request, order_type_override=None):
 
     try:
         # --- A. 檢查店鋪狀態 ---
-        cur.execute("SELECT key, value FROM settings WHERE key IN ('shop_open', 'delivery_enabled')")
-        settings_rows = dict(cur.fetchall())
-        shop_open = settings_rows.get('shop_open', '1') == '1'
-        delivery_enabled = settings_rows.get('delivery_enabled', '1') == '1'
+        settings = get_settings()
+        shop_open = settings.shop_open
+        delivery_enabled = settings.delivery_enabled
 
         if not shop_open:
             return "Shop is Closed / 本店休息中", 403
@@ -251,10 +213,20 @@ def process_order_submission(request, order_type_override=None):
 
         # --- F. 寫入資料庫 ---
         print("接收到的表單資料:", request.form)
-        # 確保併發環境下 daily_seq 正確
-        cur.execute("LOCK TABLE orders IN SHARE ROW EXCLUSIVE MODE")
+        # 修改訂單：先作廢舊單 (放在配發流水號之前，縮短持有計數列鎖的時間)
+        if old_order_id:
+            cur.execute("UPDATE orders SET status='Cancelled' WHERE id=%s", (old_order_id,))
+            print_spooler.hold_order(cur, old_order_id)
+            invoice_outbox.cancel_pending(cur, old_order_id)
 
+        # 流水號由 daily_counters 配發：只鎖住當天的計數列直到 commit，不再鎖整張 orders 表
+        # 交易回滾時號碼一併回滾，因此不會跳號也不會重複
         cur.execute("""
+            WITH seq AS (
+                INSERT INTO daily_counters (business_date, last_seq) VALUES (%s, 1)
+                ON CONFLICT (business_date) DO UPDATE SET last_seq = daily_counters.last_seq + 1
+                RETURNING last_seq
+            )
             INSERT INTO orders (
                 table_number, items, total_price, lang, 
                 daily_seq, 
@@ -263,16 +235,17 @@ def process_order_submission(request, order_type_override=None):
                 customer_name, customer_phone, customer_address, scheduled_for,
                 tax_id, carrier_type, carrier_num
             )
-            VALUES (
+            SELECT
                 %s, %s, %s, %s, 
-                (SELECT COALESCE(MAX(daily_seq), 0) + 1 FROM orders WHERE created_at >= CURRENT_DATE), 
+                seq.last_seq, 
                 %s, %s, NOW(),
                 %s, %s, %s,
                 %s, %s, %s, %s,
                 %s, %s, %s
-            )
+            FROM seq
             RETURNING id, daily_seq
         """, (
+            tw_today(),
             table_number, items_str, total_price, final_lang, 
             cart_json, need_receipt, 
             order_type, delivery_info_json_str, delivery_fee,
@@ -282,9 +255,13 @@ def process_order_submission(request, order_type_override=None):
 
         res = cur.fetchone()
         oid = res[0]
-        
-        if old_order_id:
-            cur.execute("UPDATE orders SET status='Cancelled' WHERE id=%s", (old_order_id,))
+
+        # 同一個交易內寫入正規化明細 (報表用)
+        write_order_items(cur, oid, cart_items)
+        # 同一個交易內產生出單內容並排入列印佇列 (看板領取後自動列印)
+        print_spooler.enqueue_order(cur, oid)
+        # commit 後通知所有廚房看板
+        notify_order_changed(cur, oid, 'new')
         
         conn.commit()
         
@@ -311,14 +288,9 @@ def process_order_submission(request, order_type_override=None):
 def index():
     table_num = request.args.get('table', '')
     
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT key, value FROM settings WHERE key IN ('shop_open', 'delivery_enabled')")
-    settings = dict(cur.fetchall())
-    conn.close()
-    
-    shop_open = settings.get('shop_open', '1') == '1'
-    delivery_enabled = settings.get('delivery_enabled', '1') == '1'
+    settings = get_settings()
+    shop_open = settings.shop_open
+    delivery_enabled = settings.delivery_enabled
 
     session.clear()
     
@@ -433,26 +405,9 @@ def order_success():
     row = cur.fetchone()
     
     # ==========================================
-    # 2. 讀取所有產品的客製化選項
+    # 2. 產品的客製化選項 (商品目錄快照)
     # ==========================================
-    cur.execute("""
-        SELECT name, custom_options, custom_options_en, custom_options_jp, custom_options_kr 
-        FROM products
-    """)
-    product_map = {}
-    for p_row in cur.fetchall():
-        p_name = p_row[0]
-        
-        def split_opts(opt_str):
-            if not opt_str: return []
-            return [o.strip() for o in opt_str.split(',') if o.strip()]
-        
-        product_map[p_name] = {
-            'zh': split_opts(p_row[1]),
-            'en': split_opts(p_row[2]),
-            'jp': split_opts(p_row[3]),
-            'kr': split_opts(p_row[4])
-        }
+    catalog = get_catalog()
         
     cur.close()
     conn.close()
@@ -487,22 +442,6 @@ def order_success():
     if d_scheduled and len(d_scheduled) > 16:
         d_scheduled = d_scheduled[:16]
 
-    # 選項動態翻譯函式
-    def translate_option(p_name, opt_str, target_lang):
-        if p_name not in product_map:
-            return opt_str
-        p_data = product_map[p_name]
-        found_idx = -1
-        for l in ['zh', 'en', 'jp', 'kr']:
-            if opt_str in p_data[l]:
-                found_idx = p_data[l].index(opt_str)
-                break
-        if found_idx != -1:
-            target_list = p_data.get(target_lang, [])
-            if found_idx < len(target_list):
-                return target_list[found_idx]
-        return opt_str
-
     items = json.loads(json_str) if json_str else []
     items_html = ""
     
@@ -517,7 +456,7 @@ def order_success():
             
         translated_ops = []
         for opt in raw_ops:
-            translated_ops.append(translate_option(name_zh, str(opt).strip(), lang))
+            translated_ops.append(catalog.translate_option(name_zh, str(opt).strip(), lang))
             
         opt_str = f"<div class='item-options'>└ {', '.join(translated_ops)}</div>" if translated_ops else ""
         
@@ -0,0 +1,87 @@
+"""
+系統設定 (settings 表) 的記憶體快照
+
+每個 worker 只在第一次使用或收到變更通知後才讀一次資料庫，之後的請求直接讀記憶體。
+後台儲存設定時呼叫 notify_settings_changed(cur)，commit 後所有 worker 的快照都會失效。
+
+LISTEN 連線不可用時 (見 db_events.DB_EVENTS_ENABLED)，快照改以較短的 TTL 自動過期。
+"""
+import os
+import time
+
+import db_events
+from database import db_connection
+
+CHANNEL = 'settings_changed'
+SETTINGS_CACHE_TTL = float(os.environ.get("SETTINGS_CACHE_TTL", "300"))                 # LISTEN 正常時的保險過期秒數
+SETTINGS_CACHE_FALLBACK_TTL = float(os.environ.get("SETTINGS_CACHE_FALLBACK_TTL", "5"))  # 收不到通知時的過期秒數
+
+
+class SettingsSnapshot:
+    """某一時間點的設定內容 (唯讀)；常用欄位提供已轉型的屬性"""
+
+    def __init__(self, raw, version):
+        self._raw = dict(raw)
+        self.version = version
+        self.loaded_at = time.time()
+
+        self.shop_open = self._raw.get('shop_open', '1') == '1'
+        self.delivery_enabled = self._raw.get('delivery_enabled', '1') == '1'
+        self.delivery_min_price = _to_int(self._raw.get('delivery_min_price'), 500)
+        self.delivery_max_km = _to_float(self._raw.get('delivery_max_km'), 5.0)
+        self.delivery_fee_base = _to_int(self._raw.get('delivery_fee_base'), 0)
+        self.delivery_fee_per_km = _to_int(self._raw.get('delivery_fee_per_km'), 10)
+        self.report_email = (self._raw.get('report_email') or '').strip()
+        self.resend_api_key = (self._raw.get('resend_api_key') or '').strip()
+        self.sender_email = (self._raw.get('sender_email') or 'onboarding@resend.dev').strip()
+
+    def get(self, key, default=None):
+        return self._raw.get(key, default)
+
+    def as_dict(self):
+        """回傳原始 key/value 的複本 (呼叫端可自由修改)"""
+        return dict(self._raw)
+
+
+def _to_int(val, default):
+    try:
+        return int(float(val))
+    except (TypeError, ValueError):
+        return default
+
+
+def _to_float(val, default):
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return default
+
+
+def _load(generation):
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT key, value FROM settings")
+        rows = cur.fetchall()
+        cur.close()
+        conn.rollback()
+    return SettingsSnapshot(dict(rows), generation)
+
+
+_cache = db_events.SnapshotCache(
+    CHANNEL, _load, ttl=SETTINGS_CACHE_TTL, fallback_ttl=SETTINGS_CACHE_FALLBACK_TTL
+)
+
+
+def get_settings():
+    """取得目前的設定快照"""
+    return _cache.get()
+
+
+def invalidate(payload=None):
+    """讓本 worker 的快照失效 (儲存設定的 worker 在 commit 後立即呼叫，不必等通知)"""
+    _cache.invalidate()
+
+
+def notify_settings_changed(cur):
+    """在儲存設定的交易內呼叫；commit 後所有 worker 的快照都會失效"""
+    _cache.notify(cur)
@@ -0,0 +1,140 @@
+"""
+相同請求合併執行 (single-flight)
+
+多台看板在同一瞬間送出相同的查詢時，只讓第一個請求真的去查資料庫，
+其餘請求等它算完直接共用結果；算完後 ttl 秒內再來的相同請求也直接沿用。
+
+    _ranking = singleflight.group('sales_ranking', ttl=1.0)
+    value = _ranking.do(key, lambda: load(...))
+
+join_running=False 時不加入「在這個請求到達前就已開始」的計算：改為等它結束後，與期間到達的相同請求
+共用下一次計算 (同一時間最多兩次)。用在需要看到最新 commit 的查詢 (例如看板收到變動通知後的輪詢)。
+
+回傳值會被多個請求共用，呼叫端不可修改。每個 worker 各自一份，統計見 all_stats()。
+"""
+import time
+import threading
+
+_registry_lock = threading.Lock()
+_groups = {}
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """以 key 合併同時進行的相同計算；成功的結果保留 ttl 秒"""
+
+    def __init__(self, name, ttl=1.0, max_entries=256, join_running=True):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.join_running = join_running
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> _Call
+        self._next = {}      # key -> _Call (join_running=False：等進行中的計算結束後才開始的下一次)
+        self._recent = {}    # key -> (完成時間, 結果)
+        self._stats = {
+            'calls': 0,      # 總請求數
+            'executions': 0, # 實際執行次數
+            'shared': 0,     # 等待進行中的計算並共用結果
+            'fresh': 0,      # 直接使用 ttl 內的結果
+            'errors': 0,     # 執行失敗次數 (失敗的結果不保留)
+        }
+
+    def do(self, key, fn):
+        now = time.monotonic()
+        with self._lock:
+            self._stats['calls'] += 1
+            recent = self._recent.get(key)
+            if recent is not None and now - recent[0] < self.ttl:
+                self._stats['fresh'] += 1
+                return recent[1]
+            call = self._inflight.get(key)
+            running = None
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._inflight[key] = call
+                self._stats['executions'] += 1
+            elif not self.join_running:
+                # 進行中的計算可能在這個請求要看的 commit 之前就開始了，改為共用下一次計算
+                running = call
+                call = self._next.get(key)
+                leader = call is None
+                if leader:
+                    call = _Call()
+                    self._next[key] = call
+                    self._stats['executions'] += 1
+                else:
+                    self._stats['shared'] += 1
+            else:
+                self._stats['shared'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        if running is not None:
+            running.done.wait()  # 結束時已把這次計算換成進行中 (見下方 finally)
+
+        try:
+            call.value = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                nxt = self._next.pop(key, None)
+                if nxt is not None:
+                    self._inflight[key] = nxt
+                else:
+                    self._inflight.pop(key, None)
+                if call.error is None:
+                    self._remember(key, call.value)
+                else:
+                    self._stats['errors'] += 1
+            call.done.set()
+        return call.value
+
+    def _remember(self, key, value):
+        """(需持有鎖) 保留結果，並清掉已過期的舊結果"""
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        self._recent.pop(key, None)
+        self._recent[key] = (now, value)
+        if len(self._recent) > self.max_entries:
+            for k in [k for k, (t, _) in self._recent.items() if now - t >= self.ttl]:
+                del self._recent[k]
+            while len(self._recent) > self.max_entries:
+                del self._recent[next(iter(self._recent))]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['inflight'] = len(self._inflight)
+        stats['saved'] = stats['shared'] + stats['fresh']
+        stats['ttl'] = self.ttl
+        return stats
+
+
+def group(name, ttl=1.0, max_entries=256, join_running=True):
+    """取得 (或建立) 指定名稱的 SingleFlight，同名共用同一份"""
+    with _registry_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name, ttl=ttl, max_entries=max_entries, join_running=join_running)
+        return _groups[name]
+
+
+def all_stats():
+    """本 worker 所有 SingleFlight 的統計"""
+    with _registry_lock:
+        groups = list(_groups.values())
+    return {g.name: g.stats() for g in groups}
@@ -0,0 +1,308 @@
+"""
+出單內容 (結帳單 / 廚房分區單) 的產生
+
+下單時由 print_spooler.enqueue_order() 產生一次 ESC/POS 並存進 print_jobs，
+補印時直接讀取存好的內容；只有舊訂單 (還沒有列印紀錄) 才會在補印時重新產生。
+/kitchen/print_order 的 HTML 預覽也從這裡產生。
+
+分單規則：商品的 print_category 為 Noodle -> 麵區、Soup -> 湯區，其餘 (含找不到的商品) -> 其他。
+"""
+import escpos
+from business_day import to_tw
+from order_items import parse_cart
+
+ORDER_COLUMNS = """
+    table_number, total_price, daily_seq, content_json, created_at, status,
+    customer_name, customer_phone, customer_address, delivery_fee, scheduled_for,
+    order_type, lang
+"""
+
+ROLES = ('receipt', 'noodle', 'soup', 'other')   # 出單角色 (對應 kitchen.html 的印表機)
+KITCHEN_ROLES = ('noodle', 'soup', 'other')
+KITCHEN_TITLES = {'noodle': "廚房單-麵區", 'soup': "廚房單-湯區", 'other': "廚房單-其他"}
+
+# 初始化指令：重置 + 進入中文模式 + 設定字體代碼頁
+INIT_CMDS = escpos.INIT + escpos.CHINESE_MODE + escpos.CODEPAGE
+
+# 字體大小設定
+SIZE_X22 = escpos.SIZE_TRIPLE   # 3x3 標題
+SIZE_X11 = escpos.SIZE_DOUBLE   # 2x2 重要資訊
+SIZE_X01 = escpos.SIZE_TALL     # 1x2 拉高字體 (適合閱讀)
+SIZE_NORM = escpos.SIZE_NORMAL  # 標準
+
+BOLD_ON, BOLD_OFF = escpos.BOLD_ON, escpos.BOLD_OFF
+CENTER, LEFT = escpos.ALIGN_CENTER, escpos.ALIGN_LEFT
+ITEM_RULE = SIZE_NORM + b"-" * escpos.PAPER_COLS + b"\n"
+
+
+def roles_for(print_type):
+    """print_order 的 type 參數 (all / receipt / kitchen) -> 出單角色"""
+    if print_type == 'receipt':
+        return ('receipt',)
+    if print_type == 'kitchen':
+        return KITCHEN_ROLES
+    return ROLES
+
+
+def _has_text(v):
+    return bool(v and str(v).strip() != '' and str(v).lower() != 'none')
+
+
+class TicketOrder:
+    """出單需要的訂單資料 (唯讀)"""
+
+    def __init__(self, oid, row):
+        table_num, total_price, seq, content_json, created_at, status, \
+        c_name, c_phone, c_addr, c_fee, c_schedule, c_type, c_lang = row
+
+        self.id = oid
+        self.seq = seq or 0
+        self.status = status
+        self.total_price = int(total_price or 0)
+        self.lang = str(c_lang).lower()
+        self.fee = int(c_fee or 0)
+        self.table = str(table_num).strip() if table_num else ""
+        self.order_type = str(c_type).lower() if c_type else 'unknown'
+        self.name = c_name
+        self.phone = c_phone
+        self.address = c_addr
+        self.schedule = c_schedule
+        self.has_contact = _has_text(c_phone)
+        self.has_addr = _has_text(c_addr)
+        self.has_schedule = _has_text(c_schedule)
+        self.time_str = to_tw(created_at).strftime('%Y-%m-%d %H:%M:%S')
+        self.items = parse_cart(content_json)
+
+    @property
+    def receipt_lang(self):
+        return 'en' if self.lang == 'en' else 'zh'
+
+    def display_table(self, is_en=False):
+        if self.order_type == 'delivery': return "🛵 Delivery" if is_en else "🛵 外送"
+        if self.order_type == 'takeout': return "🥡 Takeout" if is_en else "🥡 自取"
+        if self.order_type == 'dine_in': return f"Table {self.table}" if is_en else f"桌號 {self.table}"
+        is_delivery = (self.table == '外送') or self.has_addr
+        return "Delivery" if is_delivery else (self.table if self.table else "Takeout")
+
+    def split_items(self, catalog):
+        """依商品目錄的出單分類分單 -> {'noodle': [...], 'soup': [...], 'other': [...]}"""
+        groups = {role: [] for role in KITCHEN_ROLES}
+        for item in self.items:
+            p_cat = catalog.print_category(item.get('name_zh') or item.get('name'))
+            if p_cat == 'Noodle': groups['noodle'].append(item)
+            elif p_cat == 'Soup': groups['soup'].append(item)
+            else: groups['other'].append(item)
+        return groups
+
+
+def load_order(cur, oid):
+    """讀取出單用的訂單資料，找不到時回傳 None"""
+    cur.execute(f"SELECT {ORDER_COLUMNS} FROM orders WHERE id = %s", (oid,))
+    row = cur.fetchone()
+    return TicketOrder(oid, row) if row else None
+
+
+def _item_lines(order, catalog, i, lang):
+    """(印出的品名, 數量, 翻譯後的選項)"""
+    name_zh = i.get('name_zh') or i.get('name')
+    name_to_print = (i.get('name_en') if lang == 'en' else name_zh) or name_zh
+    raw_opts = i.get('options') or i.get('options_zh') or []
+    if not isinstance(raw_opts, list): raw_opts = [raw_opts]
+    opts = [catalog.translate_option(name_zh, str(opt), lang) for opt in raw_opts if opt]
+    return name_to_print, i.get('qty', 1), opts
+
+
+# ==========================================
+# 🖨️ ESC/POS (80mm & 獨立字體控制)
+# ==========================================
+def _write_ticket(t, order, catalog, title, item_list, is_receipt, lang):
+    t.raw(escpos.INIT + CENTER)
+
+    # 1. 標題與序號
+    t.line(title, SIZE_X22 + BOLD_ON)
+    t.line(f"NO: #{order.seq:03d}", SIZE_X11)
+
+    # 2. 桌號 / 訂單類型
+    t.line(order.display_table(is_en=(lang == 'en')), BOLD_ON, after=BOLD_OFF)
+
+    # 3. 基礎資訊區 (靠左)
+    t.raw(LEFT + SIZE_X01)
+    t.line(f"訂單時間: {order.time_str}")
+
+    if order.has_schedule:
+        t.line(f"取單時間: {order.schedule}", BOLD_ON, after=BOLD_OFF + SIZE_X01)
+
+    if is_receipt:
+        if order.name:
+            t.line(f"姓名: {order.name}", after=SIZE_X01)
+        if order.has_contact:
+            t.line(f"電話: {order.phone}", after=SIZE_X01)
+        if order.has_addr:
+            # 地址通常較長，使用標準大小避免跑版
+            t.line(f"地址: {order.address}", SIZE_X01)
+
+    # 分隔線
+    t.raw(ITEM_RULE)
+
+    # 4. 商品清單
+    for i in item_list:
+        name_to_print, qty, opts_translated = _item_lines(order, catalog, i, lang)
+
+        # 商品名稱 (放大)
+        t.line(f"{name_to_print} x{qty}", SIZE_X11 + BOLD_ON, after=BOLD_OFF)
+
+        # 客製化選項 (拉高)
+        if opts_translated:
+            t.line(" + " + ", ".join(opts_translated), SIZE_X01)
+
+        # 商品間分隔線
+        t.raw(ITEM_RULE)
+
+    # 5. 結帳區 (僅收據)
+    if is_receipt:
+        t.raw(LEFT + SIZE_X01)
+        if order.fee > 0:
+            t.feed()
+
+        # 總價放大
+        label_total = "TOTAL: " if lang == 'en' else "總計: "
+        t.line(f"{label_total}${order.total_price}", SIZE_X22 + BOLD_ON, after=BOLD_OFF)
+
+        # 底部備註 (如果是外送單，再次強調地址)
+        if order.has_addr:
+            t.rule('*', style=SIZE_NORM)
+            t.line(f"Deliver to: {order.address}")
+
+    t.feed().cut()  # 少給一點空白
+
+
+def render_escpos(order, catalog, title, item_list, is_receipt=False, lang='zh', prefix=b''):
+    """產生一張單據的 ESC/POS (prefix 之後接內容)；非收據且沒有品項時回傳空 bytes"""
+    if not item_list and not is_receipt: return b""
+    t = escpos.Ticket(prefix)
+    _write_ticket(t, order, catalog, title, item_list, is_receipt, lang)
+    return t.getvalue()
+
+
+def render_tickets(order, catalog, roles=ROLES):
+    """
+    產生指定角色的單據 -> {角色: 可直接送給印表機的 bytes (含 INIT_CMDS)}。
+    結帳單一定會有；廚房分區沒有品項時不產生。
+    """
+    tickets = {}
+    if 'receipt' in roles:
+        title = "Receipt" if order.receipt_lang == 'en' else "結帳單"
+        tickets['receipt'] = render_escpos(order, catalog, title, order.items, is_receipt=True,
+                                           lang=order.receipt_lang, prefix=INIT_CMDS)
+    groups = order.split_items(catalog)
+    for role in KITCHEN_ROLES:
+        if role in roles and groups[role]:
+            tickets[role] = render_escpos(order, catalog, KITCHEN_TITLES[role], groups[role], lang='zh', prefix=INIT_CMDS)
+    return tickets
+
+
+# ==========================================
+# 👀 HTML 預覽 (print_order?format=preview)
+# ==========================================
+def _preview_html(order, catalog, title, item_list, is_receipt=False, lang='zh'):
+    if not item_list and not is_receipt: return ""
+    tbl_name = order.display_table(is_en=(lang == 'en'))
+    html = f"""
+    <div style="width: 400px; background: white; padding: 20px; border: 1px solid #ddd; font-family: 'Courier New', monospace; box-shadow: 0 4px 8px rgba(0,0,0,0.1); margin: 10px;">
+        <div style="text-align: center; border-bottom: 2px solid #000; padding-bottom: 10px;">
+            <h1 style="margin: 5px 0; font-size: 2.5em;">{title}</h1>
+            <div style="font-size: 2em; font-weight: bold;"># {order.seq:03d}</div>
+            <div style="font-size: 1.8em;">{tbl_name}</div>
+        </div>
+        <div style="font-size: 1.2em; margin: 10px 0; line-height: 1.5;">
+            TIME: {order.time_str}<br>
+            {f'<span style="background: black; color: white; padding: 2px 5px;">PREORDER: {order.schedule}</span>' if order.has_schedule else ''}
+        </div>
+        <div style="border-top: 1px dashed #000; margin: 10px 0;"></div>
+    """
+    for i in item_list:
+        name_to_print, qty, opts_translated = _item_lines(order, catalog, i, lang)
+        html += f'<div style="font-weight: bold; font-size: 1.8em; display: flex; justify-content: space-between;"><span>{name_to_print}</span><span>x{qty}</span></div>'
+        if opts_translated:
+            html += f'<div style="font-size: 1.1em; padding-left: 10px; margin-bottom: 5px; color: #333;">+ {", ".join(opts_translated)}</div>'
+        html += '<div style="border-top: 1px solid #eee; margin: 5px 0;"></div>'
+    if is_receipt:
+        html += f'<div style="text-align: right; margin-top: 15px;">'
+        if order.fee > 0: html += f'運費 Fee: ${order.fee}<br>'
+        html += f'<span style="font-size: 2em; font-weight: bold;">TOTAL: ${order.total_price}</span>'
+        if order.name: html += f'<br><span style="font-size: 1.2em;">Cust: {order.name}</span>'
+        html += '</div>'
+    html += "</div>"
+    return html
+
+
+def render_preview(order, catalog, print_type='all'):
+    """整頁預覽 HTML (結帳單 + 各分區廚房單)"""
+    roles = roles_for(print_type)
+    content = '<div style="display: flex; flex-wrap: wrap; justify-content: center; background: #f4f4f4; min-height: 100vh; padding: 20px;">'
+    if 'receipt' in roles:
+        content += _preview_html(order, catalog, "結帳單", order.items, is_receipt=True, lang=order.receipt_lang)
+    groups = order.split_items(catalog)
+    for role in KITCHEN_ROLES:
+        if role in roles and groups[role]:
+            content += _preview_html(order, catalog, KITCHEN_TITLES[role], groups[role])
+    content += '</div>'
+    return content
+
+
+# ==========================================
+# 📊 日結報表 (kitchen/report?format=blob)
+# ==========================================
+ALIGN_LEFT_BOLD = LEFT + BOLD_ON
+REPORT_RULE = CENTER + b"=" * 16 + b"\n"   # 字體變大，分隔線縮短為 16 個
+REPORT_DASH = CENTER + b"-" * 20 + b"\n"
+
+
+def _write_stats(t, heading, stats):
+    """銷售 / 作廢明細：字體大，採「名稱」一行，「數量金額」一行"""
+    t.raw(ALIGN_LEFT_BOLD).line(heading, after=BOLD_OFF)
+    if not stats:
+        t.line("無")
+        return
+    for k, v in sorted(stats.items(), key=lambda x: x[1]['qty'], reverse=True):
+        t.line(k[:16])
+        t.line(f"  x{v['qty']:>2} ${v['amt']:,}")
+
+
+def render_daily_report(target_date_str, printed_at, v_count, v_total, x_count, x_total, v_stats, x_stats):
+    """日結報表的 ESC/POS (所有文字放大至 x11)"""
+    t = escpos.Ticket(escpos.INIT + SIZE_X11)  # 初始化，全域最小尺寸為 x11
+
+    # 標題區 (置中)
+    t.raw(CENTER)
+    t.line("日結營收報表")
+    t.line(target_date_str)
+    t.line(f"時間:{printed_at.strftime('%H:%M:%S')}")
+    t.raw(b"=" * 16 + b"\n")
+
+    # 有效營收 (靠左)
+    t.feed().raw(ALIGN_LEFT_BOLD).line("有效營收", after=BOLD_OFF)
+    t.line(f"單數: {v_count}")
+    t.line(f"總計: ${v_total:,}")
+    t.feed().raw(REPORT_DASH)
+
+    # 作廢統計
+    t.raw(ALIGN_LEFT_BOLD).line("作廢統計", after=BOLD_OFF)
+    t.line(f"單數: {x_count}")
+    t.line(f"額度: ${x_total:,}")
+    t.raw(REPORT_RULE)
+
+    # 商品銷售明細 / 作廢商品明細
+    t.feed()
+    _write_stats(t, "銷售明細", v_stats)
+    t.feed().raw(REPORT_DASH)
+    _write_stats(t, "作廢明細", x_stats)
+    t.feed().raw(REPORT_RULE)
+
+    # 簽名區
+    t.feed().raw(LEFT)
+    t.line("經手人簽名:").feed(2)
+    t.line("________________")
+    t.line("- End Report -").feed()
+    t.feed(3).cut()  # 切刀
+    return t.getvalue()
@@ -0,0 +1,145 @@
+"""
+廚房看板輪詢傳輸量與 CPU 測試：比較 check_new_orders 的回應
+    html (ascii)  改版前：後端產生整張卡片 HTML (含大量 inline style)，包在 JSON 字串內，中文轉成 \\uXXXX
+    html          同上，但 JSON 直接輸出 UTF-8 (app.py 的 ensure_ascii = False)
+    json          後端只回傳精簡的訂單資料 (order_card_model)，由 kitchen.html 在前端組成卡片
+每種回應量測：
+    - 完整載入 (cursor 為空) 與增量輪詢 (1 張訂單有變動) 的回應大小，含 gzip 後大小
+    - 每次輪詢的伺服器 CPU 時間 (process_time)，分為卡片快取全部未命中 (cold) 與全部命中 (warm)
+
+測試在暫時的 schema 內進行，不影響正式資料；為了量到每一次的成本，會關閉輪詢結果共用 (singleflight)。
+用法 (需先設定 DATABASE_URL)：
+    python tools/bench_board_payload.py --orders 150 --rounds 50
+"""
+import os
+import sys
+import gzip
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+from flask import Flask
+
+import migrate
+from check_query_plans import seed_orders
+
+# (顯示名稱, format 參數, JSON 是否轉成 ASCII)
+VARIANTS = (('html (ascii)', 'html', True), ('html', 'html', False), ('json', 'json', False))
+RICH_CART = """[{"name_zh": "紅燒牛肉麵", "qty": 2, "unit_price": 180, "options_zh": ["大碗", "加麵", "不要蔥"]},
+                {"name_zh": "餛飩湯", "qty": 1, "unit_price": 60, "options_zh": ["加辣"]},
+                {"name_zh": "燙青菜", "qty": 1, "unit_price": 40, "options_zh": []}]"""
+
+
+def with_search_path(db_uri, schema):
+    """在連線字串加上 search_path，讓 database.py 的連線池也使用測試 schema"""
+    sep = '&' if '?' in db_uri else '?'
+    return f"{db_uri}{sep}options=-csearch_path%3D{schema}"
+
+
+def seed_board(cur, orders):
+    """今天的看板：一般內用、外送 (地址 / 運費 / 預約)、統編與載具，品項 3 筆含選項"""
+    seed_orders(cur, 1, orders)
+    cur.execute("""
+        UPDATE orders SET
+            content_json = %s,
+            customer_address = CASE WHEN order_type = 'delivery' THEN '台北市中正區重慶南路一段 ' || id || ' 號' END,
+            delivery_fee = CASE WHEN order_type = 'delivery' THEN 50 ELSE 0 END,
+            scheduled_for = CASE WHEN id %% 4 = 0 THEN '18:30' END,
+            tax_id = CASE WHEN id %% 5 = 0 THEN '12345675' END,
+            carrier_type = CASE WHEN id %% 6 = 0 THEN '3' END,
+            carrier_num = CASE WHEN id %% 6 = 0 THEN '/ABC+123' END
+    """, (RICH_CART,))
+
+
+def make_client(ascii_json):
+    from routes.kitchen_routes import kitchen_bp
+    app = Flask(__name__)
+    app.secret_key = 'bench'
+    app.json.ensure_ascii = ascii_json
+    app.register_blueprint(kitchen_bp, url_prefix='/kitchen')
+    return app.test_client()
+
+
+def poll(client, fmt, cursor=''):
+    # 與 kitchen.html 相同，完整載入時也帶空的 cursor (不附舊版頁面用的整頁 html)
+    r = client.get(f"/kitchen/check_new_orders?format={fmt}&cursor={cursor}")
+    return r.data, r.get_json()
+
+
+def cpu_per_poll(client, fmt, rounds, cold):
+    from routes import kitchen_routes
+    total = 0.0
+    for _ in range(rounds):
+        if cold:
+            kitchen_routes._card_cache.clear()
+        t0 = time.process_time()
+        poll(client, fmt)
+        total += time.process_time() - t0
+    return total / rounds * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="廚房看板輪詢傳輸量與 CPU 測試 (html vs json)")
+    parser.add_argument('--orders', type=int, default=150, help="今天的訂單數 (預設 150)")
+    parser.add_argument('--rounds', type=int, default=50, help="CPU 量測重複次數 (預設 50)")
+    args = parser.parse_args(argv)
+
+    db_uri = os.environ.get("DATABASE_URL")
+    if not db_uri:
+        sys.exit("錯誤：找不到環境變數 DATABASE_URL")
+
+    schema = f"board_payload_bench_{os.getpid()}"
+    conn = psycopg2.connect(db_uri)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f"CREATE SCHEMA {schema}")
+    cur.execute(f"SET search_path TO {schema}")
+
+    try:
+        print(f"🧪 建立測試 schema {schema} 並套用 migration ...")
+        migrate.apply_migrations(conn, verbose=False)
+        cur = conn.cursor()
+        print(f"🧪 灌入今天的假訂單 {args.orders} 筆 ...")
+        seed_board(cur, args.orders)
+
+        os.environ["DATABASE_URL"] = with_search_path(db_uri, schema)
+        from routes import kitchen_routes
+        kitchen_routes._board_flight.ttl = 0
+
+        print("-" * 88)
+        print(f"   {'格式':<12}{'完整載入':>10}{'gzip':>10}{'增量 (1 張)':>14}{'gzip':>8}{'CPU cold':>12}{'CPU warm':>12}")
+        results = {}
+        for label, fmt, ascii_json in VARIANTS:
+            client = make_client(ascii_json)
+            full, data = poll(client, fmt)
+            cards = data.get('orders' if fmt == 'json' else 'cards', [])
+            if len(cards) != args.orders:
+                sys.exit(f"❌ {fmt} 完整載入只有 {len(cards)} 張卡片 (預期 {args.orders})")
+            cur.execute("UPDATE orders SET status = 'Completed' WHERE id = (SELECT min(id) FROM orders WHERE status = 'Pending')")
+            delta, _ = poll(client, fmt, data['cursor'])
+            cold = cpu_per_poll(client, fmt, args.rounds, cold=True)
+            warm = cpu_per_poll(client, fmt, args.rounds, cold=False)
+            results[label] = (len(full), len(gzip.compress(full)), len(delta), cold, warm)
+            print(f"   {label:<14}{len(full) / 1024:9.1f} KB{len(gzip.compress(full)) / 1024:7.1f} KB"
+                  f"{len(delta) / 1024:11.1f} KB{len(gzip.compress(delta)) / 1024:5.1f} KB"
+                  f"{cold:9.2f} ms{warm:9.2f} ms")
+        print("-" * 88)
+    finally:
+        from database import _pool
+        if _pool is not None:
+            _pool.closeall()
+        conn.rollback()
+        conn.autocommit = True
+        conn.cursor().execute(f"DROP SCHEMA {schema} CASCADE")
+        conn.close()
+
+    html, js = results['html (ascii)'], results['json']
+    print(f"📊 json 完整載入為改版前的 {js[0] / html[0]:.0%} (gzip 後 {js[1] / html[1]:.0%})，"
+          f"增量輪詢為 {js[2] / html[2]:.0%}")
+    print(f"📊 每次輪詢 CPU：cold {html[3]:.2f} -> {js[3]:.2f} ms，warm {html[4]:.2f} -> {js[4]:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
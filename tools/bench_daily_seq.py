@@ -0,0 +1,200 @@
+"""
+每日流水號併發測試：N 個下單執行緒同時送單，比較
+    lock  舊做法：LOCK TABLE orders + MAX(daily_seq)+1 子查詢
+    counter 新做法：daily_counters 計數表 (與 process_order_submission 相同的 CTE)
+並檢查配發出的流水號是否有重複或跳號。另開一條「廚房」執行緒持續更新訂單狀態，
+量測它被下單流程卡住的時間。
+
+測試在暫時的 schema 內進行，不影響正式資料。
+用法 (需先設定 DATABASE_URL)：
+    python tools/bench_daily_seq.py --threads 16 --orders 100
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+import migrate
+from business_day import tw_today
+
+
+def connect(db_uri, schema):
+    conn = psycopg2.connect(db_uri)
+    cur = conn.cursor()
+    cur.execute(f"SET search_path TO {schema}")
+    conn.commit()
+    cur.close()
+    return conn
+
+
+def pause(latency_ms):
+    """模擬應用程式與資料庫之間的網路往返 (同一台機器測試時幾乎為 0，會低估鎖的影響)"""
+    if latency_ms:
+        time.sleep(latency_ms / 1000.0)
+
+
+def submit_lock(cur, business_date, latency_ms):
+    """舊做法 (與改版前 process_order_submission 相同)"""
+    cur.execute("LOCK TABLE orders IN SHARE ROW EXCLUSIVE MODE")
+    pause(latency_ms)
+    cur.execute("""
+        INSERT INTO orders (table_number, items, total_price, daily_seq, created_at)
+        VALUES ('1', 'bench', 100,
+                (SELECT COALESCE(MAX(daily_seq), 0) + 1 FROM orders WHERE created_at >= CURRENT_DATE),
+                NOW())
+        RETURNING daily_seq
+    """)
+    pause(latency_ms)
+    return cur.fetchone()[0]
+
+
+def submit_counter(cur, business_date, latency_ms):
+    """新做法 (與 process_order_submission 相同的 daily_counters CTE)"""
+    cur.execute("""
+        WITH seq AS (
+            INSERT INTO daily_counters (business_date, last_seq) VALUES (%s, 1)
+            ON CONFLICT (business_date) DO UPDATE SET last_seq = daily_counters.last_seq + 1
+            RETURNING last_seq
+        )
+        INSERT INTO orders (table_number, items, total_price, daily_seq, created_at)
+        SELECT '1', 'bench', 100, seq.last_seq, NOW() FROM seq
+        RETURNING daily_seq
+    """, (business_date,))
+    pause(latency_ms)
+    return cur.fetchone()[0]
+
+
+def run_mode(db_uri, schema, mode, threads, per_thread, rollback_rate, latency_ms):
+    submit = submit_lock if mode == 'lock' else submit_counter
+    business_date = tw_today()
+
+    setup = connect(db_uri, schema)
+    cur = setup.cursor()
+    cur.execute("TRUNCATE orders RESTART IDENTITY")
+    cur.execute("DELETE FROM daily_counters")
+    # 先放一筆給廚房執行緒更新
+    cur.execute("INSERT INTO orders (table_number, items, total_price, daily_seq) VALUES ('0', 'kitchen', 0, 0) RETURNING id")
+    kitchen_oid = cur.fetchone()[0]
+    setup.commit()
+
+    committed = []
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    stop = threading.Event()
+    kitchen_waits = []
+
+    def worker():
+        conn = connect(db_uri, schema)
+        c = conn.cursor()
+        mine, lat = [], []
+        try:
+            for _ in range(per_thread):
+                t0 = time.perf_counter()
+                seq = submit(c, business_date, latency_ms)
+                # 模擬少量下單失敗 (例如後續驗證錯誤)，號碼必須跟著回滾
+                if random.random() < rollback_rate:
+                    conn.rollback()
+                else:
+                    conn.commit()
+                    mine.append(seq)
+                lat.append((time.perf_counter() - t0) * 1000)
+        except Exception as e:
+            errors.append(str(e))
+        finally:
+            conn.close()
+        with lock:
+            committed.extend(mine)
+            latencies.extend(lat)
+
+    def kitchen():
+        conn = connect(db_uri, schema)
+        c = conn.cursor()
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            c.execute("UPDATE orders SET status = 'Completed' WHERE id = %s", (kitchen_oid,))
+            conn.commit()
+            kitchen_waits.append((time.perf_counter() - t0) * 1000)
+            time.sleep(0.005)
+        conn.close()
+
+    kt = threading.Thread(target=kitchen, daemon=True)
+    kt.start()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    t0 = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    kt.join()
+
+    cur.execute("SELECT daily_seq FROM orders WHERE items = 'bench' ORDER BY daily_seq")
+    stored = [r[0] for r in cur.fetchall()]
+    setup.close()
+
+    duplicates = len(stored) - len(set(stored))
+    expected = list(range(1, len(stored) + 1))
+    gaps = len(set(expected) - set(stored))
+
+    latencies.sort()
+    kitchen_waits.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+    print(f"[{mode:<7}] 成功 {len(stored):>5} 筆  {len(stored) / elapsed:8.1f} 筆/秒  "
+          f"平均 {statistics.mean(latencies):7.2f}ms  p95 {p95:7.2f}ms  "
+          f"廚房更新最慢 {kitchen_waits[-1] if kitchen_waits else 0:7.2f}ms  "
+          f"重複 {duplicates}  跳號 {gaps}  錯誤 {len(errors)}")
+    if errors:
+        print(f"   ❌ 第一個錯誤: {errors[0]}")
+    return duplicates == 0 and gaps == 0 and not errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="每日流水號併發測試")
+    parser.add_argument('--threads', type=int, default=16, help="同時下單的執行緒數 (預設 16)")
+    parser.add_argument('--orders', type=int, default=100, help="每個執行緒送出的訂單數 (預設 100)")
+    parser.add_argument('--rollback-rate', type=float, default=0.05, help="模擬下單失敗回滾的比例 (預設 0.05)")
+    parser.add_argument('--latency-ms', type=float, default=1.0,
+                        help="模擬每次 SQL 往返的網路延遲 (預設 1ms，雲端資料庫通常 1~5ms)")
+    parser.add_argument('--mode', choices=['both', 'lock', 'counter'], default='both')
+    args = parser.parse_args(argv)
+
+    db_uri = os.environ.get("DATABASE_URL")
+    if not db_uri:
+        sys.exit("錯誤：找不到環境變數 DATABASE_URL")
+
+    schema = f"bench_seq_{os.getpid()}"
+    admin = psycopg2.connect(db_uri)
+    admin.autocommit = True
+    admin.cursor().execute(f"CREATE SCHEMA {schema}")
+    admin.cursor().execute(f"SET search_path TO {schema}")
+
+    ok = True
+    try:
+        migrate.apply_migrations(admin, verbose=False)
+        modes = ['lock', 'counter'] if args.mode == 'both' else [args.mode]
+        print(f"🧪 {args.threads} 個執行緒 x {args.orders} 筆，回滾比例 {args.rollback_rate:.0%}，"
+              f"網路延遲 {args.latency_ms}ms")
+        for mode in modes:
+            ok = run_mode(db_uri, schema, mode, args.threads, args.orders, args.rollback_rate,
+                          args.latency_ms) and ok
+    finally:
+        admin.autocommit = True
+        admin.cursor().execute(f"DROP SCHEMA {schema} CASCADE")
+        admin.close()
+
+    if not ok:
+        print("❌ 流水號出現重複或跳號")
+        sys.exit(1)
+    print("✅ 流水號無重複、無跳號")
+
+
+if __name__ == '__main__':
+    main()
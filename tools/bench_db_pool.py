@@ -0,0 +1,100 @@
+"""
+連線池效能測試：比較「每次重新連線」與「從連線池借出」的耗時。
+
+用法 (需先設定 DATABASE_URL，建議指向與正式環境相同區域的資料庫才有參考價值)：
+    python tools/bench_db_pool.py --rounds 200 --threads 8
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+import database
+
+
+def summarize(label, samples_ms):
+    samples_ms = sorted(samples_ms)
+    p95 = samples_ms[int(len(samples_ms) * 0.95) - 1] if len(samples_ms) >= 20 else samples_ms[-1]
+    print(f"{label:<28} 次數={len(samples_ms):>5}  平均={statistics.mean(samples_ms):8.2f}ms  "
+          f"中位數={statistics.median(samples_ms):8.2f}ms  p95={p95:8.2f}ms")
+
+
+def run_direct(db_uri, rounds):
+    """舊做法：每個請求都 psycopg2.connect() 一次"""
+    samples = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        conn = psycopg2.connect(db_uri)
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.fetchone()
+        cur.close()
+        conn.close()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def run_pooled(rounds):
+    """新做法：從連線池借出 / 歸還"""
+    samples = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        conn = database.get_db_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.fetchone()
+        cur.close()
+        conn.close()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def run_threaded(fn, threads, rounds):
+    """模擬 gunicorn 多執行緒同時存取"""
+    results = []
+    lock = threading.Lock()
+
+    def worker():
+        s = fn(rounds)
+        with lock:
+            results.extend(s)
+
+    ts = [threading.Thread(target=worker) for _ in range(threads)]
+    t0 = time.perf_counter()
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    return results, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="連線池 vs 直接連線 效能比較")
+    parser.add_argument('--rounds', type=int, default=100, help='每個執行緒執行幾次')
+    parser.add_argument('--threads', type=int, default=4, help='併發執行緒數')
+    args = parser.parse_args()
+
+    db_uri = os.environ.get("DATABASE_URL")
+    if not db_uri:
+        sys.exit("請先設定環境變數 DATABASE_URL")
+
+    print(f"🔬 單執行緒 x {args.rounds} 次")
+    summarize("直接連線 (psycopg2.connect)", run_direct(db_uri, args.rounds))
+    summarize("連線池 (get_db_connection)", run_pooled(args.rounds))
+
+    print(f"\n🔬 {args.threads} 執行緒 x {args.rounds} 次")
+    direct, direct_secs = run_threaded(lambda n: run_direct(db_uri, n), args.threads, args.rounds)
+    pooled, pooled_secs = run_threaded(run_pooled, args.threads, args.rounds)
+    summarize("直接連線 (psycopg2.connect)", direct)
+    summarize("連線池 (get_db_connection)", pooled)
+    print(f"\n吞吐量: 直接連線 {len(direct) / direct_secs:,.0f} 次/秒, 連線池 {len(pooled) / pooled_secs:,.0f} 次/秒")
+    print(f"📊 連線池統計: {database.get_pool_stats()}")
+
+
+if __name__ == '__main__':
+    main()
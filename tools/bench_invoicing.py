@@ -0,0 +1,197 @@
+"""
+電子發票端到端速度測試：以綠界替身 (fake_ecpay_server.py) 量測經由 complete_order 開立發票的速度
+
+    1. 灌入 N 筆待出餐訂單 (發票未開立)
+    2. --clients 個收銀執行緒同時呼叫 /kitchen/complete/<id>
+    3. 發票佇列 worker (INVOICE_WORKERS) 呼叫替身開立並寫回訂單，等到全部 Issued 為止
+並統計出餐請求的延遲、每秒開立張數，並確認沒有重複開立。
+加上 --inline 則改為在收銀執行緒內直接呼叫 issue_ecpay_invoice (佇列上線前出餐時同步開立的做法) 作為對照。
+
+測試在暫時的 schema 內進行，不影響正式資料。
+用法 (需先設定 DATABASE_URL)：
+    python tools/bench_invoicing.py --orders 300 --clients 8 --workers 4 --latency-ms 150
+    python tools/bench_invoicing.py --orders 300 --clients 8 --latency-ms 150 --inline
+    python tools/bench_invoicing.py --orders 300 --error-rate 0.1        # 綠界間歇失敗時的重試
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+
+from check_query_plans import seed_orders
+from bench_board_payload import with_search_path
+from fake_ecpay_server import FakeEcpayServer
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def issue_inline(oid):
+    """佇列上線前的做法：出餐請求內直接呼叫綠界並寫回 (佇列裡的工作改為不送出)"""
+    from database import db_connection
+    from ecpay_invoice import issue_ecpay_invoice
+    with db_connection() as c:
+        cur = c.cursor()
+        cur.execute("UPDATE invoice_outbox SET status = 'cancelled' WHERE order_id = %s AND status = 'queued'", (oid,))
+        cur.execute("SELECT id, total_price, content_json FROM orders WHERE id = %s", (oid,))
+        row = cur.fetchone()
+        res = issue_ecpay_invoice({'id': row[0], 'total_price': row[1], 'content_json': row[2]})
+        if res.get('success'):
+            cur.execute("UPDATE orders SET invoice_number = %s, invoice_status = 'Issued' WHERE id = %s",
+                        (res['invoice_no'], oid))
+        c.commit()
+
+
+def run_clients(n, oids, fn):
+    """n 個執行緒分攤 oids，各自呼叫 fn(client_index, oid)，回傳每次呼叫的秒數"""
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(i):
+        mine = []
+        for oid in oids[i::n]:
+            t0 = time.perf_counter()
+            fn(i, oid)
+            mine.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="電子發票端到端速度測試 (綠界替身)")
+    parser.add_argument('--orders', type=int, default=300, help="訂單數 (預設 300)")
+    parser.add_argument('--clients', type=int, default=8, help="同時出餐的收銀執行緒數 (預設 8)")
+    parser.add_argument('--workers', type=int, default=4, help="發票佇列 worker 數 (預設 4)")
+    parser.add_argument('--latency-ms', type=float, default=150, help="替身每個請求的延遲 (預設 150)")
+    parser.add_argument('--jitter-ms', type=float, default=50, help="延遲的隨機增減範圍 (預設 50)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="替身回應 HTTP 503 的比例")
+    parser.add_argument('--inline', action='store_true', help="對照組：出餐時同步開立 (不經發票佇列)")
+    parser.add_argument('--timeout', type=float, default=300, help="等待全部開立完成的秒數上限")
+    args = parser.parse_args(argv)
+
+    db_uri = os.environ.get("DATABASE_URL")
+    if not db_uri:
+        sys.exit("錯誤：找不到環境變數 DATABASE_URL")
+
+    # 替身與環境變數要在 import ecpay_invoice / invoice_outbox 之前設定好
+    srv = FakeEcpayServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate).start()
+    os.environ.update(srv.env())
+    os.environ["INVOICE_WORKERS"] = str(0 if args.inline else args.workers)
+    os.environ.setdefault("INVOICE_RETRY_BASE", "1")
+    os.environ.setdefault("INVOICE_POLL_INTERVAL", "1")
+
+    schema = f"invoice_bench_{os.getpid()}"
+    admin = psycopg2.connect(db_uri)
+    admin.autocommit = True
+    admin.cursor().execute(f"CREATE SCHEMA {schema}")
+    os.environ["DATABASE_URL"] = with_search_path(db_uri, schema)
+
+    import migrate
+    import invoice_outbox
+    import ecpay_invoice
+    from flask import Flask
+    from database import init_db_pool
+    from routes import kitchen_bp
+
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    ok = True
+    try:
+        migrate.apply_migrations(conn, verbose=False)
+        conn.autocommit = False
+        cur = conn.cursor()
+        seed_orders(cur, 1, args.orders)
+        cur.execute("UPDATE orders SET status = 'Pending', invoice_status = 'Not Issued', invoice_number = NULL")
+        conn.commit()
+        cur.execute("SELECT id FROM orders ORDER BY id")
+        oids = [r[0] for r in cur.fetchall()]
+        conn.commit()
+
+        app = Flask(__name__)
+        app.secret_key = 'bench'
+        init_db_pool(app)
+        app.register_blueprint(kitchen_bp, url_prefix='/kitchen')
+        clients = []
+        for _ in range(args.clients):
+            cl = app.test_client()
+            with cl.session_transaction() as s:
+                s['user_id'], s['username'], s['role'] = 1, 'bench', 'admin'
+            clients.append(cl)
+
+        mode = "出餐時同步開立 (對照組)" if args.inline else f"發票佇列 ({args.workers} 個 worker)"
+        print(f"🧪 {len(oids)} 筆訂單、{args.clients} 個收銀、替身延遲 {args.latency_ms:.0f}±{args.jitter_ms:.0f} ms、"
+              f"錯誤率 {args.error_rate:.0%}：{mode}")
+        invoice_outbox.start_workers()
+
+        def complete(i, oid):
+            r = clients[i].get(f'/kitchen/complete/{oid}')
+            if r.status_code != 200:
+                print(f"   ⚠️ 訂單 #{oid} 出餐失敗: HTTP {r.status_code}")
+            if args.inline:
+                issue_inline(oid)
+
+        t0 = time.perf_counter()
+        latencies = run_clients(args.clients, oids, complete)
+        t_requests = time.perf_counter() - t0
+
+        issued = 0
+        while time.perf_counter() - t0 < args.timeout:
+            cur.execute("SELECT count(*) FROM orders WHERE invoice_status = 'Issued'")
+            issued = cur.fetchone()[0]
+            conn.commit()
+            if issued >= len(oids):
+                break
+            time.sleep(0.05)
+        t_total = time.perf_counter() - t0
+
+        ms = [x * 1000 for x in latencies]
+        print(f"   📊 出餐請求：p50 {percentile(ms, 0.5):.1f} ms、p95 {percentile(ms, 0.95):.1f} ms、"
+              f"最長 {max(ms):.1f} ms ({len(ms) / t_requests:,.0f} 筆/秒)")
+        print(f"   📊 端到端：{issued}/{len(oids)} 張發票 {t_total:.2f} 秒完成 ({issued / t_total:,.1f} 張/秒)")
+
+        cur.execute("SELECT count(*), count(DISTINCT invoice_number) FROM orders WHERE invoice_status = 'Issued'")
+        total, distinct = cur.fetchone()
+        cur.execute("SELECT invoice_number FROM orders WHERE invoice_status = 'Issued'")
+        unknown = [r[0] for r in cur.fetchall() if r[0] not in srv.invoices]
+        conn.commit()
+        ok &= issued == len(oids) and total == distinct and not unknown and srv.stats['issued'] == len(oids)
+        print(f"   {'✅' if ok else '❌'} 全部開立且沒有重複：訂單 {total} 張 / 號碼 {distinct} 個 / "
+              f"替身開立 {srv.stats['issued']} 張 / 不明號碼 {len(unknown)} 個")
+        print(f"   📊 替身統計: {srv.stats}")
+        if not args.inline:
+            cur.execute("SELECT status, count(*), max(attempts) FROM invoice_outbox GROUP BY status ORDER BY status")
+            print(f"   📊 發票佇列: {cur.fetchall()}")
+            print(f"   📊 worker: {invoice_outbox.get_worker_stats()}")
+        ecpay = ecpay_invoice.get_ecpay_stats()
+        print(f"   📊 綠界連線: 斷路器 {ecpay['breaker']}、" +
+              "、".join(f"{k} {v['count']} 次 平均 {v['avg_ms']} ms" for k, v in ecpay['endpoints'].items()))
+    finally:
+        conn.close()
+        srv.stop()
+        from database import _pool
+        if _pool is not None:
+            _pool.closeall()
+        admin.cursor().execute(f"DROP SCHEMA {schema} CASCADE")
+        admin.close()
+
+    print("✅ 完成" if ok else "❌ 有檢查未通過")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
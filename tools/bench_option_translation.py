@@ -0,0 +1,117 @@
+"""
+選項翻譯效能測試：比較舊版 translate_option (每個選項逐一掃四種語系 list)
+與 catalog 預先建好的對照表 (查表一次)，並確認兩者翻譯結果完全相同。
+
+不需要資料庫，直接以假商品建立 CatalogSnapshot。
+用法：
+    python tools/bench_option_translation.py --products 80 --options 15 --items 60 --opts-per-item 6
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import CatalogSnapshot, LANGS
+
+
+def fake_rows(n_products, n_options):
+    """產生與 products 查詢相同欄位順序的假資料"""
+    rows = []
+    for p in range(n_products):
+        opts = {l: ",".join(f"{l}選項{p}-{o}" for o in range(n_options)) for l in LANGS}
+        rows.append((
+            p + 1, f"商品{p}", 100 + p, "主餐", "", True, opts['zh'], p,
+            f"Item{p}", f"品{p}", f"상품{p}",
+            opts['en'], opts['jp'], opts['kr'],
+            random.choice(['Noodle', 'Soup', 'Other']),
+            "Main", "メイン", "메인",
+        ))
+    return rows
+
+
+def legacy_translate(product_map, p_name, opt_str, target_lang):
+    """改版前 order_success / print_order 內的寫法"""
+    if p_name not in product_map:
+        return opt_str
+    p_data = product_map[p_name]
+    found_idx = -1
+    for l in ['zh', 'en', 'jp', 'kr']:
+        if opt_str in p_data[l]:
+            found_idx = p_data[l].index(opt_str)
+            break
+    if found_idx != -1:
+        target_list = p_data.get(target_lang, [])
+        if found_idx < len(target_list):
+            return target_list[found_idx]
+    return opt_str
+
+
+def build_ticket(catalog, n_items, opts_per_item):
+    """一張大訂單：每個品項帶多個 (任意語系的) 選項"""
+    names = list(catalog.option_lists)
+    ticket = []
+    for _ in range(n_items):
+        name = random.choice(names)
+        lists = catalog.option_lists[name]
+        opts = [random.choice(lists[random.choice(LANGS)]) for _ in range(opts_per_item)]
+        opts.append("備註：不要香菜")  # 不在選項表內的自由文字
+        ticket.append((name, opts))
+    return ticket
+
+
+def run(fn, ticket, rounds):
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for name, opts in ticket:
+            for lang in LANGS:
+                for opt in opts:
+                    fn(name, opt, lang)
+    return (time.perf_counter() - t0) / rounds * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="選項翻譯效能測試")
+    parser.add_argument('--products', type=int, default=80, help="商品數 (預設 80)")
+    parser.add_argument('--options', type=int, default=15, help="每個商品的選項數 (預設 15)")
+    parser.add_argument('--items', type=int, default=60, help="每張單的品項數 (預設 60)")
+    parser.add_argument('--opts-per-item', type=int, default=6, help="每個品項的選項數 (預設 6)")
+    parser.add_argument('--rounds', type=int, default=200, help="重複次數 (預設 200)")
+    args = parser.parse_args(argv)
+
+    random.seed(42)
+    t0 = time.perf_counter()
+    catalog = CatalogSnapshot(fake_rows(args.products, args.options), version=1)
+    build_ms = (time.perf_counter() - t0) * 1000
+    ticket = build_ticket(catalog, args.items, args.opts_per_item)
+    n_lookups = sum(len(opts) for _, opts in ticket) * len(LANGS)
+
+    def legacy(name, opt, lang):
+        return legacy_translate(catalog.option_lists, name, opt, lang)
+
+    # 正確性：所有 (品名, 選項, 語系) 組合的結果必須一致
+    mismatches = 0
+    for name, lists in catalog.option_lists.items():
+        for l in LANGS:
+            for opt in lists[l] + ["不存在的選項"]:
+                for target in LANGS + ('xx',):
+                    if legacy(name, opt, target) != catalog.translate_option(name, opt, target):
+                        mismatches += 1
+
+    legacy_ms = run(legacy, ticket, args.rounds)
+    indexed_ms = run(catalog.translate_option, ticket, args.rounds)
+
+    print(f"🧪 {args.products} 個商品 x {args.options} 個選項；每張單 {args.items} 品項 x {args.opts_per_item + 1} 個選項 x {len(LANGS)} 語系 = {n_lookups} 次翻譯")
+    print(f"   建立對照表 (每個目錄版本一次): {build_ms:8.2f}ms  ({len(catalog.option_translations)} 筆)")
+    print(f"   舊版逐一掃描: 每張單 {legacy_ms:8.3f}ms")
+    print(f"   對照表查詢  : 每張單 {indexed_ms:8.3f}ms  (快 {legacy_ms / indexed_ms:.1f} 倍)")
+    if mismatches:
+        print(f"❌ 翻譯結果不一致 {mismatches} 筆")
+        sys.exit(1)
+    print("✅ 翻譯結果與舊版完全一致")
+
+
+if __name__ == '__main__':
+    main()
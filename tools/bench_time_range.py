@@ -0,0 +1,99 @@
+"""
+營業日時間範圍查詢效能測試：在大量假訂單上比較三種「查某一天訂單」的寫法
+    date      舊寫法：DATE(created_at) = 'YYYY-MM-DD' (而且算的是 UTC 日期，不是台灣營業日)
+    interval  舊寫法：(created_at + interval '8 hours') 介於 00:00:00 ~ 23:59:59
+    range     新寫法：business_day.day_range() 的 UTC 半開區間 created_at >= start AND created_at < end
+並確認 interval 與 range 查到的筆數相同 (date 因為日期定義不同，筆數本來就會不一樣)。
+
+測試在暫時的 schema 內進行，不影響正式資料。
+用法 (需先設定 DATABASE_URL)：
+    python tools/bench_time_range.py --days 365 --per-day 300 --rounds 20
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+import migrate
+from business_day import tw_today, day_range, range_sql
+from check_query_plans import seed_orders, explain, find_seq_scans, empty_partitions
+
+SELECT = "SELECT id, total_price, status FROM orders WHERE "
+MODES = {
+    'date': (SELECT + "DATE(created_at) = %s",
+             lambda day: (day,)),
+    'interval': (SELECT + "(created_at + interval '8 hours') >= %s AND (created_at + interval '8 hours') <= %s",
+                 lambda day: (f"{day} 00:00:00", f"{day} 23:59:59")),
+    'range': (SELECT + range_sql(),
+              lambda day: day_range(day)),
+}
+
+
+def run(cur, sql, params, rounds):
+    rows = 0
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        cur.execute(sql, params)
+        rows = len(cur.fetchall())
+    return (time.perf_counter() - t0) / rounds * 1000, rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="營業日時間範圍查詢效能測試")
+    parser.add_argument('--days', type=int, default=365, help="假資料天數 (預設 365)")
+    parser.add_argument('--per-day', type=int, default=300, help="每天訂單數 (預設 300)")
+    parser.add_argument('--rounds', type=int, default=20, help="每種寫法重複次數 (預設 20)")
+    args = parser.parse_args(argv)
+
+    db_uri = os.environ.get("DATABASE_URL")
+    if not db_uri:
+        sys.exit("錯誤：找不到環境變數 DATABASE_URL")
+
+    schema = f"time_range_bench_{os.getpid()}"
+    conn = psycopg2.connect(db_uri)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f"CREATE SCHEMA {schema}")
+    cur.execute(f"SET search_path TO {schema}")
+
+    try:
+        print(f"🧪 建立測試 schema {schema} 並套用 migration ...")
+        migrate.apply_migrations(conn, verbose=False)
+        cur = conn.cursor()
+        print(f"🧪 灌入假資料 {args.days} 天 x {args.per_day} 筆 ...")
+        seed_orders(cur, args.days, args.per_day)
+        empty = empty_partitions(cur)
+
+        day = tw_today() - timedelta(days=args.days // 2)
+        print(f"🧪 查詢營業日 {day}，每種寫法 {args.rounds} 次")
+        print("-" * 72)
+        results = {}
+        for mode, (sql, make_params) in MODES.items():
+            params = make_params(day)
+            plan = explain(cur, sql, params)
+            seq_scans = find_seq_scans(plan, ignore=empty)
+            avg_ms, rows = run(cur, sql, params, args.rounds)
+            results[mode] = (avg_ms, rows)
+            scan = f"Seq Scan on {', '.join(seq_scans)}" if seq_scans else plan['Node Type']
+            print(f"   {mode:<9} 平均 {avg_ms:8.2f}ms  {rows:6d} 筆  {scan}")
+        print("-" * 72)
+    finally:
+        conn.rollback()
+        conn.autocommit = True
+        conn.cursor().execute(f"DROP SCHEMA {schema} CASCADE")
+        conn.close()
+
+    range_ms, range_rows = results['range']
+    print(f"📊 range 比 date 快 {results['date'][0] / range_ms:.1f} 倍，比 interval 快 {results['interval'][0] / range_ms:.1f} 倍")
+    if results['interval'][1] != range_rows:
+        print(f"❌ interval ({results['interval'][1]} 筆) 與 range ({range_rows} 筆) 筆數不同")
+        sys.exit(1)
+    print("✅ range 與舊版 interval 寫法查到的筆數相同")
+
+
+if __name__ == '__main__':
+    main()
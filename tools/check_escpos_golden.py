@@ -0,0 +1,151 @@
+"""
+出單 ESC/POS 的 golden 檢查與速度測試
+
+以固定的假商品 / 假訂單 (不需要資料庫) 產生結帳單、各分區廚房單與日結報表，
+逐 byte 與 tools/golden/escpos_golden.json 比對；修改 tickets.py / escpos.py 後執行，
+確認印表機實際收到的內容沒有任何改變。
+
+golden 檔由重構前的程式產生 (日結報表當時以 cp950 編碼)。日結報表改用與出單相同的 big5-hkscs 後，
+fixture 內的字元編碼結果不變；cp950 與 big5-hkscs 編碼不同的字元 (例如 '€' 只有 cp950 有、'着' 只有
+big5-hkscs 有) 在日結報表上印出來會不一樣，所以報表的 fixture 不使用這類字元
+(出單本來就是 big5-hkscs，symbols 訂單的 '€' 在重構前後都印成 ?)。
+
+用法：
+    python tools/check_escpos_golden.py                 比對 (有差異時列出第一個不同的位置)
+    python tools/check_escpos_golden.py --write         以目前的輸出重新產生 golden 檔 (確認變更是刻意的才執行)
+    python tools/check_escpos_golden.py --bench 2000    另外量測每秒可產生的單據數
+"""
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tickets
+from catalog import CatalogSnapshot
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden', 'escpos_golden.json')
+
+# 與 products 查詢相同的欄位順序 (見 catalog._load)
+PRODUCTS = [
+    (1, '紅燒牛肉麵', 180, '麵', '', True, '大碗,加麵,不要蔥', 1, 'Braised Beef Noodle', None, None,
+     'Large,Extra noodle,No scallion', None, None, 'Noodle', 'Noodles', None, None),
+    (2, '餛飩湯', 60, '湯', '', True, '加辣', 2, 'Wonton Soup', None, None, 'Spicy', None, None, 'Soup', 'Soup', None, None),
+    (3, '燙青菜', 40, '小菜', '', True, '', 3, 'Vegetables', None, None, '', None, None, 'Other', 'Sides', None, None),
+    (4, '滷肉飯', 50, '飯', '', True, '', 4, None, None, None, None, None, None, None, None, None, None),
+]
+
+# (訂單編號, tickets.ORDER_COLUMNS 順序的欄位)
+ORDERS = [
+    ('dine_in_zh', ('5', 520, 7, json.dumps([
+        {'name_zh': '紅燒牛肉麵', 'name_en': 'Braised Beef Noodle', 'qty': 2, 'options_zh': ['大碗', '不要蔥']},
+        {'name_zh': '餛飩湯', 'qty': 1, 'options': '加辣'},
+        {'name_zh': '燙青菜', 'qty': 1},
+    ], ensure_ascii=False), datetime(2026, 10, 18, 3, 4, 5), 'Pending', None, None, None, 0, None, 'dine_in', 'zh')),
+    ('delivery_en', ('外送', 450, 12, json.dumps([
+        {'name_zh': '紅燒牛肉麵', 'name_en': 'Braised Beef Noodle', 'qty': 1, 'options_en': ['Large'], 'options_zh': ['大碗']},
+        {'name_zh': '神秘商品', 'qty': 3},
+    ], ensure_ascii=False), datetime(2026, 10, 18, 11, 30, 0), 'Pending', '王小明', '0912345678',
+        '台北市中正區重慶南路一段 122 號 3 樓', 60, '18:30', 'delivery', 'en')),
+    ('takeout_legacy', ('外帶', 120, 3, '[{"name": "舊格式", "qty": 1, "options": ["a", "b"]}]',
+                        datetime(2026, 10, 17, 23, 59, 59), 'Completed', 'Amy', None, None, 0, '12:00', 'takeout', 'zh')),
+    ('unknown_type', (None, 200, 101, '{"name_zh": "餛飩湯", "qty": 4}', datetime(2026, 10, 18, 0, 0, 0),
+                      'Pending', None, 'none', 'none', 0, None, None, 'jp')),
+    ('symbols', ('12', 99, 8, json.dumps([
+        {'name_zh': '滷肉飯', 'qty': 1, 'options_zh': ['🌶️ 小辣', '半糖～少冰', '備註：€ 找零']},
+    ], ensure_ascii=False), datetime(2026, 10, 18, 5, 6, 7), 'Pending', '陳🙂', None, None, 0, None, 'dine_in', 'en')),
+    ('bad_json', ('3', 0, 1, 'not json', datetime(2026, 10, 18, 1, 2, 3), 'Pending', None, None, None, 0, None, 'dine_in', 'zh')),
+]
+
+REPORTS = [
+    ('report', ('2026-10-18', datetime(2026, 10, 18, 21, 30, 0), 57, 12345, 2, 360,
+                {'紅燒牛肉麵': {'qty': 40, 'amt': 7200}, '餛飩湯': {'qty': 12, 'amt': 720},
+                 '一個名字非常非常非常長的期間限定商品': {'qty': 3, 'amt': 1500}},
+                {'燙青菜': {'qty': 2, 'amt': 80}})),
+    ('report_empty', ('2026-10-19', datetime(2026, 10, 19, 9, 0, 0), 0, 0, 0, 0, {}, {})),
+]
+
+
+def render_all():
+    """所有 fixture 的輸出 -> {名稱: bytes}"""
+    catalog = CatalogSnapshot(PRODUCTS, 1)
+    out = {}
+    for name, row in ORDERS:
+        order = tickets.TicketOrder(1, row)
+        for role, payload in tickets.render_tickets(order, catalog).items():
+            out[f"{name}/{role}"] = payload
+    for name, args in REPORTS:
+        out[name] = tickets.render_daily_report(*args)
+    return out
+
+
+def first_diff(a, b):
+    for i, (x, y) in enumerate(zip(a, b)):
+        if x != y:
+            return i
+    return min(len(a), len(b))
+
+
+def bench(rounds):
+    catalog = CatalogSnapshot(PRODUCTS, 1)
+    orders = [tickets.TicketOrder(1, row) for _, row in ORDERS]
+    count = 0
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for order in orders:
+            count += len(tickets.render_tickets(order, catalog))
+    elapsed = time.perf_counter() - t0
+    print(f"📊 出單：{count / elapsed:,.0f} 張/秒 ({elapsed / count * 1e6:.1f} µs/張，{count} 張)")
+
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for _, args in REPORTS:
+            tickets.render_daily_report(*args)
+    elapsed = time.perf_counter() - t0
+    n = rounds * len(REPORTS)
+    print(f"📊 日結報表：{n / elapsed:,.0f} 張/秒 ({elapsed / n * 1e6:.1f} µs/張)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="出單 ESC/POS golden 檢查與速度測試")
+    parser.add_argument('--write', action='store_true', help="以目前的輸出重新產生 golden 檔")
+    parser.add_argument('--bench', type=int, default=0, metavar='ROUNDS', help="速度測試的重複次數")
+    args = parser.parse_args(argv)
+
+    out = render_all()
+    if args.write:
+        os.makedirs(os.path.dirname(GOLDEN_PATH), exist_ok=True)
+        with open(GOLDEN_PATH, 'w', encoding='utf-8') as f:
+            json.dump({k: base64.b64encode(v).decode('ascii') for k, v in sorted(out.items())}, f, indent=1)
+            f.write('\n')
+        print(f"📝 已寫入 {len(out)} 筆 golden 輸出: {GOLDEN_PATH}")
+        return 0
+
+    with open(GOLDEN_PATH, encoding='utf-8') as f:
+        golden = {k: base64.b64decode(v) for k, v in json.load(f).items()}
+    bad = 0
+    for name in sorted(set(golden) | set(out)):
+        want, got = golden.get(name), out.get(name)
+        if want == got:
+            continue
+        bad += 1
+        if want is None or got is None:
+            print(f"❌ {name}: {'多出' if want is None else '缺少'}這張單")
+        else:
+            i = first_diff(want, got)
+            print(f"❌ {name}: 第 {i} byte 起不同 (golden {len(want)} bytes / 目前 {len(got)} bytes)")
+            print(f"      golden: {want[max(0, i - 8):i + 16]!r}")
+            print(f"      目前  : {got[max(0, i - 8):i + 16]!r}")
+    print(f"{'✅' if not bad else '❌'} golden 比對：{len(golden) - bad}/{len(golden)} 相同")
+
+    if args.bench:
+        bench(args.bench)
+    return 1 if bad else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+網路印表機出單檢查：以模擬印表機 (printer_emulator.py) 驗證 network_printer 的送印流程
+    1. 下單時排入的工作全部送到對應的印表機，內容與 print_jobs 存的 payload 逐 byte 相同
+    2. 同一台印表機的多張單共用一條長連線
+    3. 缺紙時不送出，工作回報失敗並依退避時間重新排入
+    4. 印表機重開機 (長連線失效) 後自動重連；印表機關機時工作回報失敗
+    5. 送印速度：長連線 vs 每張單重新連線
+
+測試在暫時的 schema 內進行，不影響正式資料。
+用法 (需先設定 DATABASE_URL)：
+    python tools/check_network_printing.py --orders 50
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+
+import migrate
+from check_query_plans import seed_orders
+from bench_board_payload import with_search_path
+from printer_emulator import PrinterEmulator
+
+
+def check(ok, label):
+    print(f"   {'✅' if ok else '❌'} {label}")
+    return ok
+
+
+def job_rows(cur, status=None):
+    cur.execute("""
+        SELECT id, role, status, payload, last_error, next_attempt_at > CURRENT_TIMESTAMP
+        FROM print_jobs WHERE %s IS NULL OR status = %s ORDER BY id
+    """, (status, status))
+    return cur.fetchall()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="網路印表機出單檢查 (模擬印表機)")
+    parser.add_argument('--orders', type=int, default=50, help="測試訂單數 (預設 50)")
+    args = parser.parse_args(argv)
+
+    db_uri = os.environ.get("DATABASE_URL")
+    if not db_uri:
+        sys.exit("錯誤：找不到環境變數 DATABASE_URL")
+
+    schema = f"network_print_check_{os.getpid()}"
+    admin = psycopg2.connect(db_uri)
+    admin.autocommit = True
+    admin.cursor().execute(f"CREATE SCHEMA {schema}")
+    os.environ["DATABASE_URL"] = with_search_path(db_uri, schema)
+
+    import print_spooler
+    import network_printer
+    from network_printer import get_printer, process_once
+
+    receipt = PrinterEmulator().start()
+    noodle = PrinterEmulator().start()
+    mapping = {'receipt': ('127.0.0.1', receipt.port), 'noodle': ('127.0.0.1', noodle.port)}
+    all_ok = True
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    try:
+        migrate.apply_migrations(conn, verbose=False)
+        conn.autocommit = False
+        cur = conn.cursor()
+        cur.execute("INSERT INTO products (name, price, print_category) VALUES ('牛肉麵', 160, 'Noodle')")
+        seed_orders(cur, 1, args.orders)
+        conn.commit()  # 商品目錄由連線池讀取，需先 commit
+        cur.execute("SELECT id FROM orders ORDER BY id")
+        oids = [r[0] for r in cur.fetchall()]
+        for oid in oids:
+            print_spooler.enqueue_order(cur, oid)
+        conn.commit()
+
+        print(f"🧪 1. 送印 {args.orders} 張訂單 (結帳 + 麵區)")
+        while process_once(conn, 'check', mapping):
+            pass
+        done = job_rows(cur, 'done')
+        expect_receipt = [bytes(r[3]) for r in done if r[1] == 'receipt']
+        expect_noodle = [bytes(r[3]) for r in done if r[1] == 'noodle']
+        time.sleep(0.2)  # 等模擬器把最後一張單讀完
+        all_ok &= check(len(done) == 2 * len(oids) and not job_rows(cur, 'queued'), f"全部完成 ({len(done)} 張)")
+        all_ok &= check(receipt.jobs == expect_receipt, f"結帳機收到 {len(receipt.jobs)} 張，內容與 payload 相同")
+        all_ok &= check(noodle.jobs == expect_noodle, f"麵區機收到 {len(noodle.jobs)} 張，內容與 payload 相同")
+
+        print("🧪 2. 長連線重複使用")
+        all_ok &= check(receipt.stats['connections'] == 1 and noodle.stats['connections'] == 1,
+                        f"連線次數 結帳 {receipt.stats['connections']} / 麵區 {noodle.stats['connections']}")
+
+        print("🧪 3. 麵區缺紙")
+        noodle.paper_out = True
+        before = len(noodle.jobs)
+        print_spooler.enqueue_order(cur, oids[0])
+        conn.commit()
+        process_once(conn, 'check', mapping)
+        queued = job_rows(cur, 'queued')
+        all_ok &= check(len(noodle.jobs) == before, "缺紙時沒有送出")
+        all_ok &= check(len(queued) == 1 and queued[0][1] == 'noodle' and '缺紙' in queued[0][4] and queued[0][5],
+                        f"工作重新排入並延後重試: {queued[0][4] if queued else '-'}")
+        noodle.paper_out = False
+        cur.execute("UPDATE print_jobs SET next_attempt_at = CURRENT_TIMESTAMP WHERE status = 'queued'")
+        conn.commit()
+        process_once(conn, 'check', mapping)
+        time.sleep(0.2)
+        all_ok &= check(len(noodle.jobs) == before + 1 and not job_rows(cur, 'queued'), "補紙後重試成功")
+
+        print("🧪 4. 印表機重開機 / 關機")
+        noodle.drop_connections()
+        time.sleep(0.1)
+        print_spooler.enqueue_order(cur, oids[1])
+        conn.commit()
+        process_once(conn, 'check', mapping)
+        time.sleep(0.2)
+        all_ok &= check(len(noodle.jobs) == before + 2 and noodle.stats['connections'] == 2, "長連線失效後自動重連並印出")
+        receipt.stop()
+        print_spooler.enqueue_order(cur, oids[2])
+        conn.commit()
+        process_once(conn, 'check', mapping)
+        queued = job_rows(cur, 'queued')
+        all_ok &= check([r[1] for r in queued] == ['receipt'], f"結帳機關機：工作排回佇列 ({queued[0][4] if queued else '-'})")
+
+        print("🧪 5. 送印速度")
+        payload = expect_noodle[0]
+        printer = get_printer(*mapping['noodle'])
+        rounds = 200
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            printer.send(payload)
+        reuse = (time.perf_counter() - t0) / rounds * 1000
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            printer.close()
+            printer.send(payload)
+        reconnect = (time.perf_counter() - t0) / rounds * 1000
+        print(f"   📊 每張單：長連線 {reuse:.2f} ms，每次重新連線 {reconnect:.2f} ms (本機迴路，區網延遲會放大差距)")
+        print(f"   📊 印表機統計: {network_printer.get_printer_stats()}")
+    finally:
+        conn.close()
+        receipt.stop()
+        noodle.stop()
+        from database import _pool
+        if _pool is not None:
+            _pool.closeall()
+        admin.cursor().execute(f"DROP SCHEMA {schema} CASCADE")
+        admin.close()
+
+    print("✅ 全部通過" if all_ok else "❌ 有檢查未通過")
+    return 0 if all_ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
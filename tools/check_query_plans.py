@@ -0,0 +1,286 @@
+"""
+查詢計畫回歸檢查：確認 orders / order_items 的熱門查詢都有走索引，不會退化成全表掃描 (Seq Scan)。
+
+做法：
+    1. 在暫時的 schema 內跑完所有 migration (不影響正式資料)
+    2. 灌入約一年份的假訂單並 ANALYZE
+    3. 對每一條熱門查詢做 EXPLAIN，只要計畫中出現這兩張表 (含 orders 各月份分割) 的 Seq Scan 就判定失敗
+       (沒有資料的分割除外)
+
+用法 (需先設定 DATABASE_URL；失敗時 exit code 為 1，可放進部署前檢查)：
+    python tools/check_query_plans.py --days 365 --per-day 300
+    python tools/check_query_plans.py --verbose     # 印出完整執行計畫
+"""
+import os
+import sys
+import json
+import argparse
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+import migrate
+import order_partitions
+from business_day import tw_today, day_range
+
+
+# ==========================================
+# 📋 熱門查詢清單 (SQL 需與程式碼中的寫法保持一致)
+# ==========================================
+# known: 已知無法走索引的寫法，只顯示警告不判定失敗 (請填寫原因)
+HOT_QUERIES = [
+    {
+        'name': '廚房看板 check_new_orders',
+        'sql': """
+            SELECT id, table_number, items, total_price, status, created_at, lang, daily_seq, content_json,
+                   customer_name, customer_phone, customer_address, scheduled_for, delivery_fee, order_type,
+                   invoice_number, invoice_status, tax_id, carrier_type, carrier_num, row_version
+            FROM orders
+            WHERE created_at >= %(start)s AND created_at < %(end)s AND status = 'Pending'
+            UNION ALL
+            (SELECT id, table_number, items, total_price, status, created_at, lang, daily_seq, content_json,
+                    customer_name, customer_phone, customer_address, scheduled_for, delivery_fee, order_type,
+                    invoice_number, invoice_status, tax_id, carrier_type, carrier_num, row_version
+             FROM orders
+             WHERE created_at >= %(start)s AND created_at < %(end)s AND status <> 'Pending'
+             ORDER BY COALESCE(updated_at, created_at) DESC, id DESC
+             LIMIT 12)
+        """,
+    },
+    {
+        'name': '廚房看板 增量輪詢',
+        'sql': """
+            SELECT id, table_number, items, total_price, status, created_at, lang, daily_seq, content_json,
+                   customer_name, customer_phone, customer_address, scheduled_for, delivery_fee, order_type,
+                   invoice_number, invoice_status, tax_id, carrier_type, carrier_num, row_version
+            FROM orders
+            WHERE created_at >= %(start)s AND created_at < %(end)s AND row_version >= %(version)s
+        """,
+    },
+    {
+        'name': '看板較早的訂單 history',
+        'sql': """
+            SELECT id, table_number, items, total_price, status, created_at, lang, daily_seq, content_json,
+                   customer_name, customer_phone, customer_address, scheduled_for, delivery_fee, order_type,
+                   invoice_number, invoice_status, tax_id, carrier_type, carrier_num, row_version
+            FROM orders
+            WHERE created_at >= %(start)s AND created_at < %(end)s AND status <> 'Pending'
+              AND (created_at, id) < (%(end)s, 0)
+            ORDER BY created_at DESC, id DESC LIMIT 20
+        """,
+    },
+    {
+        'name': '銷售排行 sales_ranking',
+        'sql': """
+            SELECT oi.product_name, SUM(oi.qty) AS total_qty
+            FROM order_items oi
+            JOIN orders o ON o.id = oi.order_id
+            WHERE o.created_at >= %(start)s AND o.created_at < %(end)s
+            AND o.status IN ('Pending', 'Completed')
+            GROUP BY oi.product_name
+            ORDER BY total_qty DESC
+        """,
+    },
+    {
+        'name': '日結報表 daily_report',
+        'sql': "SELECT COUNT(*), COALESCE(SUM(total_price), 0) FROM orders WHERE created_at >= %(start)s AND created_at < %(end)s AND status = 'Cancelled'",
+    },
+    {
+        'name': '日結報表 品項彙總',
+        'sql': """
+            SELECT oi.product_name, SUM(oi.qty), SUM(oi.qty * oi.unit_price)
+            FROM order_items oi
+            JOIN orders o ON o.id = oi.order_id
+            WHERE o.created_at >= %(start)s AND o.created_at < %(end)s AND o.status = 'Cancelled'
+            GROUP BY oi.product_name
+            ORDER BY SUM(oi.qty) DESC
+        """,
+    },
+    {
+        'name': '每日寄信 send_daily_report',
+        'sql': "SELECT COUNT(*), SUM(total_price) FROM orders WHERE created_at >= %(start)s AND created_at < %(end)s AND status != 'Cancelled'",
+    },
+    {
+        'name': '發票查單 get_order_by_invoice',
+        'sql': """
+            SELECT id, customer_name, total_price, invoice_number AS invoice_no, invoice_status
+            FROM orders WHERE invoice_number = %(invoice)s
+        """,
+    },
+    {
+        'name': '發票作廢 update_invoice_status',
+        'sql': "UPDATE orders SET invoice_status = 'Void' WHERE invoice_number = %(invoice)s",
+    },
+    {
+        'name': '訂單管理 依發票搜尋',
+        'sql': "SELECT * FROM orders WHERE invoice_number = %(invoice)s ORDER BY id DESC",
+    },
+    {
+        'name': '客戶查詢 依電話',
+        'sql': "SELECT id, created_at, total_price FROM orders WHERE customer_phone = %(phone)s ORDER BY id DESC",
+    },
+    {
+        'name': '客戶查詢 依電話+姓名',
+        'sql': "SELECT id, created_at, total_price FROM orders WHERE customer_phone = %(phone)s AND customer_name = %(name)s",
+    },
+    {
+        'name': '訂單管理 依日期 admin_orders_page',
+        'sql': "SELECT * FROM orders WHERE created_at >= %(start)s AND created_at < %(end)s ORDER BY id DESC",
+    },
+    {
+        'name': '發票日查 get_orders_by_date',
+        'sql': """
+            SELECT id, customer_name, total_price, invoice_number AS invoice_no, invoice_status
+            FROM orders WHERE created_at >= %(start)s AND created_at < %(end)s
+        """,
+    },
+]
+
+
+# ==========================================
+# 🧪 測試資料
+# ==========================================
+def seed_orders(cur, days, per_day):
+    """灌入 days 天、每天 per_day 筆的假訂單 (約 5% 取消、70% 有開發票)"""
+    # 先建好涵蓋所有日期的月份分割，避免假資料全部落在 orders_default
+    oldest = tw_today() - timedelta(days=days + 1)
+    order_partitions.ensure_partitions(cur, start=(oldest.year, oldest.month))
+    cur.execute("""
+        INSERT INTO orders (table_number, items, total_price, status, created_at, daily_seq, content_json,
+                            order_type, customer_name, customer_phone, invoice_number, invoice_status)
+        SELECT
+            (g %% 20 + 1)::text,
+            '牛肉麵 x1',
+            100 + (g %% 7) * 30,
+            CASE WHEN g %% 20 = 0 THEN 'Cancelled'
+                 WHEN g %% %(per_day)s > %(per_day)s - 5 THEN 'Pending'
+                 ELSE 'Completed' END,
+            date_trunc('day', now() AT TIME ZONE 'UTC') - ((g / %(per_day)s) || ' days')::interval
+                + ((g %% %(per_day)s) * (43200 / %(per_day)s) || ' seconds')::interval,
+            g %% %(per_day)s + 1,
+            '[{"name_zh": "牛肉麵", "qty": 1, "unit_price": 160, "options_zh": ["大碗"]}]',
+            CASE WHEN g %% 3 = 0 THEN 'delivery' ELSE 'dine_in' END,
+            '客人' || (g %% 500),
+            '09' || lpad((g %% 5000)::text, 8, '0'),
+            CASE WHEN g %% 10 < 7 THEN 'AB' || lpad(g::text, 8, '0') END,
+            CASE WHEN g %% 10 < 7 THEN 'Issued' ELSE 'Not Issued' END
+        FROM generate_series(0, %(total)s - 1) AS g
+    """, {'per_day': per_day, 'total': days * per_day})
+    # 每張訂單 1~3 筆明細
+    cur.execute("""
+        INSERT INTO order_items (order_id, line_no, product_name, qty, unit_price, print_category)
+        SELECT o.id, n, (ARRAY['牛肉麵', '餛飩湯', '燙青菜'])[n], 1 + o.id % 2, 160, 'Noodle'
+        FROM orders o, generate_series(1, 3) AS n
+        WHERE n <= 1 + o.id % 3
+    """)
+    cur.execute("ANALYZE orders")
+    cur.execute("ANALYZE order_items")
+
+
+# ==========================================
+# 🔍 執行計畫分析
+# ==========================================
+def find_seq_scans(plan, found=None, ignore=()):
+    """
+    遞迴走訪 EXPLAIN (FORMAT JSON) 的節點，收集 orders (含各月份分割) / order_items 的 Seq Scan。
+    ignore: 不列入的表 (例如沒有資料的未來月份分割，掃描它不花任何成本)
+    """
+    if found is None:
+        found = []
+    relation = plan.get('Relation Name') or ''
+    if (plan.get('Node Type') == 'Seq Scan' and relation not in ignore
+            and (relation.startswith('orders') or relation == 'order_items')):
+        found.append(relation)
+    for child in plan.get('Plans', []):
+        find_seq_scans(child, found, ignore)
+    return found
+
+
+def empty_partitions(cur):
+    """沒有任何訂單的分割 (未來月份、orders_default)"""
+    empty = set()
+    for name, _ in order_partitions.list_partitions(cur):
+        cur.execute(f"SELECT NOT EXISTS (SELECT 1 FROM {name})")
+        if cur.fetchone()[0]:
+            empty.add(name)
+    return empty
+
+
+def explain(cur, sql, params):
+    cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+    result = cur.fetchone()[0]
+    if isinstance(result, str):
+        result = json.loads(result)
+    return result[0]['Plan']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="orders 熱門查詢的執行計畫回歸檢查")
+    parser.add_argument('--days', type=int, default=365,
+                        help="假資料天數 (預設 365；資料量太小時 PostgreSQL 本來就會選擇全表掃描)")
+    parser.add_argument('--per-day', type=int, default=300, help="每天訂單數 (預設 300)")
+    parser.add_argument('--verbose', action='store_true', help="印出完整執行計畫")
+    parser.add_argument('--keep', action='store_true', help="保留測試用 schema 方便手動檢查")
+    args = parser.parse_args(argv)
+
+    db_uri = os.environ.get("DATABASE_URL")
+    if not db_uri:
+        sys.exit("錯誤：找不到環境變數 DATABASE_URL")
+
+    schema = f"plan_check_{os.getpid()}"
+    conn = psycopg2.connect(db_uri)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f"CREATE SCHEMA {schema}")
+    cur.execute(f"SET search_path TO {schema}")
+
+    failed = []
+    try:
+        print(f"🧪 建立測試 schema {schema} 並套用 migration ...")
+        migrate.apply_migrations(conn, verbose=False)
+        cur = conn.cursor()
+        print(f"🧪 灌入假資料 {args.days} 天 x {args.per_day} 筆 ...")
+        seed_orders(cur, args.days, args.per_day)
+        empty = empty_partitions(cur)
+
+        # 取中間某一天當作查詢日 (台灣營業日換算成 UTC 半開區間)
+        utc_start, utc_end = day_range(tw_today() - timedelta(days=args.days // 2))
+        params = {
+            'start': utc_start,
+            'end': utc_end,
+            'version': '0',
+            'invoice': 'AB00001234',
+            'phone': '0900001234',
+            'name': '客人234',
+        }
+
+        print("-" * 72)
+        for q in HOT_QUERIES:
+            plan = explain(cur, q['sql'], params)
+            seq_scans = find_seq_scans(plan, ignore=empty)
+            if not seq_scans:
+                print(f"✅ {q['name']:<32} {plan['Node Type']} (cost={plan['Total Cost']})")
+            elif q.get('known'):
+                print(f"⚠️ {q['name']:<32} Seq Scan (已知問題：{q['known']})")
+            else:
+                print(f"❌ {q['name']:<32} Seq Scan on {', '.join(seq_scans)}")
+                failed.append(q['name'])
+            if args.verbose:
+                print(json.dumps(plan, ensure_ascii=False, indent=2))
+        print("-" * 72)
+    finally:
+        if not args.keep:
+            conn.rollback()
+            conn.autocommit = True
+            conn.cursor().execute(f"DROP SCHEMA {schema} CASCADE")
+        conn.close()
+
+    if failed:
+        print(f"❌ {len(failed)} 條查詢退化為全表掃描: {', '.join(failed)}")
+        sys.exit(1)
+    print("✅ 所有熱門查詢皆使用索引")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""
+綠界電子發票 (B2CInvoice) 本機替身：壓力測試與功能測試時取代綠界測試環境
+
+實作 ecpay_invoice.py 用到的 API：Issue 開立 / Invalid 作廢 / GetIssue 查詢 (RelateNumber 或發票號碼) / InvoicePrint 列印。
+以設定的 HashKey / HashIV 解開 AES-CBC 的 Data，回應同樣加密的 Data；發票號碼依序配發 (AA00000001 起)。
+同一個 RelateNumber 重複開立會被退件 (與綠界相同)，可用來確認重送不會重複開票；
+作廢與以發票號碼查詢時 InvoiceDate 必須是發票的開立日期 (與綠界相同)，否則回應查無發票。
+
+可調整延遲與錯誤：
+    --latency-ms 200 --jitter-ms 100    每個請求延遲 200±100 毫秒
+    --error-rate 0.1                    10% 回應 HTTP 503 (算在斷路器的失敗次數內)
+    --reject-rate 0.05                  5% 開立被退件 (RtnCode != 1)
+
+用法：
+    python tools/fake_ecpay_server.py --port 9300 --latency-ms 150
+    export ECPAY_INVOICE_URL=http://127.0.0.1:9300/B2CInvoice/Issue
+    export ECPAY_INVOICE_INVALID_URL=http://127.0.0.1:9300/B2CInvoice/Invalid
+    export ECPAY_INVOICE_QUERY_URL=http://127.0.0.1:9300/B2CInvoice/GetIssue
+    export ECPAY_INVOICE_PRINT_URL=http://127.0.0.1:9300/B2CInvoice/InvoicePrint
+
+也可在其他工具內使用：
+    srv = FakeEcpayServer(latency_ms=100).start()    # port=0 會自動選一個空的埠
+    os.environ.update(srv.env())                    # 需在 import ecpay_invoice 之前
+    ...
+    srv.invoices                                    # {發票號碼: {...}}
+    srv.stop()
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import base64
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad, unpad
+
+# 與 ecpay_invoice.py 相同的環境變數與預設值 (不 import ecpay_invoice，以免呼叫端還沒設定好網址就先載入)
+MERCHANT_ID = os.environ.get("ECPAY_INVOICE_MERCHANT_ID", "2000132")
+HASH_KEY = os.environ.get("ECPAY_INVOICE_HASH_KEY", "ejCk326UnaZWKisg")
+HASH_IV = os.environ.get("ECPAY_INVOICE_HASH_IV", "q9jcZX8Ib9LM8wYk")
+
+ENV_URLS = {
+    'ECPAY_INVOICE_URL': 'Issue',
+    'ECPAY_INVOICE_INVALID_URL': 'Invalid',
+    'ECPAY_INVOICE_QUERY_URL': 'GetIssue',
+    'ECPAY_INVOICE_PRINT_URL': 'InvoicePrint',
+}
+
+
+def aes_encrypt(data_dict, key, iv):
+    """JSON -> URL encode -> AES-128-CBC (PKCS7) -> base64"""
+    url_encoded = urllib.parse.quote(json.dumps(data_dict, ensure_ascii=False, separators=(',', ':')), safe='')
+    cipher = AES.new(key.encode('utf-8'), AES.MODE_CBC, iv.encode('utf-8'))
+    return base64.b64encode(cipher.encrypt(pad(url_encoded.encode('utf-8'), AES.block_size))).decode('ascii')
+
+
+def aes_decrypt(encrypted_base64, key, iv):
+    """aes_encrypt 的反向；解不開時回傳 None"""
+    try:
+        cipher = AES.new(key.encode('utf-8'), AES.MODE_CBC, iv.encode('utf-8'))
+        raw = unpad(cipher.decrypt(base64.b64decode(encrypted_base64)), AES.block_size)
+        return json.loads(urllib.parse.unquote(raw.decode('utf-8')))
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return None
+
+
+class FakeEcpayServer:
+    """單一埠的綠界替身；latency_ms / error_rate 等可在執行中調整"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=0, jitter_ms=0, error_rate=0.0, reject_rate=0.0,
+                 merchant_id=MERCHANT_ID, hash_key=HASH_KEY, hash_iv=HASH_IV, track='AA', start_number=1):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.reject_rate = reject_rate
+        self.merchant_id = merchant_id
+        self.hash_key = hash_key
+        self.hash_iv = hash_iv
+        self.track = track
+        self.next_number = start_number
+        self.invoices = {}          # 發票號碼 -> {relate_number, amount, items, status}
+        self.by_relate = {}         # RelateNumber -> 發票號碼
+        self.stats = {'requests': 0, 'issued': 0, 'voided': 0, 'queries': 0, 'prints': 0,
+                      'errors': 0, 'rejected': 0, 'duplicates': 0}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start(self):
+        server_ref = self
+
+        class Handler(_Handler):
+            server_obj = server_ref
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/B2CInvoice"
+
+    def env(self):
+        """讓 ecpay_invoice.py 改連到這台替身的環境變數"""
+        return {key: f"{self.base_url}/{path}" for key, path in ENV_URLS.items()}
+
+    # --- 各 API ---
+    def issue(self, data):
+        relate = data.get('RelateNumber') or ''
+        items = data.get('Items') or []
+        amount = data.get('SalesAmount')
+        if not relate or not items:
+            return {'RtnCode': 1100001, 'RtnMsg': '參數錯誤 (RelateNumber / Items)'}
+        if sum(int(i.get('ItemAmount', 0)) for i in items) != amount:
+            return {'RtnCode': 1100002, 'RtnMsg': '商品金額合計與發票金額不符'}
+        if random.random() < self.reject_rate:
+            with self._lock:
+                self.stats['rejected'] += 1
+            return {'RtnCode': 1100003, 'RtnMsg': '模擬退件'}
+        with self._lock:
+            if relate in self.by_relate:
+                self.stats['duplicates'] += 1
+                return {'RtnCode': 4000003, 'RtnMsg': '自訂編號重複'}
+            invoice_no = f"{self.track}{self.next_number:08d}"
+            self.next_number += 1
+            self.invoices[invoice_no] = {'relate_number': relate, 'amount': amount, 'items': items,
+                                         'random_number': f"{random.randint(0, 9999):04d}", 'status': 'Issued',
+                                         'date': time.strftime('%Y-%m-%d %H:%M:%S')}
+            self.by_relate[relate] = invoice_no
+            self.stats['issued'] += 1
+            inv = self.invoices[invoice_no]
+        return {'RtnCode': 1, 'RtnMsg': '開立發票成功', 'InvoiceNo': invoice_no,
+                'InvoiceDate': inv['date'], 'RandomNumber': inv['random_number']}
+
+    @staticmethod
+    def _date_matches(inv, data):
+        """InvoiceDate ('YYYY-MM-DD'，可帶時間) 與開立日期相同"""
+        return str(data.get('InvoiceDate') or '')[:10] == inv['date'][:10]
+
+    def invalid(self, data):
+        invoice_no = data.get('InvoiceNo')
+        with self._lock:
+            inv = self.invoices.get(invoice_no)
+            if inv is None or not self._date_matches(inv, data):
+                return {'RtnCode': 1600003, 'RtnMsg': '查無發票'}
+            if inv['status'] == 'Void':
+                return {'RtnCode': 1600004, 'RtnMsg': '發票已作廢'}
+            inv['status'] = 'Void'
+            self.stats['voided'] += 1
+        return {'RtnCode': 1, 'RtnMsg': '作廢發票成功', 'InvoiceNo': invoice_no}
+
+    def get_issue(self, data):
+        with self._lock:
+            self.stats['queries'] += 1
+            invoice_no = data.get('InvoiceNo') or self.by_relate.get(data.get('RelateNumber'))
+            inv = self.invoices.get(invoice_no)
+        if inv is None or (data.get('InvoiceNo') and not self._date_matches(inv, data)):
+            return {'RtnCode': 1200003, 'RtnMsg': '查無資料'}
+        return {'RtnCode': 1, 'RtnMsg': '查詢成功', 'IIS_Number': invoice_no, 'IIS_Create_Date': inv['date'],
+                'IIS_Random_Number': inv['random_number'], 'IIS_Sales_Amount': inv['amount'],
+                'IIS_Invalid_Status': '1' if inv['status'] == 'Void' else '0'}
+
+    def invoice_print(self, data):
+        invoice_no = data.get('InvoiceNo')
+        with self._lock:
+            inv = self.invoices.get(invoice_no)
+            if inv is not None:
+                self.stats['prints'] += 1
+        if inv is None:
+            return {'RtnCode': 1600003, 'RtnMsg': '查無發票'}
+        html = f"<html><body><h3>電子發票證明聯</h3><p>{invoice_no}</p><p>隨機碼 {inv['random_number']}</p>" \
+               f"<p>總計 {inv['amount']}</p></body></html>"
+        return {'RtnCode': 1, 'RtnMsg': '成功', 'InvoiceHtml': html}
+
+
+ROUTES = {
+    'Issue': FakeEcpayServer.issue,
+    'Invalid': FakeEcpayServer.invalid,
+    'GetIssue': FakeEcpayServer.get_issue,
+    'InvoicePrint': FakeEcpayServer.invoice_print,
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'     # 支援 keep-alive，與綠界相同
+    disable_nagle_algorithm = True
+    server_obj = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body):
+        out = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def do_POST(self):
+        srv = self.server_obj
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        with srv._lock:
+            srv.stats['requests'] += 1
+
+        if srv.latency_ms or srv.jitter_ms:
+            delay = srv.latency_ms + random.uniform(-srv.jitter_ms, srv.jitter_ms)
+            time.sleep(max(delay, 0) / 1000)
+        if random.random() < srv.error_rate:
+            with srv._lock:
+                srv.stats['errors'] += 1
+            return self._reply(503, {'TransCode': 0, 'TransMsg': '模擬服務暫停'})
+
+        route = ROUTES.get(self.path.rstrip('/').rsplit('/', 1)[-1])
+        if route is None:
+            return self._reply(404, {'TransCode': 0, 'TransMsg': 'Not Found'})
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return self._reply(200, {'TransCode': 0, 'TransMsg': 'JSON 格式錯誤'})
+        if payload.get('MerchantID') != srv.merchant_id:
+            return self._reply(200, {'TransCode': 0, 'TransMsg': '特店編號錯誤'})
+        data = aes_decrypt(payload.get('Data', ''), srv.hash_key, srv.hash_iv)
+        if not data:
+            return self._reply(200, {'TransCode': 0, 'TransMsg': 'Data 解密失敗 (HashKey / HashIV 不符)'})
+
+        result = route(srv, data)
+        return self._reply(200, {
+            'MerchantID': srv.merchant_id,
+            'RpHeader': {'Timestamp': int(time.time())},
+            'TransCode': 1,
+            'TransMsg': 'Success',
+            'Data': aes_encrypt(result, srv.hash_key, srv.hash_iv),
+        })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="綠界電子發票本機替身")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9300)
+    parser.add_argument('--latency-ms', type=float, default=0, help="每個請求的延遲 (毫秒)")
+    parser.add_argument('--jitter-ms', type=float, default=0, help="延遲的隨機增減範圍 (毫秒)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="回應 HTTP 503 的比例 (0~1)")
+    parser.add_argument('--reject-rate', type=float, default=0.0, help="開立被退件的比例 (0~1)")
+    args = parser.parse_args(argv)
+
+    srv = FakeEcpayServer(args.host, args.port, args.latency_ms, args.jitter_ms,
+                          args.error_rate, args.reject_rate).start()
+    print(f"🧾 綠界替身監聽 {srv.base_url} (Ctrl+C 結束)")
+    for key, url in srv.env().items():
+        print(f"   export {key}={url}")
+    try:
+        while True:
+            time.sleep(30)
+            print(f"📊 {srv.stats}")
+    except KeyboardInterrupt:
+        srv.stop()
+        print(f"\n共開立 {srv.stats['issued']} 張、作廢 {srv.stats['voided']} 張")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""
+廚房看板負載測試：模擬 N 台看板連到正在執行的伺服器，比較
+    poll  每 3 秒輪詢 check_new_orders (推播上線前的做法)
+    push  連上 /kitchen/stream，收到事件才查詢；另保留每 60 秒一次的保險輪詢
+並以固定間隔送出新訂單，統計：
+    - 資料庫每分鐘的查詢數 (有 pg_stat_statements 時為語句數，否則為 pg_stat_database 的交易數)
+    - 看板每分鐘的 HTTP 請求數
+    - 新訂單從送出到出現在看板上的平均延遲
+
+用法 (先以 gthread 啟動伺服器，並設定與伺服器相同的 DATABASE_URL；測試期間請勿有其他流量)：
+    gunicorn app:app --worker-class gthread --workers 2 --threads 16 -b 127.0.0.1:10000
+    python tools/load_kitchen_boards.py --mode poll --boards 10 --seconds 60
+    python tools/load_kitchen_boards.py --mode push --boards 10 --seconds 60
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+
+import psycopg2
+import requests
+
+POLL_MS = 3000
+SAFETY_POLL_MS = 60000
+
+_lock = threading.Lock()
+_submitted = {}   # 訂單 id -> 送出時間
+_seen = {}        # 訂單 id -> 第一次出現在任一看板的時間 (每台看板各自記錄)
+_http = {'requests': 0, 'errors': 0}
+
+
+def count_db_activity(db_uri):
+    """目前資料庫累計的查詢數 (語句或交易)，回傳 (數值, 單位)"""
+    conn = psycopg2.connect(db_uri)
+    try:
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT COALESCE(SUM(calls), 0) FROM pg_stat_statements WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())")
+            return int(cur.fetchone()[0]), "語句"
+        except psycopg2.Error:
+            conn.rollback()
+        cur.execute("SELECT pg_stat_clear_snapshot()")
+        cur.execute("SELECT xact_commit + xact_rollback FROM pg_stat_database WHERE datname = current_database()")
+        return int(cur.fetchone()[0]), "交易"
+    finally:
+        conn.close()
+
+
+def login(base_url, username, password):
+    s = requests.Session()
+    r = s.post(f"{base_url}/kitchen/login", data={'username': username, 'password': password}, allow_redirects=False)
+    if r.status_code not in (302, 303):
+        sys.exit(f"錯誤：看板登入失敗 (HTTP {r.status_code})")
+    return s
+
+
+class Board:
+    """一台看板：與 kitchen.html 相同的游標增量輪詢"""
+
+    def __init__(self, idx, session, base_url):
+        self.idx = idx
+        self.s = session
+        self.base_url = base_url
+        self.cursor = ''
+        self.last_seq = 0
+        self.seen = set()
+        self.refresh_lock = threading.Lock()
+
+    def refresh(self):
+        with self.refresh_lock:
+            try:
+                r = self.s.get(f"{self.base_url}/kitchen/check_new_orders",
+                               params={'last_seq': self.last_seq, 'cursor': self.cursor}, timeout=10)
+                data = r.json()
+            except Exception:
+                with _lock:
+                    _http['errors'] += 1
+                return
+            now = time.time()
+            with _lock:
+                _http['requests'] += 1
+                for c in data.get('cards', []):
+                    if c['id'] not in self.seen:
+                        self.seen.add(c['id'])
+                        _seen.setdefault((self.idx, c['id']), now)
+            self.cursor = data.get('cursor') or self.cursor
+            self.last_seq = max(self.last_seq, data.get('max_seq') or 0)
+
+    def run_poll(self, stop):
+        while not stop.is_set():
+            self.refresh()
+            stop.wait(POLL_MS / 1000)
+
+    def run_push(self, stop):
+        def safety_poll():
+            while not stop.wait(SAFETY_POLL_MS / 1000):
+                self.refresh()
+        threading.Thread(target=safety_poll, daemon=True).start()
+
+        while not stop.is_set():
+            try:
+                with self.s.get(f"{self.base_url}/kitchen/stream", stream=True, timeout=(5, 30)) as r:
+                    if r.status_code != 200:
+                        print(f"⚠️ 看板 {self.idx} 推播被拒絕 (HTTP {r.status_code})，改用輪詢")
+                        return self.run_poll(stop)
+                    event = None
+                    for line in r.iter_lines(decode_unicode=True):
+                        if stop.is_set():
+                            return
+                        if line.startswith('event:'):
+                            event = line[6:].strip()
+                        elif line == '' and event:
+                            # hello (連上 / 重連) 與 orders 事件都只是提醒，實際資料由增量 API 取得
+                            self.refresh()
+                            event = None
+            except Exception:
+                with _lock:
+                    _http['errors'] += 1
+                stop.wait(1)
+
+
+def submit_orders(base_url, every, stop):
+    s = requests.Session()
+    cart = [{'name_zh': '壓測品項', 'unit_price': 100, 'qty': 1, 'options_zh': []}]
+    n = 0
+    while not stop.wait(every):
+        n += 1
+        t0 = time.time()
+        r = s.post(f"{base_url}/menu", data={'table_number': str(n % 20 + 1), 'cart_data': json.dumps(cart, ensure_ascii=False)},
+                   allow_redirects=False)
+        loc = r.headers.get('Location', '')
+        oid = parse_qs(urlparse(loc).query).get('order_id', [None])[0]
+        if oid:
+            with _lock:
+                _submitted[int(oid)] = t0
+        else:
+            print(f"⚠️ 下單失敗 (HTTP {r.status_code})，請確認店家營業中")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="廚房看板負載測試 (輪詢 vs 推播)")
+    parser.add_argument('--mode', choices=['poll', 'push'], required=True)
+    parser.add_argument('--base-url', default='http://127.0.0.1:10000')
+    parser.add_argument('--boards', type=int, default=10, help="看板數 (預設 10)")
+    parser.add_argument('--seconds', type=int, default=60, help="測試秒數 (預設 60)")
+    parser.add_argument('--order-every', type=float, default=10, help="每幾秒送出一張新訂單 (預設 10)")
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='password123')
+    args = parser.parse_args(argv)
+
+    db_uri = os.environ.get("DATABASE_URL")
+    if not db_uri:
+        sys.exit("錯誤：找不到環境變數 DATABASE_URL (需與伺服器相同)")
+
+    boards = [Board(i, login(args.base_url, args.username, args.password), args.base_url) for i in range(args.boards)]
+    stop = threading.Event()
+
+    db_before, unit = count_db_activity(db_uri)
+    t0 = time.time()
+    threads = [threading.Thread(target=getattr(b, f"run_{args.mode}"), args=(stop,), daemon=True) for b in boards]
+    threads.append(threading.Thread(target=submit_orders, args=(args.base_url, args.order_every, stop), daemon=True))
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    elapsed_min = (time.time() - t0) / 60
+    db_after, _ = count_db_activity(db_uri)
+    time.sleep(0.5)
+
+    with _lock:
+        latencies = [(_seen[(b.idx, oid)] - sent) * 1000
+                     for oid, sent in _submitted.items() for b in boards if (b.idx, oid) in _seen]
+        missed = sum(1 for oid in _submitted for b in boards if (b.idx, oid) not in _seen)
+        http = dict(_http)
+
+    print(f"📊 模式 {args.mode}：{args.boards} 台看板，{args.seconds} 秒，送出 {len(_submitted)} 張訂單")
+    print(f"   資料庫{unit}數 / 分鐘 : {(db_after - db_before) / elapsed_min:10.1f}")
+    print(f"   看板 HTTP 請求 / 分鐘 : {http['requests'] / elapsed_min:10.1f}  (錯誤 {http['errors']})")
+    if latencies:
+        latencies.sort()
+        print(f"   新訂單上看板延遲     : 平均 {sum(latencies) / len(latencies):8.0f}ms  最長 {latencies[-1]:8.0f}ms")
+    if missed:
+        print(f"   ⚠️ 有 {missed} 筆 (看板, 訂單) 在測試結束前尚未出現")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""
+網路印表機模擬器 (RAW TCP 9100)：收下送來的 ESC/POS 並存檔，回應 DLE EOT 狀態查詢
+
+一張單以切紙指令 (GS V) 為結尾；每張單存成 <out>/<port>_<序號>.bin，可用 --preview 印出文字內容。
+用法：
+    python tools/printer_emulator.py --port 9100 --out /tmp/prints
+    python tools/printer_emulator.py --port 9101 --paper-out       # 模擬缺紙
+後台設定印表機位址為 127.0.0.1:9100 即可在本機測試伺服器端出單。
+
+也可在其他工具內使用：
+    emu = PrinterEmulator().start()      # port=0 會自動選一個空的埠，見 emu.port
+    ...
+    emu.jobs                             # [bytes, ...] 已收到的單 (不含狀態查詢)
+    emu.stop()
+"""
+import os
+import re
+import sys
+import socket
+import argparse
+import threading
+
+DLE_EOT = b'\x10\x04'
+CUT = re.compile(rb'\x1dV(?:[\x00\x01\x30\x31]|[\x41\x42].)', re.S)  # GS V m / GS V m n
+STATUS_OK = 0x12   # 固定為 1 的位元 (bit 1、bit 4)
+
+
+class PrinterEmulator:
+    """單一埠的模擬印表機；paper_out / cover_open 可在執行中切換"""
+
+    def __init__(self, host='127.0.0.1', port=0, paper_out=False, cover_open=False, on_job=None):
+        self.host = host
+        self.port = port
+        self.paper_out = paper_out
+        self.cover_open = cover_open
+        self.on_job = on_job
+        self.jobs = []
+        self.stats = {'connections': 0, 'status_queries': 0, 'bytes': 0}
+        self._lock = threading.Lock()
+        self._server = None
+        self._conns = set()
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._server = socket.create_server((self.host, self.port))
+        self.port = self._server.getsockname()[1]
+        self._stopped.clear()
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self
+
+    def stop(self):
+        """關閉監聽與所有連線 (模擬印表機關機)"""
+        self._stopped.set()
+        if self._server is not None:
+            try:
+                self._server.shutdown(socket.SHUT_RDWR)  # 讓阻塞中的 accept() 返回
+            except OSError:
+                pass
+            self._server.close()
+        with self._lock:
+            conns = list(self._conns)
+        for c in conns:
+            try:
+                c.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            c.close()
+
+    def drop_connections(self):
+        """斷開目前的連線但繼續監聽 (模擬印表機重開機後客戶端的長連線失效)"""
+        with self._lock:
+            conns = list(self._conns)
+        for c in conns:
+            try:
+                c.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def status_byte(self, n):
+        if n == 1:
+            return STATUS_OK
+        if n == 2:
+            return STATUS_OK | (0x04 if self.cover_open else 0) | (0x20 if self.paper_out else 0)
+        if n == 4:
+            return STATUS_OK | (0x60 if self.paper_out else 0)
+        return STATUS_OK
+
+    def _accept_loop(self):
+        while not self._stopped.is_set():
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            with self._lock:
+                self._conns.add(conn)
+                self.stats['connections'] += 1
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        buf = b''
+        try:
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    break
+                buf += data
+                # 狀態查詢立即回應，不算進單據內容
+                while True:
+                    i = buf.find(DLE_EOT)
+                    if i < 0 or i + 2 >= len(buf):
+                        break
+                    n = buf[i + 2]
+                    buf = buf[:i] + buf[i + 3:]
+                    with self._lock:
+                        self.stats['status_queries'] += 1
+                    conn.sendall(bytes([self.status_byte(n)]))
+                # 以切紙指令切出完整的單
+                while True:
+                    m = CUT.search(buf)
+                    if not m:
+                        break
+                    job, buf = buf[:m.end()], buf[m.end():]
+                    self._store(job)
+        except OSError:
+            pass
+        finally:
+            if buf.strip(b'\x00'):
+                self._store(buf)
+            with self._lock:
+                self._conns.discard(conn)
+            conn.close()
+
+    def _store(self, job):
+        with self._lock:
+            self.jobs.append(job)
+            self.stats['bytes'] += len(job)
+        if self.on_job:
+            self.on_job(self, job)
+
+
+def preview_text(job, encoding='big5-hkscs'):
+    """粗略去掉控制指令，只留下可讀文字 (除錯用)"""
+    text = re.sub(rb'\x1b[@]|\x1b[Ea!t-]\S|\x1d!.|\x1dV(?:[\x41\x42].|.)|\x1c&|\x1b\x74.', b'', job, flags=re.S)
+    return text.decode(encoding, 'replace')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="網路印表機模擬器 (RAW TCP 9100)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--out', default=None, help="收到的單存檔目錄 (預設不存檔)")
+    parser.add_argument('--paper-out', action='store_true', help="回報缺紙")
+    parser.add_argument('--cover-open', action='store_true', help="回報上蓋未關")
+    parser.add_argument('--preview', action='store_true', help="印出每張單的文字內容")
+    args = parser.parse_args(argv)
+
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+
+    def on_job(emu, job):
+        seq = len(emu.jobs)
+        print(f"🧾 #{seq} 收到 {len(job)} bytes (連線 {emu.stats['connections']} 次、狀態查詢 {emu.stats['status_queries']} 次)")
+        if args.out:
+            with open(os.path.join(args.out, f"{emu.port}_{seq:04d}.bin"), 'wb') as f:
+                f.write(job)
+        if args.preview:
+            print(preview_text(job))
+
+    emu = PrinterEmulator(args.host, args.port, args.paper_out, args.cover_open, on_job).start()
+    print(f"🖨️ 模擬印表機監聽 {args.host}:{emu.port} (Ctrl+C 結束)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        emu.stop()
+        print(f"\n共收到 {len(emu.jobs)} 張單")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
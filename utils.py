@@ -6,7 +6,14 @@ import time
 import ssl
 import traceback
 from datetime import datetime, timedelta
-from database import get_db_connection
+from database import get_db_connection, db_connection, get_pool_stats
+from settings_cache import get_settings
+from business_day import tw_now, day_range, range_sql
+import order_partitions
+import print_spooler
+import network_printer
+import invoice_outbox
+import invoice_reconcile
 
 # === 🛡️ 引入 Flask 相關工具 ===
 from flask import session, redirect, url_for, request, jsonify, has_request_context
@@ -44,6 +51,17 @@ def role_required(*allowed_roles):
 # ==========================================
 # 1. Email 報告發送核心 (新增作廢明細版)
 # ==========================================
+def item_stats(cur, where_sql, params):
+    """品項銷量彙總 {品名: 數量}，直接由 order_items GROUP BY (orders 別名為 o)"""
+    cur.execute(f"""
+        SELECT oi.product_name, SUM(oi.qty)
+        FROM order_items oi
+        JOIN orders o ON o.id = oi.order_id
+        WHERE {where_sql}
+        GROUP BY oi.product_name
+    """, params)
+    return {r[0]: int(r[1]) for r in cur.fetchall()}
+
 def send_daily_report(app, manual_config=None, is_test=False, operator_name=None, operator_role=None):
     """
     發送日結報表。
@@ -71,8 +89,7 @@ def send_daily_report(app, manual_config=None, is_test=False, operator_name=None
             if manual_config:
                 config = manual_config
             else:
-                cur.execute("SELECT key, value FROM settings")
-                config = dict(cur.fetchall())
+                config = get_settings().as_dict()
 
             api_key = config.get('resend_api_key', '').strip()
             to_email = config.get('report_email', '').strip()
@@ -82,8 +99,7 @@ def send_daily_report(app, manual_config=None, is_test=False, operator_name=None
                 print("⚠️ Email 設定不完整，取消任務")
                 return "❌ 設定不完整"
 
-            tw_now = datetime.utcnow() + timedelta(hours=8)
-            today_str = tw_now.strftime('%Y-%m-%d')
+            today_str = tw_now().strftime('%Y-%m-%d')
 
             if is_test:
                 subject = f"【測試】Resend API 設定確認 ({today_str})"
@@ -96,44 +112,23 @@ def send_daily_report(app, manual_config=None, is_test=False, operator_name=None
                 )
             else:
                 # 時間過濾器
-                tw_start = tw_now.replace(hour=0, minute=0, second=0, microsecond=0)
-                utc_start = tw_start - timedelta(hours=8)
-                utc_end = utc_start + timedelta(hours=24)
-                time_filter = "created_at >= %s AND created_at < %s"
-                params = (utc_start, utc_end)
+                time_filter = range_sql('o.created_at')
+                params = day_range()
 
                 # --- 1. 有效訂單統計 ---
-                cur.execute(f"SELECT COUNT(*), SUM(total_price) FROM orders WHERE {time_filter} AND status != 'Cancelled'", params)
+                cur.execute(f"SELECT COUNT(*), SUM(total_price) FROM orders o WHERE {time_filter} AND o.status != 'Cancelled'", params)
                 v_res = cur.fetchone()
                 v_count, v_total = (v_res[0] or 0), (float(v_res[1] or 0))
 
-                cur.execute(f"SELECT content_json FROM orders WHERE {time_filter} AND status != 'Cancelled'", params)
-                v_stats = {}
-                for r in cur.fetchall():
-                    try:
-                        items = json.loads(r[0]) if isinstance(r[0], str) else r[0]
-                        if isinstance(items, dict): items = [items]
-                        for i in items:
-                            n = i.get('name_zh', i.get('name', '未知'))
-                            v_stats[n] = v_stats.get(n, 0) + int(i.get('qty', 0))
-                    except: continue
+                v_stats = item_stats(cur, f"{time_filter} AND o.status != 'Cancelled'", params)
                 v_text = "\n".join([f"• {k}: {v}" for k, v in sorted(v_stats.items(), key=lambda x:x[1], reverse=True)]) or "(無銷量)"
 
                 # --- 2. 作廢訂單統計 (新增明細邏輯) ---
-                cur.execute(f"SELECT COUNT(*), SUM(total_price) FROM orders WHERE {time_filter} AND status = 'Cancelled'", params)
+                cur.execute(f"SELECT COUNT(*), SUM(total_price) FROM orders o WHERE {time_filter} AND o.status = 'Cancelled'", params)
                 x_res = cur.fetchone()
                 x_count, x_total = (x_res[0] or 0), (float(x_res[1] or 0))
 
-                cur.execute(f"SELECT content_json FROM orders WHERE {time_filter} AND status = 'Cancelled'", params)
-                x_stats = {}
-                for r in cur.fetchall():
-                    try:
-                        items = json.loads(r[0]) if isinstance(r[0], str) else r[0]
-                        if isinstance(items, dict): items = [items]
-                        for i in items:
-                            n = i.get('name_zh', i.get('name', '未知'))
-                            x_stats[n] = x_stats.get(n, 0) + int(i.get('qty', 0))
-                    except: continue
+                x_stats = item_stats(cur, f"{time_filter} AND o.status = 'Cancelled'", params)
                 x_text = "\n".join([f"• {k}: {v}" for k, v in sorted(x_stats.items(), key=lambda x:x[1], reverse=True)]) or "(無作廢品項)"
 
                 # --- 3. 組合內容 ---
@@ -183,6 +178,7 @@ def run_maintenance_tasks(app):
     
     last_sent_time = ""
     next_ping_time = datetime.now()
+    last_partition_day = None
 
     while True:
         try:
@@ -205,22 +201,36 @@ def run_maintenance_tasks(app):
                 try:
                     urllib.request.urlopen("https://qr-mbdv.onrender.com", timeout=5)
                     print(f"[{now_str}] ✅ Web Ping 成功")
-                except Exception: 
+                except Exception as e:
                     print(f"[{now_str}] ⚠️ Web Ping 失敗: {e}")
                 
                 # 2. Ping Aiven 資料庫 (發送真實指令維持連線)
                 try:
-                    conn = get_db_connection()
-                    with conn.cursor() as cur:
-                        cur.execute("SELECT 1;") # Aiven 需要實際 Query 才能保活
-                        cur.fetchone()
-                    conn.close()
+                    with db_connection() as conn:
+                        with conn.cursor() as cur:
+                            cur.execute("SELECT 1;") # Aiven 需要實際 Query 才能保活
+                            cur.fetchone()
                     print(f"[{now_str}] 💓 Aiven DB Heartbeat 成功 (SELECT 1)")
+                    print(f"[{now_str}] 📊 連線池狀態: {get_pool_stats()}")
                 except Exception as e: 
                     print(f"[{now_str}] ⚠️ DB Heartbeat 失敗: {e}")
                 
                 next_ping_time = now_obj + timedelta(seconds=300)
 
+            # --- C. 訂單月份分割 (每天一次：建立未來月份、封存過期月份) 與清理舊的列印紀錄 ---
+            if tw_time.date() != last_partition_day:
+                try:
+                    with db_connection() as conn:
+                        order_partitions.maintenance(conn)
+                        cur = conn.cursor()
+                        purged = print_spooler.purge(cur)
+                        conn.commit()
+                        if purged:
+                            print(f"[{now_str}] 🧹 已清除 {purged} 筆舊列印紀錄")
+                    last_partition_day = tw_time.date()
+                except Exception as e:
+                    print(f"[{now_str}] ⚠️ 訂單分割維護失敗: {e}")
+
             time.sleep(30) # 縮短掃描間隔，確保不漏掉 target_times
         except Exception as e:
             print(f"⚠️ 背景任務主要迴圈錯誤: {e}")
@@ -229,6 +239,12 @@ def run_maintenance_tasks(app):
 def start_background_tasks(app):
     t = threading.Thread(target=run_maintenance_tasks, args=(app,), daemon=True)
     t.start()
+    # 網路印表機 (9100) 送印；沒有設定任何網路印表機時只會定期檢查設定
+    network_printer.start_worker()
+    # 電子發票佇列 (出餐時排入，背景呼叫綠界開立 / 作廢)
+    invoice_outbox.start_workers()
+    # 電子發票對帳 (定期以綠界的發票狀態核對並修正本地資料)
+    invoice_reconcile.start_worker()
 
 # ==========================================
 # 3. 👤 自動注入登入資訊 (Context Processor)